@@ -15,7 +15,18 @@ setting_modules = 'TMS.deployee_settings' if 'RENDER_EXTERNAL_HOSTNAME' in os.en
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', setting_modules)
 
 # Normal Django ASGI app
-application = get_asgi_application()
-
-
-
+django_asgi_app = get_asgi_application()
+
+# Imported after Django is set up: routing pulls in the models
+from channels.auth import AuthMiddlewareStack
+from channels.routing import ProtocolTypeRouter, URLRouter
+from TMSapp.buffers import lifespan
+from TMSapp.middleware import JWTAuthMiddleware
+from TMSapp.routing import websocket_urlpatterns
+
+application = ProtocolTypeRouter({
+    "http": django_asgi_app,
+    "websocket": AuthMiddlewareStack(JWTAuthMiddleware(URLRouter(websocket_urlpatterns))),
+    # Flushes the write-behind buffers (TMSapp/buffers.py) on shutdown
+    "lifespan": lifespan,
+})
@@ -64,6 +64,15 @@ CHANNEL_LAYERS = {
        
     },
 }
+
+# Several ASGI workers need a shared layer: start the shards with
+# `python manage.py runbroker` and list their Unix sockets here.
+CHANNEL_BROKER_SOCKETS = [path for path in os.getenv("CHANNEL_BROKER_SOCKETS", "").split(",") if path]
+if CHANNEL_BROKER_SOCKETS:
+    CHANNEL_LAYERS["default"] = {
+        "BACKEND": "TMSapp.channel_layer.ShardedChannelLayer",
+        "CONFIG": {"shards": CHANNEL_BROKER_SOCKETS},
+    }
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap4"
 CRISPY_TEMPLATE_PACK = "bootstrap4"
 LOGIN_URL = '/login/'
@@ -111,9 +120,23 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file, not the default shared-cache in-memory database, so threaded
+        # tests see SQLite's normal locking (busy timeout) instead of
+        # "database table is locked" errors
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# One cache for every worker process: dashboard snapshots (TMSapp/dashboard.py;
+# its hit/miss counters stay per process) and the load-matching journal
+# (TMSapp/matching.py) are only correct if all workers see the same entries.
+# REDIS_URL selects Redis (needs the redis package); otherwise the database
+# table made by `manage.py createcachetable` (run by build.sh).
+if os.getenv("REDIS_URL"):
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": os.environ["REDIS_URL"]}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "tms_cache"}}
+
 
 
 
@@ -161,7 +184,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'TMSapp.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -186,3 +209,66 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")   
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD") 
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+
+# Offline geocoding of package pickup/drop locations (TMSapp/geo.py)
+GEOCODER_BACKEND = "TMSapp.geo.GazetteerGeocoder"
+GEOCODER_GAZETTEER = BASE_DIR / "TMSapp" / "data" / "gazetteer.csv"
+
+# ChatConsumer persists messages through a write-behind buffer (TMSapp/buffers.py):
+# one bulk_create per max_batch messages or max_delay seconds
+CHAT_WRITE_BEHIND = {"max_batch": 50, "max_delay": 0.1}
+
+# TrackingConsumer writes GPS history the same way, in larger batches
+TRACKING_WRITE_BEHIND = {"max_batch": 500, "max_delay": 0.5}
+
+# Douglas-Peucker tolerance (metres) applied when compact_tracks rolls raw
+# fixes into TrackSegment rows
+TRACK_COMPACT_TOLERANCE_M = 3.0
+
+# Invoice PDFs are rendered and emailed by `manage.py runjobs` (TMSapp/jobs.py);
+# failed attempts retry after backoff * 2**(attempt - 1) seconds
+INVOICE_JOBS = {"max_attempts": 5, "backoff": 30, "max_backoff": 3600, "lock_timeout": 300, "poll_interval": 1.0}
+
+# Rendered invoice PDFs, keyed by a digest of their printed fields (TMSapp/pdf_cache.py)
+INVOICE_PDF_CACHE_DIR = BASE_DIR / "cache" / "invoices"
+
+# ws/notifications/ (TMSapp/notifications.py): events reaching a socket within
+# `window` seconds go out as one frame; a reconnect replays at most
+# `replay_limit` missed events before asking the client to resync;
+# `manage.py prune_notifications` deletes events older than `retention_days`
+NOTIFICATIONS = {"window": 0.25, "replay_limit": 500, "retention_days": 30}
+
+# CachedJWTAuthentication (TMSapp/authentication.py) keeps up to max_size user
+# rows per process; a role change or deactivation made in another process is
+# seen after at most ttl seconds
+JWT_USER_CACHE = {"max_size": 10000, "ttl": 60}
+
+# Package photos (TMSapp/thumbnails.py): normalized to WebP no larger than
+# max_side, with a thumbnail per width in sizes, by a pool of `workers`
+# threads after the upload commits
+PACKAGE_IMAGES = {"sizes": [160, 480, 1200], "max_side": 2048, "quality": 80, "workers": 2}
+
+# Load matching (TMSapp/matching.py): score weights, the distance (km) at which
+# proximity halves, the price per kg scoring 0.5, suggestions per vehicle, and
+# how often each process rebuilds its open-package arrays from scratch (seconds)
+MATCHING = {
+    "weights": {"fit": 0.4, "proximity": 0.4, "price": 0.2},
+    "proximity_km": 50.0, "price_reference": 5.0, "top_k": 5, "max_top_k": 50, "rebuild_every": 300,
+}
+
+# Consolidation planner (TMSapp/consolidation.py): packages whose pickup and drop
+# geohashes share corridor_precision characters may share a load; plans over
+# more than parallel_threshold packages are packed by a pool of `workers` processes
+CONSOLIDATION = {"corridor_precision": 4, "min_packages": 2, "max_loads": 20, "parallel_threshold": 20000, "workers": 4}
+
+# Package full-text search (TMSapp/search.py): only the newest rank_window
+# matches of a query are ranked, which bounds the cost of very common words
+PACKAGE_SEARCH = {"rank_window": 10000}
+
+# Bulk exports (TMSapp/export.py): rows are read from one cursor and written
+# to the streamed response chunk_size at a time
+EXPORT = {"chunk_size": 2000}
+
+# Invoice statements (TMSapp/statements.py): missing invoice PDFs are drawn
+# by one process pool per web process of at most `workers` processes
+STATEMENTS = {"workers": 4}
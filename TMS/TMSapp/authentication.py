@@ -0,0 +1,129 @@
+"""
+JWT authentication without a user SELECT per request.
+
+simplejwt's JWTAuthentication loads the User row on every request.
+CachedJWTAuthentication keeps recently seen rows in a bounded, per-process
+TTL/LRU cache. On a hit it builds the request user from the cached values
+with User.from_db(), so views still get a real model instance: it works in
+FK assignments and comparisons. The password is left deferred, so a save()
+on it can never blank the hash.
+
+Tokens carry the user's token_version in the "ver" claim. The version is
+bumped whenever a user is deactivated or changes role (see signals.py).
+A token whose version differs from the row is rejected, which revokes
+every token issued before the change. A cached row older than the token
+is reloaded. Saves in this process evict the user's entry immediately.
+Other processes see a change once their entry expires, after at most
+JWT_USER_CACHE["ttl"] seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+VERSION_CLAIM = "ver"
+DEFAULTS = {"max_size": 10_000, "ttl": 60}
+
+# Everything but the password hash
+FIELDS = [field.attname for field in User._meta.concrete_fields if field.attname != "password"]
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "JWT_USER_CACHE", {})}
+
+
+class UserRowCache:
+    """Thread-safe LRU of user rows (tuples of FIELDS values) with a time-to-live"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.rows = OrderedDict()   # user id -> (expires, values)
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.rows.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.rows[user_id]
+                return None
+            self.rows.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, values):
+        with self.lock:
+            self.rows[user_id] = (time.monotonic() + self.ttl, values)
+            self.rows.move_to_end(user_id)
+            while len(self.rows) > self.max_size:
+                self.rows.popitem(last=False)
+
+    def evict(self, *user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                self.rows.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.rows.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def user_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = UserRowCache(**config())
+    return _cache
+
+
+def load_row(user_id):
+    return User.objects.filter(pk=user_id).values_list(*FIELDS).first()
+
+
+def user_from_row(values):
+    return User.from_db(DEFAULT_DB_ALIAS, FIELDS, values)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """Drop-in JWTAuthentication that serves users from user_cache()"""
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Compares against the password hash, which the cache leaves out
+            return super().get_user(validated_token)
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        version = validated_token.get(VERSION_CLAIM, 0)
+
+        cache = user_cache()
+        values = cache.get(user_id)
+        user = user_from_row(values) if values is not None else None
+        if user is None or user.token_version < version:
+            values = load_row(user_id)
+            if values is None:
+                cache.evict(user_id)
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.put(user_id, values)
+            user = user_from_row(values)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if user.token_version != version:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+        return user
@@ -0,0 +1,218 @@
+"""
+Package and offer state machine.
+
+Package: Available / Negotiating -> Booked -> Loaded -> Delivered
+Offer:   pending -> accepted | rejected, and a counter-offer on a rejected
+         offer reopens it as pending; accepted is final.
+
+Every transition is a conditional UPDATE ... WHERE status IN (<allowed
+sources>), so of several concurrent requests exactly one sees a row
+count of 1 and wins; the others get TransitionConflict (HTTP 409). Steps
+that touch several rows run in one transaction, so a lost race on any of
+them rolls back the rest.
+
+Transitions that only need the id (book, mark_loaded, reject, counter)
+go straight to the UPDATE, with the permission check folded into its
+WHERE clause, and touch only the columns they change. The row is read
+only when the UPDATE matched nothing, to tell 404, 403 and 409 apart.
+They return the new state instead of the caller re-reading it.
+
+QuerySet.update() does not send post_save, so callers here invalidate the
+dashboard snapshot themselves, and move_package() journals the package for
+load matching (matching.py). Offer writes are logged and folded into the
+package's offer summary through negotiation.py in the same transaction;
+the users on the other side hear about it through notifications.py once
+it commits.
+"""
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, PermissionDenied
+
+from . import dashboard, matching, negotiation, notifications
+from .models import Offer, OfferRevision, Package
+
+OPEN = ("Available", "Negotiating")
+
+# target status -> statuses it may be reached from
+PACKAGE_TRANSITIONS = {
+    "Booked": OPEN,
+    "Loaded": ("Booked",),
+    "Delivered": ("Loaded",),
+}
+
+
+class TransitionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The package or offer changed state; reload and try again."
+    default_code = "conflict"
+
+
+def move_package(package_id, to, where=None, **fields):
+    """
+    Conditionally move a package to `to`; returns True if this call did it.
+    `where` adds lookups the row must still match (e.g. booked_by=None), as
+    a dict or a Q.
+    """
+    rows = Package.objects.filter(id=package_id, status__in=PACKAGE_TRANSITIONS[to])
+    rows = rows.filter(where) if isinstance(where, Q) else rows.filter(**(where or {}))
+    if rows.update(status=to, **fields) != 1:
+        return False
+    matching.touch(package_id)
+    return True
+
+
+def ensure_open(package):
+    """Offers can only be made on packages nobody has booked yet"""
+    if package.status not in OPEN or package.booked_by_id is not None:
+        raise TransitionConflict("This package is no longer open for offers.")
+
+
+def _reject_rivals(package_id, user, winner_id=None):
+    """Reject the package's other pending offers; call inside a transaction"""
+    rivals = Offer.objects.filter(package_id=package_id, status="pending")
+    if winner_id is not None:
+        rivals = rivals.exclude(id=winner_id)
+    # Locked on databases that support it, so the log matches what the UPDATE rejects
+    ids = list(rivals.select_for_update().values_list("id", flat=True))
+    if not ids:
+        return 0
+    rejected = rivals.filter(id__in=ids).update(status="rejected", changed_by_owner=False, updated_at=timezone.now())
+    negotiation.log(ids, OfferRevision.REJECTED, "rejected", user)
+    return rejected
+
+
+def accept_offer(offer, user):
+    """
+    Owner accepts: the offer becomes accepted, the package Booked by its
+    sender at the offered price and every other pending offer rejected.
+    Returns how many rival offers were rejected.
+    """
+    if offer.receiver_id != user.id and offer.package.user_id != user.id:
+        raise PermissionDenied("Only the package owner can accept an offer.")
+    with transaction.atomic():
+        accepted = Offer.objects.filter(id=offer.id, status="pending").update(
+            status="accepted", changed_by_owner=False, updated_at=timezone.now(),
+        )
+        booked = accepted and move_package(
+            offer.package_id, "Booked", where={"booked_by": None},
+            booked_by_id=offer.sender_id, price_expectation=offer.offer_price,
+        )
+        if not booked:
+            raise TransitionConflict("This offer is no longer pending or the package is already booked.")
+        negotiation.log([offer.id], OfferRevision.ACCEPTED, "accepted", user, offer.offer_price)
+        rejected = _reject_rivals(offer.package_id, user, offer.id)
+        negotiation.offers_changed(package_ids=[offer.package_id])
+        notifications.package_changed(
+            offer.package_id, "Booked", user, offer.package.user_id, offer.sender_id,
+        )
+    dashboard.invalidate(offer.package.user_id)
+    return rejected
+
+
+def _offer_failure(offer_id, user, conflict):
+    """A conditional offer UPDATE matched nothing: 404 if the user cannot see the offer, else 409"""
+    if not Offer.objects.filter(Q(sender_id=user.id) | Q(receiver_id=user.id), id=offer_id).exists():
+        raise NotFound()
+    raise TransitionConflict(conflict)
+
+
+def _invalidate_offer_owner(offer_id):
+    dashboard.invalidate(Offer.objects.filter(id=offer_id).values_list("package__user_id", flat=True).first())
+
+
+def reject_offer(offer_id, user):
+    """Owner rejects a pending offer; one UPDATE, no prior SELECT. Returns the new state."""
+    with transaction.atomic():
+        rejected = Offer.objects.filter(
+            Q(receiver_id=user.id) | Q(package__user_id=user.id), id=offer_id, status="pending",
+        ).update(status="rejected", changed_by_owner=False, updated_at=timezone.now())
+        if not rejected:
+            if Offer.objects.filter(id=offer_id, sender_id=user.id).exclude(receiver_id=user.id).exists():
+                raise PermissionDenied("Only the package owner can reject an offer.")
+            _offer_failure(offer_id, user, "Only pending offers can be rejected.")
+        negotiation.log([offer_id], OfferRevision.REJECTED, "rejected", user)
+        negotiation.offers_changed(offer_ids=[offer_id])
+    _invalidate_offer_owner(offer_id)
+    return {"id": offer_id, "status": "rejected"}
+
+
+def counter_offer(offer_id, user, price):
+    """
+    New price from either side; reopens a rejected offer while the package
+    is open. One UPDATE, no prior SELECT. Returns the new state.
+    """
+    owner_countered = Case(When(receiver_id=user.id, then=Value(True)), default=Value(False))
+    with transaction.atomic():
+        updated = Offer.objects.filter(
+            Q(sender_id=user.id) | Q(receiver_id=user.id),
+            id=offer_id, status__in=("pending", "rejected"), package__status__in=OPEN,
+        ).update(
+            offer_price=price, status="pending", changed_by_owner=owner_countered,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            _offer_failure(offer_id, user, "This offer can no longer be countered.")
+        negotiation.log([offer_id], OfferRevision.COUNTERED, "pending", user, price)
+        negotiation.offers_changed(offer_ids=[offer_id])
+    _invalidate_offer_owner(offer_id)
+    return {"id": offer_id, "status": "pending", "offer_price": price}
+
+
+def finalize_offer(offer, user):
+    """
+    Transporter confirms an accepted offer. accept_offer() already books the
+    package, so this succeeds only if the package is (still) booked to them.
+    """
+    if offer.sender_id != user.id:
+        raise PermissionDenied("Only the transporter who made the offer can finalize it.")
+    if offer.status != "accepted":
+        raise TransitionConflict("Only accepted offers can be booked.")
+    if not Package.objects.filter(id=offer.package_id, status="Booked", booked_by_id=user.id).exists():
+        raise TransitionConflict("This package is booked by someone else.")
+
+
+def _package_failure(package_id, conflict):
+    if not Package.objects.filter(id=package_id).exists():
+        raise NotFound()
+    raise TransitionConflict(conflict)
+
+
+def _package_moved(package_id, status, user):
+    """Drop the owner's dashboard and notify the other side of the package"""
+    owner_id, transporter_id = Package.objects.filter(id=package_id).values_list(
+        "user_id", "booked_by_id",
+    ).first() or (None, None)
+    dashboard.invalidate(owner_id)
+    notifications.package_changed(package_id, status, user, owner_id, transporter_id)
+
+
+def book_package(package_id, user):
+    """
+    A transporter books an open package at its listed price; pending offers
+    are rejected. Owners cannot book their own packages, and users who are
+    not transporters see no package to book (404). Returns the new state.
+    """
+    if not getattr(user, "is_transporter", False):
+        raise NotFound()
+    with transaction.atomic():
+        where = Q(booked_by=None) & ~Q(user_id=user.id)
+        if not move_package(package_id, "Booked", where=where, booked_by_id=user.id):
+            if Package.objects.filter(id=package_id, user_id=user.id).exists():
+                raise PermissionDenied("You cannot book your own package.")
+            _package_failure(package_id, "This package is already booked.")
+        if _reject_rivals(package_id, user):
+            negotiation.offers_changed(package_ids=[package_id])
+    _package_moved(package_id, "Booked", user)
+    return {"id": package_id, "status": "Booked", "booked_by": user.id}
+
+
+def mark_loaded(package_id, user):
+    """Booked -> Loaded, only by the transporter it is booked to. Returns the new state."""
+    if not move_package(package_id, "Loaded", where={"booked_by_id": user.id}):
+        if Package.objects.filter(id=package_id).exclude(booked_by_id=user.id).exists():
+            raise PermissionDenied("You are not allowed to mark this package as loaded.")
+        _package_failure(package_id, "Only booked packages can be marked as loaded.")
+    _package_moved(package_id, "Loaded", user)
+    return {"id": package_id, "status": "Loaded"}
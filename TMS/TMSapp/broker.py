@@ -0,0 +1,234 @@
+"""
+Local message broker used by ShardedChannelLayer (see channel_layer.py).
+
+It is a small stand-in for Redis: one asyncio process per shard, listening
+on a Unix socket, holding per-channel message queues and group membership in
+memory. It has no dependencies beyond the standard library, so several ASGI
+workers can share a channel layer on one machine without external services.
+
+    python -m TMSapp.broker /tmp/tms-broker-0.sock
+
+Wire format: every frame is a 4-byte big-endian length followed by a JSON
+object. Requests carry an "op"; each gets exactly one reply frame.
+"""
+import asyncio
+import json
+import os
+import struct
+import sys
+import time
+from collections import deque
+
+HEADER = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(HEADER.size)
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame of {length} bytes exceeds limit")
+    return json.loads(await reader.readexactly(length))
+
+
+def encode_frame(payload):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(len(body)) + body
+
+
+def routing_key(channel):
+    """Process-specific channels ("prefix!local") share one queue per prefix"""
+    if "!" in channel:
+        return channel[:channel.index("!") + 1]
+    return channel
+
+
+class Broker:
+    def __init__(self, capacity=100, expiry=60):
+        self.capacity = capacity
+        self.expiry = expiry
+        self.queues = {}    # routing key -> deque[(expires_at, channel, message)]
+        self.pending = {}   # channel -> queued message count, for per-channel capacity
+        self.waiters = {}   # routing key -> deque[Future]
+        self.groups = {}    # group -> {channel: expires_at}
+
+    # -------------------
+    # QUEUES
+    # -------------------
+    def _take(self, queue):
+        _, channel, message = queue.popleft()
+        left = self.pending[channel] - 1
+        if left:
+            self.pending[channel] = left
+        else:
+            del self.pending[channel]
+        return channel, message
+
+    def _drop_expired(self, queue):
+        now = time.monotonic()
+        while queue and queue[0][0] < now:
+            self._take(queue)
+
+    def push(self, channel, message, requeue=False):
+        key = routing_key(channel)
+        waiters = self.waiters.get(key)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result((channel, message))
+                return True
+
+        queue = self.queues.setdefault(key, deque())
+        self._drop_expired(queue)
+        entry = (time.monotonic() + self.expiry, channel, message)
+        if requeue:
+            # Handed to a receiver that went away; it goes back in front
+            queue.appendleft(entry)
+        elif self.pending.get(channel, 0) >= self.capacity:
+            return False
+        else:
+            queue.append(entry)
+        self.pending[channel] = self.pending.get(channel, 0) + 1
+        return True
+
+    async def pop(self, key, timeout, limit=1):
+        """Wait up to timeout for messages on a routing key; returns up to limit of them"""
+        queue = self.queues.get(key)
+        if queue:
+            self._drop_expired(queue)
+            if queue:
+                return [self._take(queue) for _ in range(min(limit, len(queue)))]
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(key, deque()).append(waiter)
+        try:
+            return [await asyncio.wait_for(waiter, timeout)]
+        except asyncio.TimeoutError:
+            return []
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.push(*waiter.result(), requeue=True)
+            raise
+        finally:
+            waiters = self.waiters.get(key)
+            if waiters is not None:
+                try:
+                    waiters.remove(waiter)
+                except ValueError:
+                    pass
+                if not waiters:
+                    del self.waiters[key]
+
+    # -------------------
+    # OPERATIONS
+    # -------------------
+    async def handle(self, request):
+        op = request.get("op")
+        if op == "send":
+            return {"ok": self.push(request["channel"], request["message"])}
+        if op == "send_many":
+            full = [channel for channel, message in request["messages"] if not self.push(channel, message)]
+            return {"ok": True, "full": full}
+        if op == "receive":
+            hits = await self.pop(request["key"], request.get("timeout", 5), request.get("limit", 1))
+            return {"ok": True, "messages": [list(hit) for hit in hits]}
+        if op == "group_add":
+            expires = time.monotonic() + request.get("expiry", 86400)
+            self.groups.setdefault(request["group"], {})[request["channel"]] = expires
+            return {"ok": True}
+        if op == "group_discard":
+            members = self.groups.get(request["group"])
+            if members is not None:
+                members.pop(request["channel"], None)
+                if not members:
+                    del self.groups[request["group"]]
+            return {"ok": True}
+        if op == "group_members":
+            return {"ok": True, "channels": self.members(request["group"])}
+        if op == "flush":
+            self.queues.clear()
+            self.pending.clear()
+            self.groups.clear()
+            return {"ok": True}
+        return {"ok": False, "error": f"unknown op {op!r}"}
+
+    def members(self, group):
+        members = self.groups.get(group)
+        if not members:
+            return []
+        now = time.monotonic()
+        expired = [channel for channel, expires in members.items() if expires < now]
+        for channel in expired:
+            del members[channel]
+        return list(members)
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                request = await read_frame(reader)
+                if request.get("op") == "receive":
+                    reply = await self.receive_unless_closed(reader, request)
+                    if reply is None:
+                        break
+                else:
+                    reply = await self.handle(request)
+                writer.write(encode_frame(reply))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def receive_unless_closed(self, reader, request):
+        """
+        Answer a receive, or None if the client hangs up while it waits.
+
+        A client that cancels receive() closes its connection; without this
+        its waiter would stay registered and swallow the next message.
+        Clients wait for each reply, so nothing is read here but the EOF.
+        """
+        task = asyncio.ensure_future(self.handle(request))
+        closed = asyncio.ensure_future(reader.read(1))
+        try:
+            await asyncio.wait((task, closed), return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            closed.cancel()
+            # Let the read unwind before the next read_frame() on this reader
+            await asyncio.wait((closed,))
+        if closed.cancelled():
+            return await task
+        task.cancel()
+        try:
+            reply = await task
+        except asyncio.CancelledError:
+            return None
+        # Messages taken in the same moment go back for the next receiver
+        for channel, message in reversed(reply["messages"]):
+            self.push(channel, message, requeue=True)
+        return None
+
+
+async def serve(path, **options):
+    if os.path.exists(path):
+        os.unlink(path)
+    broker = Broker(**options)
+    server = await asyncio.start_unix_server(broker.serve_client, path=path)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        sys.exit("usage: python -m TMSapp.broker <socket path>")
+    try:
+        asyncio.run(serve(argv[0]))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import weakref
+
+from channels.db import database_sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Collects unsaved model instances and writes them with one bulk_create.
+
+    A batch is flushed when it reaches max_batch rows or max_delay seconds
+    after its first row, whichever comes first. add() returns a future that
+    resolves to the saved instance (with its primary key) once the batch
+    holding it has been written, so callers can acknowledge asynchronously
+    instead of waiting on a database round trip per row.
+
+    after_write, if given, is called with the saved instances in the same
+    database thread right after each bulk_create.
+
+    Consumers flush the buffer when their socket closes, and lifespan()
+    flushes every buffer of the worker when the server shuts down, so rows
+    queued in the last max_delay seconds are not lost.
+    """
+
+    def __init__(self, model, max_batch=50, max_delay=0.1, after_write=None):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.after_write = after_write
+        self.pending = []   # [(instance, future)]
+        self.timer = None
+        self.flushing = set()
+
+    def add(self, instance, track=True):
+        """Queue an instance; with track=False no future is created or returned"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future() if track else None
+        self.pending.append((instance, future))
+        if len(self.pending) >= self.max_batch:
+            self._start_flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_delay, self._start_flush)
+        return future
+
+    def _start_flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        task = asyncio.get_running_loop().create_task(self._write(batch))
+        self.flushing.add(task)
+        task.add_done_callback(self.flushing.discard)
+
+    async def _write(self, batch):
+        instances = [instance for instance, _ in batch]
+        try:
+            saved = await database_sync_to_async(self._bulk_create)(instances)
+        except Exception as exc:
+            logger.exception("Write-behind flush of %d %s rows failed", len(batch), self.model.__name__)
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(exc)
+            return
+        for instance, (_, future) in zip(saved, batch):
+            if future is not None and not future.done():
+                future.set_result(instance)
+
+    def _bulk_create(self, instances):
+        saved = self.model.objects.bulk_create(instances)
+        if self.after_write is not None:
+            self.after_write(saved)
+        return saved
+
+    async def flush(self):
+        """Write everything queued so far and wait for it"""
+        self._start_flush()
+        if self.flushing:
+            await asyncio.gather(*self.flushing, return_exceptions=True)
+
+
+_buffers = weakref.WeakKeyDictionary()
+
+
+def get_buffer(name, model, **options):
+    """One buffer per name and event loop (an ASGI worker runs a single loop)"""
+    per_loop = _buffers.setdefault(asyncio.get_running_loop(), {})
+    buffer = per_loop.get(name)
+    if buffer is None:
+        buffer = per_loop[name] = WriteBehindBuffer(model, **options)
+    return buffer
+
+
+async def flush_all():
+    """Write what every buffer of the running event loop still holds"""
+    for buffer in list(_buffers.get(asyncio.get_running_loop(), {}).values()):
+        await buffer.flush()
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan protocol (TMS/asgi.py): flush_all() on shutdown"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            try:
+                await flush_all()
+            finally:
+                await send({"type": "lifespan.shutdown.complete"})
+            return
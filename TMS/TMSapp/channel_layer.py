@@ -0,0 +1,204 @@
+import asyncio
+import uuid
+import weakref
+import zlib
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+from .broker import encode_frame, read_frame, routing_key
+
+# Messages fetched per round trip by a process's specific-channel reader
+RECEIVE_BATCH = 500
+
+
+class BrokerConnection:
+    """One request/response connection to a broker shard"""
+
+    def __init__(self, path):
+        self.path = path
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()
+
+    async def request(self, payload):
+        async with self.lock:
+            if self.writer is None or self.writer.is_closing():
+                self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+            try:
+                self.writer.write(encode_frame(payload))
+                await self.writer.drain()
+                reply = await read_frame(self.reader)
+            except BaseException:
+                # Cancelled or failed between the request and its reply: the
+                # reply may still arrive, and the next caller would read it as
+                # its own. Drop the connection so the next request starts clean.
+                self.close()
+                raise
+        if not reply.get("ok") and "error" in reply:
+            raise RuntimeError(f"Broker {self.path}: {reply['error']}")
+        return reply
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class ShardedChannelLayer(BaseChannelLayer):
+    """
+    Cross-process channel layer over the local broker shards in broker.py.
+
+    Channels are sharded by routing key (all process-specific channels of one
+    layer instance live on a single shard, read by one background task),
+    groups by group name. group_send looks up the members on the group's
+    shard, then delivers with one batched send per destination shard.
+
+    CHANNEL_LAYERS = {"default": {
+        "BACKEND": "TMSapp.channel_layer.ShardedChannelLayer",
+        "CONFIG": {"shards": ["/tmp/tms-broker-0.sock", "/tmp/tms-broker-1.sock"]},
+    }}
+    """
+    extensions = ["groups", "flush"]
+
+    def __init__(self, shards, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        if not shards:
+            raise ValueError("ShardedChannelLayer needs at least one broker shard")
+        self.shards = list(shards)
+        self.group_expiry = group_expiry
+        self.client_prefix = f"specific.{uuid.uuid4().hex}"
+        # Connections and reader tasks are bound to the event loop that made them
+        self._loops = weakref.WeakKeyDictionary()
+
+    # -------------------
+    # SHARDING
+    # -------------------
+    def shard_for(self, key):
+        return self.shards[zlib.crc32(key.encode("utf-8")) % len(self.shards)]
+
+    def _state(self):
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = self._loops[loop] = {
+                "connections": {},
+                "buffers": {},
+                "reader": None,
+            }
+        return state
+
+    def _connection(self, path, purpose="request"):
+        connections = self._state()["connections"]
+        conn = connections.get((path, purpose))
+        if conn is None:
+            conn = connections[(path, purpose)] = BrokerConnection(path)
+        return conn
+
+    # -------------------
+    # CHANNELS
+    # -------------------
+    async def new_channel(self, prefix="specific"):
+        channel = f"{self.client_prefix}!{uuid.uuid4().hex}"
+        self._state()["buffers"][channel] = asyncio.Queue()
+        return channel
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.require_valid_channel_name(channel)
+        reply = await self._connection(self.shard_for(routing_key(channel))).request(
+            {"op": "send", "channel": channel, "message": message}
+        )
+        if not reply["ok"]:
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        assert self.require_valid_channel_name(channel)
+        if "!" not in channel:
+            return await self._receive_direct(channel)
+
+        buffers = self._state()["buffers"]
+        queue = buffers.setdefault(channel, asyncio.Queue())
+        self._ensure_reader()
+        try:
+            return await queue.get()
+        except asyncio.CancelledError:
+            # The consumer went away; anything still buffered has no reader
+            buffers.pop(channel, None)
+            raise
+
+    async def _receive_direct(self, channel):
+        conn = self._connection(self.shard_for(channel), purpose=f"receive:{channel}")
+        while True:
+            reply = await conn.request({"op": "receive", "key": channel, "timeout": 5})
+            if reply["messages"]:
+                return reply["messages"][0][1]
+
+    def _ensure_reader(self):
+        state = self._state()
+        if state["reader"] is None or state["reader"].done():
+            state["reader"] = asyncio.get_running_loop().create_task(self._read_specific(state))
+
+    async def _read_specific(self, state):
+        """Pull every message for this process and hand it to the waiting receive()"""
+        key = f"{self.client_prefix}!"
+        conn = self._connection(self.shard_for(key), purpose="receive:specific")
+        while True:
+            reply = await conn.request(
+                {"op": "receive", "key": key, "timeout": 5, "limit": RECEIVE_BATCH}
+            )
+            for channel, message in reply["messages"]:
+                # Channels are registered by new_channel() and forgotten when
+                # their receiver is cancelled: late messages for them are dropped
+                queue = state["buffers"].get(channel)
+                if queue is not None:
+                    queue.put_nowait(message)
+
+    # -------------------
+    # GROUPS
+    # -------------------
+    async def group_add(self, group, channel):
+        assert self.require_valid_group_name(group), "Group name not valid"
+        assert self.require_valid_channel_name(channel), "Channel name not valid"
+        await self._connection(self.shard_for(group)).request(
+            {"op": "group_add", "group": group, "channel": channel, "expiry": self.group_expiry}
+        )
+
+    async def group_discard(self, group, channel):
+        assert self.require_valid_group_name(group), "Group name not valid"
+        assert self.require_valid_channel_name(channel), "Channel name not valid"
+        await self._connection(self.shard_for(group)).request(
+            {"op": "group_discard", "group": group, "channel": channel}
+        )
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.require_valid_group_name(group), "Group name not valid"
+        reply = await self._connection(self.shard_for(group)).request(
+            {"op": "group_members", "group": group}
+        )
+        by_shard = {}
+        for channel in reply["channels"]:
+            by_shard.setdefault(self.shard_for(routing_key(channel)), []).append([channel, message])
+        # Full channels are dropped silently, as in the other channel layers
+        await asyncio.gather(*(
+            self._connection(path).request({"op": "send_many", "messages": batch})
+            for path, batch in by_shard.items()
+        ))
+
+    # -------------------
+    # FLUSH
+    # -------------------
+    async def flush(self):
+        await asyncio.gather(*(
+            self._connection(path).request({"op": "flush"}) for path in self.shards
+        ))
+
+    async def close(self):
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state is None:
+            return
+        if state["reader"] is not None:
+            state["reader"].cancel()
+        for conn in state["connections"].values():
+            conn.close()
@@ -0,0 +1,65 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import ChatRoom, Chat_Message
+
+
+def record_messages(messages):
+    """
+    Update the denormalized inbox state of each room for newly saved messages:
+    last_message moves forward and the other participant's unread counter
+    grows. One UPDATE per room touched, whatever the batch size.
+    """
+    by_room = {}
+    for message in messages:
+        if message.room_id is not None:
+            by_room.setdefault(message.room_id, []).append(message)
+    if not by_room:
+        return
+
+    rooms = ChatRoom.objects.only("id", "owner_id", "transporter_id").in_bulk(list(by_room))
+    for room_id, batch in by_room.items():
+        room = rooms.get(room_id)
+        if room is None:
+            continue
+        ChatRoom.objects.filter(id=room_id).update(
+            last_message_id=Greatest(Coalesce(F("last_message_id"), Value(0)), max(m.id for m in batch)),
+            owner_unread=F("owner_unread") + sum(m.sender_id != room.owner_id for m in batch),
+            transporter_unread=F("transporter_unread") + sum(m.sender_id != room.transporter_id for m in batch),
+        )
+
+
+def participant_role(room, user):
+    if room.owner_id == user.id:
+        return "owner"
+    if room.transporter_id == user.id:
+        return "transporter"
+    return None
+
+
+def mark_read(room, user, last_read_id):
+    """
+    Move the user's read marker forward and recount what is still unread,
+    in one UPDATE, so a message recorded between a separate count and write
+    cannot be lost from the counter
+    """
+    role = participant_role(room, user)
+    if role is None:
+        raise ValueError("User is not a participant of this room")
+
+    marker = Greatest(F(f"{role}_last_read_id"), Value(last_read_id))
+    unread = (
+        Chat_Message.objects.filter(
+            room=OuterRef("pk"), id__gt=Greatest(OuterRef(f"{role}_last_read_id"), Value(last_read_id)),
+        )
+        .exclude(sender=user).order_by().values("room").annotate(count=Count("id")).values("count")
+    )
+    rooms = ChatRoom.objects.filter(id=room.id)
+    rooms.update(**{
+        f"{role}_last_read_id": marker,
+        f"{role}_unread": Coalesce(Subquery(unread), Value(0)),
+    })
+    marker, unread = rooms.values_list(f"{role}_last_read_id", f"{role}_unread").get()
+    setattr(room, f"{role}_last_read_id", marker)
+    setattr(room, f"{role}_unread", unread)
+    return unread
@@ -0,0 +1,151 @@
+"""
+Multi-load consolidation: which open packages could share one vehicle trip.
+
+Packages are compatible when they travel the same corridor: their pickup
+geohashes share a prefix of CONSOLIDATION["corridor_precision"]
+characters, and so do their drop geohashes (precision 4 is a cell of
+roughly 40 x 20 km). Packages without geocoded locations are left out.
+
+Within a corridor, first-fit-decreasing packs the packages into loads no
+heavier than the vehicle's capacity. Packages are taken heaviest first,
+and each goes into the first load that still has room, or starts a new
+one. FFD is fast and never uses more than 11/9 OPT + 6/9 loads. The
+route constraint is a partition, so corridors are packed independently.
+When a plan covers more than `parallel_threshold` packages and the
+process may use more than one CPU, the corridors are spread over a
+process pool in chunks of similar size.
+
+A plan lists the fullest loads first. By default it only lists loads
+that actually combine packages (`min_packages`).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db.models.functions import Substr
+
+from .models import Package
+
+OPEN = ("Available", "Negotiating")
+DEFAULTS = {
+    "corridor_precision": 4,
+    "min_packages": 2,
+    "max_loads": 20,
+    "parallel_threshold": 20_000,
+    "workers": 4,
+}
+
+_executor = None
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "CONSOLIDATION", {})}
+
+
+def corridors(capacity_kg, precision, queryset=None):
+    """
+    {(pickup cell, drop cell): [(package id, weight), ...]} of open
+    packages that fit in capacity_kg
+    """
+    qs = Package.objects.all() if queryset is None else queryset
+    rows = qs.filter(
+        status__in=OPEN, weight__gt=0, weight__lte=capacity_kg,
+        pickup_geohash__isnull=False, drop_geohash__isnull=False,
+    ).annotate(
+        pickup_cell=Substr("pickup_geohash", 1, precision),
+        drop_cell=Substr("drop_geohash", 1, precision),
+    ).values_list("pickup_cell", "drop_cell", "id", "weight")
+
+    groups = {}
+    for pickup, drop, package_id, weight in rows.iterator(chunk_size=10_000):
+        groups.setdefault((pickup, drop), []).append((package_id, weight))
+    return groups
+
+
+def first_fit_decreasing(items, capacity):
+    """items: [(id, weight)] -> loads as (total weight, [ids])"""
+    if not items:
+        return []
+    lightest = min(weight for _, weight in items)
+    loads = []      # [remaining, total, ids]
+    full = []       # loads that cannot take even the lightest item, no longer scanned
+    for item_id, weight in sorted(items, key=lambda item: (-item[1], item[0])):
+        for i, load in enumerate(loads):
+            if load[0] >= weight:
+                load[0] -= weight
+                load[1] += weight
+                load[2].append(item_id)
+                if load[0] < lightest:
+                    full.append(loads.pop(i))
+                break
+        else:
+            load = [capacity - weight, weight, [item_id]]
+            (full if load[0] < lightest else loads).append(load)
+    return [(total, ids) for _, total, ids in full + loads]
+
+
+def pack_corridors(groups, capacity):
+    """[(corridor, items)] -> [(corridor, total weight, ids)]"""
+    return [
+        (corridor, total, ids)
+        for corridor, items in groups
+        for total, ids in first_fit_decreasing(items, capacity)
+    ]
+
+
+def _chunks(groups, count):
+    """Split corridors into `count` chunks of similar package counts, largest corridors first"""
+    chunks = [[] for _ in range(count)]
+    sizes = [0] * count
+    for corridor, items in sorted(groups.items(), key=lambda group: -len(group[1])):
+        smallest = sizes.index(min(sizes))
+        chunks[smallest].append((corridor, items))
+        sizes[smallest] += len(items)
+    return [chunk for chunk in chunks if chunk]
+
+
+def workers():
+    """Pool size: the configured workers, but no more than the CPUs this process may use"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, min(config()["workers"], cpus))
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers())
+    return _executor
+
+
+def pack(groups, capacity, parallel=None):
+    """
+    Pack every corridor; in the process pool when there are more than
+    parallel_threshold packages and more than one CPU (or when parallel=True)
+    """
+    cfg = config()
+    if parallel is None:
+        parallel = workers() > 1 and sum(len(items) for items in groups.values()) > cfg["parallel_threshold"]
+    if not parallel or len(groups) < 2:
+        return pack_corridors(groups.items(), capacity)
+    chunks = _chunks(groups, max(2, workers()))
+    return [load for packed in _pool().map(pack_corridors, chunks, [capacity] * len(chunks)) for load in packed]
+
+
+def plan(capacity_kg, queryset=None, min_packages=None, max_loads=None, parallel=None):
+    """
+    Loads for one vehicle of capacity_kg, fullest first:
+    [{"pickup_cell", "drop_cell", "weight", "utilization", "packages": [ids]}]
+    """
+    cfg = config()
+    min_packages = cfg["min_packages"] if min_packages is None else min_packages
+    max_loads = cfg["max_loads"] if max_loads is None else max_loads
+    groups = corridors(capacity_kg, cfg["corridor_precision"], queryset)
+    loads = [load for load in pack(groups, capacity_kg, parallel) if len(load[2]) >= min_packages]
+    loads.sort(key=lambda load: (-load[1], load[2][0]))
+    return [
+        {
+            "pickup_cell": pickup, "drop_cell": drop, "weight": round(total, 2),
+            "utilization": round(total / capacity_kg, 4), "packages": ids,
+        }
+        for (pickup, drop), total, ids in loads[:max_loads]
+    ]
@@ -1,80 +1,265 @@
+import asyncio
 import json
+import logging
+from urllib.parse import parse_qs
+
+from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
-from .models import Chat_Message, Tracking
+from rest_framework.exceptions import ValidationError
+from .models import Chat_Message, ChatRoom, Tracking, TrackingPoint
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
 from .models import Package, User
+from .buffers import get_buffer
+from .chat import record_messages
+from .notifications import coalesce, config as notification_config, latest_cursor, missed, notification_group
+from .tracking import parse_points, position_event, tracking_group, update_latest
+
+logger = logging.getLogger(__name__)
+
+
+def chat_buffer():
+    return get_buffer("chat", Chat_Message, after_write=record_messages, **settings.CHAT_WRITE_BEHIND)
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.package_id = self.scope['url_route']['kwargs']['package_id']
         self.partner_id = self.scope['url_route']['kwargs']['partner_id']
-        self.user_id = str(self.scope['user'].id)
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        self.user_id = str(user.id)
+
+        self.room_id = await self.resolve_room()
+        if self.room_id is None:
+            await self.close()
+            return
 
         # Always build room using BOTH user ids (order independent)
         ids = sorted([self.user_id, self.partner_id])
         self.room_group_name = f"chat_{self.package_id}_{ids[0]}_{ids[1]}"
+        self.pending_acks = set()
 
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
 
     async def disconnect(self, code):
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if hasattr(self, "room_group_name"):
+            # Write what this socket queued instead of waiting out max_delay
+            await chat_buffer().flush()
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
     async def receive(self, text_data):
         data = json.loads(text_data)
         message = data.get("message")
+        if not message:
+            return
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {"type": "chat.message", "message": message, "sender": self.scope["user"].username},
-        )
+        # Persisted in the background. Once the row has its id, the sender
+        # gets an ack and the room the message, with the id and timestamp
+        # that sync's last-seen cursor needs
+        saved = chat_buffer().add(Chat_Message(
+            room_id=self.room_id, sender_id=self.scope["user"].id, message=message,
+        ))
+        delivery = asyncio.get_running_loop().create_task(self.deliver(saved, data.get("client_id")))
+        self.pending_acks.add(delivery)
+        delivery.add_done_callback(self.pending_acks.discard)
 
     async def chat_message(self, event):
         await self.send(text_data=json.dumps({
+            "id": event["id"],
+            "timestamp": event["timestamp"],
             "message": event["message"],
-            "sender": event["sender"]
+            "sender": event["sender"],
         }))
 
+    async def deliver(self, saved, client_id):
+        try:
+            instance = await saved
+        except Exception:
+            await self.send_safely({"type": "error", "client_id": client_id, "error": "Message could not be saved."})
+            return
+        timestamp = instance.timestamp.isoformat()
+        await self.send_safely({"type": "ack", "client_id": client_id, "id": instance.id, "timestamp": timestamp})
+        await self.channel_layer.group_send(self.room_group_name, {
+            "type": "chat.message", "id": instance.id, "timestamp": timestamp,
+            "message": instance.message, "sender": self.scope["user"].username,
+        })
 
-# class TrackingConsumer(AsyncWebsocketConsumer):
-#     async def connect(self):
-#         self.package_id = self.scope["url_route"]["kwargs"]["package_id"]
-#         self.room_group_name = f"tracking_{self.package_id}"
+    async def send_safely(self, payload):
+        """Send unless the socket closed while the message was being written"""
+        try:
+            await self.send(text_data=json.dumps(payload))
+        except Exception:
+            logger.debug("Chat frame for a closed socket dropped", exc_info=True)
+
+    @database_sync_to_async
+    def resolve_room(self):
+        """Find or create the ChatRoom for this package and pair of users"""
+        package = Package.objects.filter(id=self.package_id).only("id", "user_id").first()
+        if package is None:
+            return None
+        user_id, partner_id = int(self.user_id), int(self.partner_id)
+        if package.user_id == user_id:
+            transporter_id = partner_id
+        elif package.user_id == partner_id:
+            transporter_id = user_id
+        else:
+            return None
+        room, _ = ChatRoom.objects.get_or_create(
+            package_id=package.id, owner_id=package.user_id, transporter_id=transporter_id,
+        )
+        return room.id
 
-#         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-#         await self.accept()
 
-#     async def disconnect(self, close_code):
-#         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+def tracking_buffer():
+    return get_buffer("tracking", TrackingPoint, after_write=update_latest, **settings.TRACKING_WRITE_BEHIND)
 
-#     async def receive(self, text_data):
-#         data = json.loads(text_data)
-#         latitude = data["latitude"]
-#         longitude = data["longitude"]
 
-#         await self.save_location(latitude, longitude)
+class TrackingConsumer(AsyncWebsocketConsumer):
+    """
+    Live positions of one package. The transporter who booked it streams
+    fixes in ({"latitude", "longitude", "recorded_at"?} or {"points": [...]});
+    the owner and the transporter receive location_update events.
+    """
+    async def connect(self):
+        self.package_id = int(self.scope["url_route"]["kwargs"]["package_id"])
+        self.room_group_name = tracking_group(self.package_id)
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        access = await self.package_access(user)
+        if access is None:
+            await self.close()
+            return
+        self.can_report = access == "transporter"
+
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "can_report"):
+            if self.can_report:
+                await tracking_buffer().flush()
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+
+    async def receive(self, text_data):
+        if not self.can_report:
+            return
+        data = json.loads(text_data)
+        try:
+            points = parse_points(data.get("points", [data]), package_id=self.package_id)
+        except ValidationError as exc:
+            await self.send(text_data=json.dumps({"type": "error", "error": exc.detail}))
+            return
+
+        # History is written behind; watchers hear about the newest fix now
+        buffer = tracking_buffer()
+        for point in points:
+            buffer.add(point, track=False)
+        newest = max(points, key=lambda point: point.recorded_at)
+        await self.channel_layer.group_send(self.room_group_name, position_event(newest))
+
+    async def location_update(self, event):
+        await self.send(text_data=json.dumps({
+            "package": event["package"],
+            "latitude": event["latitude"],
+            "longitude": event["longitude"],
+            "recorded_at": event["recorded_at"],
+        }))
+
+    @database_sync_to_async
+    def package_access(self, user):
+        package = Package.objects.filter(id=self.package_id).only("user_id", "booked_by_id").first()
+        if package is None:
+            return None
+        if package.booked_by_id == user.id:
+            return "transporter"
+        if package.user_id == user.id:
+            return "owner"
+        return None
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    The connected user's notifications. Frames are
+    {"type": "notifications", "cursor": <newest id>, "events": [...]};
+    connecting with ?after=<cursor> first replays what was missed since, or
+    sends {"type": "resync", "cursor": ...} when that is more than the
+    replay limit and the client should reload instead.
+
+    Live events are passed on even when their id is below the cursor: on
+    PostgreSQL a lower id can commit after a higher one. Only events the
+    replay already sent are dropped when they arrive live as well.
+    """
+    async def connect(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        self.user_id = user.id
+        self.group_name = notification_group(user.id)
+        self.window = notification_config()["window"]
+        self.pending = []
+        self.timer = None
+        self.cursor = 0
+        self.replayed = set()
+
+        # Join before reading the backlog so nothing falls in between;
+        # events seen twice are dropped by cursor
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        after = parse_qs(self.scope.get("query_string", b"").decode()).get("after")
+        try:
+            after = int(after[0]) if after else None
+        except ValueError:
+            after = None
+        if after is None:
+            self.cursor = await database_sync_to_async(latest_cursor)(self.user_id)
+            await self.send_events([])
+            return
+
+        events = await database_sync_to_async(missed)(self.user_id, after, notification_config()["replay_limit"])
+        if events is None:
+            self.cursor = await database_sync_to_async(latest_cursor)(self.user_id)
+            await self.send(text_data=json.dumps({"type": "resync", "cursor": self.cursor}))
+            return
+        self.cursor = after
+        self.replayed = {event["id"] for event in events}
+        await self.send_events(coalesce(events))
+
+    async def disconnect(self, code):
+        if hasattr(self, "group_name"):
+            if self.timer is not None:
+                self.timer.cancel()
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
-#         await self.channel_layer.group_send(
-#             self.room_group_name,
-#             {
-#                 "type": "location_update",
-#                 "latitude": latitude,
-#                 "longitude": longitude,
-#             }
-#         )
+    async def notify(self, event):
+        self.pending.extend(event["events"])
+        if self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self.start_flush)
 
-#     async def location_update(self, event):
-#         await self.send(text_data=json.dumps({
-#             "latitude": event["latitude"],
-#             "longitude": event["longitude"],
-#         }))
+    def start_flush(self):
+        self.timer = None
+        self.flush_task = asyncio.get_running_loop().create_task(self.flush())
 
-#     @database_sync_to_async
-#     def save_location(self, latitude, longitude):
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        events = [event for event in coalesce(batch) if event["id"] not in self.replayed]
+        if events:
+            try:
+                await self.send_events(events)
+            except Exception:
+                # Usually the socket closed during the window; the client
+                # replays from its cursor when it reconnects
+                logger.warning("Notification frame for user %s not sent", self.user_id, exc_info=True)
 
-#         package = Package.objects.get(id=self.package_id)
-#         tracking, created = Tracking.objects.get_or_create(package=package)
-#         tracking.latitude = latitude
-#         tracking.longitude = longitude
-#         tracking.save()
+    async def send_events(self, events):
+        if events:
+            self.cursor = max(self.cursor, events[-1]["id"])
+        await self.send(text_data=json.dumps({"type": "notifications", "cursor": self.cursor, "events": events}))
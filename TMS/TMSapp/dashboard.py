@@ -0,0 +1,90 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Invoice, Package
+
+CACHE_PREFIX = "dashboard"
+ALL_PACKAGES = "all"   # snapshot key shared by staff users
+
+# Hit/miss counters are kept per process. Counting in the shared cache
+# would cost several queries per hit on the database cache, more than the
+# snapshot saves, and its incr() resets the entry's timeout.
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def snapshot_key(scope):
+    return f"{CACHE_PREFIX}:snapshot:{scope}"
+
+
+def user_scope(user):
+    return ALL_PACKAGES if user.is_staff else user.id
+
+
+def compute_snapshot(user):
+    """Build the dashboard numbers in two queries"""
+    base_qs = Package.objects.all() if user.is_staff else Package.objects.filter(user=user)
+
+    # Offers are counted from the package's denormalized offer_count, so
+    # the offers table is not joined in
+    counts = base_qs.aggregate(
+        total_packages=Count("id"),
+        current_packages=Count("id", filter=Q(status="Available")),
+        negotiating_packages=Count("id", filter=Q(status="Negotiating")),
+        ready_to_load=Count("id", filter=Q(status="Booked")),
+        delivered_packages=Count("id", filter=Q(status="Delivered")),
+        total_offers=Coalesce(Sum("offer_count"), 0),
+    )
+
+    invoices = Invoice.objects.all() if user.is_staff else Invoice.objects.filter(package__user=user)
+    total_invoice_amount = invoices.aggregate(total=Sum("amount"))["total"] or 0
+
+    counts["total_invoice_amount"] = float(total_invoice_amount)
+    return counts
+
+
+def get_snapshot(user):
+    """Cached dashboard numbers for a user; signals drop the entry on change"""
+    key = snapshot_key(user_scope(user))
+    data = cache.get(key)
+    if data is not None:
+        _bump("hits")
+        return data
+
+    _bump("misses")
+    data = compute_snapshot(user)
+    cache.set(key, data, getattr(settings, "DASHBOARD_CACHE_TIMEOUT", 300))
+    return data
+
+
+def invalidate(*user_ids):
+    """Drop the snapshots of the given owners and the staff-wide one"""
+    keys = [snapshot_key(pk) for pk in user_ids if pk is not None]
+    keys.append(snapshot_key(ALL_PACKAGES))
+    cache.delete_many(keys)
+
+
+def cache_stats():
+    """Hits and misses of this process since it started (or reset_stats())"""
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else None,
+    }
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
+
+
+def _bump(name):
+    with _stats_lock:
+        _stats[name] += 1
@@ -0,0 +1,101 @@
+"""
+Bulk exports of packages, offers and invoices as NDJSON or CSV.
+
+An export is one query read through QuerySet.iterator(chunk_size), which on
+PostgreSQL is a server-side cursor and elsewhere a chunked fetch. Rows are
+read with values_list() over a fixed projection (no model instances, no
+serializers) and written to a StreamingHttpResponse one chunk at a time, so
+memory stays flat however many rows the export has. Under ASGI the chunks
+go out through an async iterator (utils.streaming_response), since Django
+would read a synchronous one to the end before sending it.
+
+Columns are declared per viewset as {output name: lookup}, e.g.
+{"owner": "user__username"}, so related fields come from joins in the same
+query. Decimals are written as strings, as the API serializers do, and
+dates and datetimes in ISO 8601.
+
+CSV cells that spreadsheet programs would read as formulas (text starting
+with = + - @, tab or carriage return) are prefixed with a quote.
+"""
+import csv
+import datetime
+import io
+import json
+from decimal import Decimal
+
+from django.conf import settings
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+DEFAULTS = {"chunk_size": 2000}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "EXPORT", {})}
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def rows(queryset, columns, chunk_size=None):
+    """Tuples of `columns` values, in chunks of chunk_size from one cursor"""
+    chunk_size = chunk_size or config()["chunk_size"]
+    return queryset.values_list(*columns.values()).iterator(chunk_size=chunk_size)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_ndjson(queryset, columns, chunk_size=None):
+    """One JSON object per line; yields one string per chunk of rows"""
+    chunk_size = chunk_size or config()["chunk_size"]
+    encode = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(",", ":")).encode
+    names = list(columns)
+    for chunk in _chunks(rows(queryset, columns, chunk_size), chunk_size):
+        yield "".join([encode(dict(zip(names, row))) + "\n" for row in chunk])
+
+
+def _csv_cell(value):
+    if isinstance(value, str):
+        return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(queryset, columns, chunk_size=None):
+    """A header line, then the rows; yields one string per chunk of rows"""
+    chunk_size = chunk_size or config()["chunk_size"]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(list(columns))
+    for chunk in _chunks(rows(queryset, columns, chunk_size), chunk_size):
+        writer.writerows([[_csv_cell(value) for value in row] for row in chunk])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream(queryset, columns, output, chunk_size=None):
+    if output == "csv":
+        return stream_csv(queryset, columns, chunk_size)
+    return stream_ndjson(queryset, columns, chunk_size)
@@ -0,0 +1,182 @@
+import csv
+import math
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+from django.utils.module_loading import import_string
+
+EARTH_RADIUS_KM = 6371.0088
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 8
+
+# Package columns written by geocode_package()
+GEO_FIELDS = {
+    "pickup_latitude", "pickup_longitude", "pickup_geohash",
+    "drop_latitude", "drop_longitude", "drop_geohash",
+}
+
+# Upper bound on the index range probes issued for one proximity search
+MAX_COVER_CELLS = 16
+
+
+# -------------------
+# GEOHASH
+# -------------------
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell at this precision"""
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(latitude, longitude, radius_km, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash prefixes whose union covers the circle around (latitude, longitude).
+
+    Uses the finest precision at which the circle's bounding box still fits in
+    max_cells cells, so the candidate set stays tight without turning into
+    hundreds of index range probes.
+    """
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    d_lon = d_lat / max(math.cos(math.radians(latitude)), 0.01)
+    min_lat, max_lat = max(latitude - d_lat, -90.0), min(latitude + d_lat, 90.0)
+    min_lon, max_lon = longitude - d_lon, longitude + d_lon
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+        cols = math.floor(max_lon / width) - math.floor(min_lon / width) + 1
+        if rows * cols <= max_cells or precision == 1:
+            break
+
+    cells = set()
+    lat = (math.floor(min_lat / height) + 0.5) * height
+    while lat - height / 2 <= max_lat:
+        lon = (math.floor(min_lon / width) + 0.5) * width
+        while lon - width / 2 <= max_lon:
+            wrapped = (lon + 180) % 360 - 180
+            cells.add(geohash_encode(min(max(lat, -90.0), 90.0), wrapped, precision))
+            lon += width
+        lat += height
+    return sorted(cells)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def distance_expression(latitude, longitude, lat_field="pickup_latitude", lon_field="pickup_longitude"):
+    """Haversine distance (km) from a fixed point to a row, as a DB expression"""
+    phi = math.radians(latitude)
+    d_phi = Radians(F(lat_field)) - phi
+    d_lambda = Radians(F(lon_field)) - math.radians(longitude)
+    a = Power(Sin(d_phi / 2), 2) + math.cos(phi) * Cos(Radians(F(lat_field))) * Power(Sin(d_lambda / 2), 2)
+    return ASin(Sqrt(a), output_field=FloatField()) * (2 * EARTH_RADIUS_KM)
+
+
+def within_radius(queryset, latitude, longitude, radius_km, prefix="pickup"):
+    """
+    Restrict a Package queryset to rows within radius_km of a point.
+
+    The geohash prefixes hit the indexed geohash column first, so the exact
+    haversine check only runs over the handful of candidate cells.
+    """
+    cells = Q()
+    for cell in covering_cells(latitude, longitude, radius_km):
+        # A range rather than LIKE 'cell%' so every backend can use the index
+        cells |= Q(**{
+            f"{prefix}_geohash__gte": cell,
+            f"{prefix}_geohash__lte": cell.ljust(GEOHASH_PRECISION, "z"),
+        })
+    return queryset.filter(cells).annotate(**{
+        f"{prefix}_distance_km": distance_expression(
+            latitude, longitude, f"{prefix}_latitude", f"{prefix}_longitude"
+        )
+    }).filter(**{f"{prefix}_distance_km__lte": radius_km})
+
+
+# -------------------
+# GEOCODING
+# -------------------
+class GazetteerGeocoder:
+    """
+    Offline geocoder backed by a CSV gazetteer (name,latitude,longitude).
+
+    Free-text locations are matched on the whole string first, then on each
+    comma-separated part, so "Andheri East, Mumbai" still resolves.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.GEOCODER_GAZETTEER
+        self.places = {}
+        with open(self.path, newline="", encoding="utf-8") as fh:
+            for row in csv.DictReader(fh):
+                self.places[self.normalize(row["name"])] = (
+                    float(row["latitude"]), float(row["longitude"])
+                )
+
+    @staticmethod
+    def normalize(text):
+        return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text.lower())).strip()
+
+    def geocode(self, text):
+        """Return (latitude, longitude) or None when the place is unknown"""
+        if not text:
+            return None
+        hit = self.places.get(self.normalize(text))
+        if hit:
+            return hit
+        for part in reversed(text.split(",")):
+            hit = self.places.get(self.normalize(part))
+            if hit:
+                return hit
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_geocoder():
+    return import_string(settings.GEOCODER_BACKEND)()
+
+
+def geocode_package(package):
+    """Fill the pickup/drop coordinate columns of a package from its locations"""
+    geocoder = get_geocoder()
+    for prefix in ("pickup", "drop"):
+        point = geocoder.geocode(getattr(package, f"{prefix}_location"))
+        latitude, longitude = point if point else (None, None)
+        setattr(package, f"{prefix}_latitude", latitude)
+        setattr(package, f"{prefix}_longitude", longitude)
+        setattr(package, f"{prefix}_geohash", geohash_encode(latitude, longitude) if point else None)
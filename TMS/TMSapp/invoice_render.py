@@ -0,0 +1,225 @@
+"""
+Invoice PDF renderer built from a template compiled once per process.
+
+Most of what ReportLab spends on a one-page invoice goes into building and
+serializing the same document skeleton every time: catalog, font
+dictionaries, the static drawing and its encodings. compile_template() does
+all of that once per process:
+
+- the static layer (title, field labels, table headings, footer) becomes
+  one compressed form XObject, stored as finished PDF bytes;
+- the catalog, font and info objects are serialized to bytes as well;
+- label widths give the position of every value slot.
+
+render_invoice() then only lays out the variable text with a ReportLab text
+object, compresses one content stream per page and writes the pages tree,
+the cross-reference table and the trailer around the precompiled objects.
+The package table takes any number of rows and breaks onto new pages,
+each of which shows the same static form.
+"""
+import io
+import threading
+import zlib
+from functools import lru_cache
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+# Registered in this order so their internal names are F1..F5; Symbol and
+# ZapfDingbats are ReportLab's fallbacks for characters outside WinAnsi (₹)
+FONTS = ("Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Symbol", "ZapfDingbats")
+WIDTH, HEIGHT = A4
+
+# (font, size, x, y, label); value slots sit right after their label
+LABELS = [
+    ("Helvetica-Bold", 22, 400, HEIGHT - 50, "INVOICE"),
+    ("Helvetica", 12, 50, HEIGHT - 80, "Owner: "),
+    ("Helvetica", 12, 50, HEIGHT - 100, "Email: "),
+    ("Helvetica", 12, 50, HEIGHT - 120, "Phone: "),
+    ("Helvetica", 12, 400, HEIGHT - 80, "Invoice #: "),
+    ("Helvetica", 12, 400, HEIGHT - 100, "Issue Date: "),
+    ("Helvetica", 12, 400, HEIGHT - 120, "Status: "),
+    ("Helvetica-Bold", 14, 50, HEIGHT - 170, "Bill To:"),
+    ("Helvetica", 12, 50, HEIGHT - 190, "Name: "),
+    ("Helvetica", 12, 50, HEIGHT - 210, "Email: "),
+    ("Helvetica", 12, 50, HEIGHT - 230, "Phone: "),
+    ("Helvetica-Bold", 14, 50, HEIGHT - 270, "Package Details:"),
+]
+HEADER_FIELDS = [
+    # slot name -> the label it follows (index into LABELS)
+    ("owner", 1), ("owner_email", 2), ("owner_phone", 3),
+    ("number", 4), ("issued", 5), ("status", 6),
+    ("transporter", 8), ("transporter_email", 9), ("transporter_phone", 10),
+]
+TABLE_COLUMNS = [(50, "Title"), (200, "Pickup"), (350, "Drop"), (450, "Weight"), (520, "Price")]
+TABLE_TOP = HEIGHT - 290
+ROW_HEIGHT = 20
+TABLE_BOTTOM = 80
+FOOTER = "Thank you for using TMSapp. We appreciate your business!"
+
+# Fixed object numbers; pages and their content streams follow FIRST_PAGE
+CATALOG, PAGES, INFO, STATIC, FIRST_FONT = 1, 2, 3, 4, 5
+FIRST_PAGE = FIRST_FONT + len(FONTS)
+
+_local = threading.local()
+
+
+def _num(value):
+    return f"{value:.4f}".rstrip("0").rstrip(".")
+
+
+def _stream(obj, data, extra=""):
+    data = zlib.compress(data)
+    head = f"{obj} 0 obj\n<< {extra}/Filter /FlateDecode /Length {len(data)} >>\nstream\n".encode()
+    return head + data + b"\nendstream\nendobj\n"
+
+
+class Template:
+    """Precompiled objects and slot positions shared by every render"""
+
+    def __init__(self):
+        text = self.text()
+        for font, size, x, y, label in LABELS:
+            text.setFont(font, size)
+            text.setTextOrigin(x, y)
+            text.textOut(label)
+        text.setFont("Helvetica-Bold", 12)
+        for x, heading in TABLE_COLUMNS:
+            text.setTextOrigin(x, TABLE_TOP)
+            text.textOut(heading)
+        text.setFont("Helvetica-Oblique", 10)
+        text.setFillColor(colors.grey)
+        text.setTextOrigin(50, 50)
+        text.textOut(FOOTER)
+
+        fonts = " ".join(f"/F{i + 1} {FIRST_FONT + i} 0 R" for i in range(len(FONTS)))
+        box = f"[0 0 {_num(WIDTH)} {_num(HEIGHT)}]"
+        self.resources = f"<< /Font << {fonts} >> /XObject << /Static {STATIC} 0 R >> /ProcSet [/PDF /Text] >>"
+        self.media_box = box
+
+        fixed = [
+            f"{CATALOG} 0 obj\n<< /Type /Catalog /Pages {PAGES} 0 R >>\nendobj\n".encode(),
+            f"{INFO} 0 obj\n<< /Producer (TMSapp) /Title (Invoice) >>\nendobj\n".encode(),
+            _stream(
+                STATIC, text.getCode().encode("latin-1"),
+                f"/Type /XObject /Subtype /Form /BBox {box} /Resources << /Font << {fonts} >> >> ",
+            ),
+        ]
+        for i, font in enumerate(FONTS):
+            encoding = "" if font in ("Symbol", "ZapfDingbats") else "/Encoding /WinAnsiEncoding "
+            fixed.append(
+                f"{FIRST_FONT + i} 0 obj\n<< /Type /Font /Subtype /Type1 /Name /F{i + 1} "
+                f"/BaseFont /{font} {encoding}>>\nendobj\n".encode()
+            )
+        self.header = b"%PDF-1.4\n%\x93\x8c\x8b\x9e\n"
+        # Object number of each precompiled chunk, in file order
+        self.fixed = list(zip([CATALOG, INFO, STATIC, *range(FIRST_FONT, FIRST_PAGE)], fixed))
+
+        self.slots = {}
+        for name, label_index in HEADER_FIELDS:
+            font, size, x, y, label = LABELS[label_index]
+            self.slots[name] = (x + stringWidth(label, font, size), y)
+
+    @staticmethod
+    def new_canvas():
+        c = canvas.Canvas(io.BytesIO(), pagesize=A4)
+        for font in FONTS:
+            c.setFont(font, 12)
+        return c
+
+    def text(self):
+        """A ReportLab text object whose font names match the compiled objects"""
+        # Text objects look fonts up on their canvas; one per thread
+        scratch = getattr(_local, "scratch", None)
+        if scratch is None:
+            scratch = _local.scratch = self.new_canvas()
+        return scratch.beginText()
+
+
+@lru_cache(maxsize=None)
+def compile_template():
+    return Template()
+
+
+def invoice_rows(invoice):
+    package = invoice.package
+    return [(
+        package.title or "Untitled",
+        package.pickup_location or "N/A",
+        package.drop_location or "N/A",
+        f"{package.weight} kg" if package.weight else "N/A",
+        f"₹{invoice.amount}",
+    )]
+
+
+def _pages(template, header_values, rows):
+    """Content (PDF operators) of every page"""
+    per_page = int((TABLE_TOP - ROW_HEIGHT - TABLE_BOTTOM) // ROW_HEIGHT) + 1
+    chunks = [rows[i:i + per_page] for i in range(0, len(rows), per_page)] or [[]]
+    pages = []
+    for chunk in chunks:
+        text = template.text()
+        text.setFont("Helvetica-Bold", 24)
+        text.setTextOrigin(50, HEIGHT - 50)
+        text.textOut(header_values["company"])
+        text.setFont("Helvetica", 12)
+        for name, (x, y) in template.slots.items():
+            text.setTextOrigin(x, y)
+            text.textOut(str(header_values[name]))
+        y = TABLE_TOP - ROW_HEIGHT
+        for row in chunk:
+            for (x, _), value in zip(TABLE_COLUMNS, row):
+                text.setTextOrigin(x, y)
+                text.textOut(str(value))
+            y -= ROW_HEIGHT
+        pages.append(f"q /Static Do Q\n{text.getCode()}".encode("latin-1"))
+    return pages
+
+
+def render_invoice(invoice, rows=None):
+    """
+    Render an invoice (package__user and transporter loaded) to a BytesIO.
+    rows overrides the package table: a list of (title, pickup, drop,
+    weight, price) strings, paginated as needed.
+    """
+    template = compile_template()
+    owner = invoice.package.user
+    transporter = invoice.transporter
+    values = {
+        "company": owner.company_name or owner.username,
+        "owner": owner.username,
+        "owner_email": owner.email,
+        "owner_phone": owner.phone_no or "N/A",
+        "number": invoice.invoice_number,
+        "issued": invoice.issue_at.strftime("%Y-%m-%d"),
+        "status": "Paid" if invoice.paid else "Unpaid",
+        "transporter": transporter.username,
+        "transporter_email": transporter.email,
+        "transporter_phone": transporter.phone_no or "N/A",
+    }
+    pages = _pages(template, values, invoice_rows(invoice) if rows is None else rows)
+
+    page_objects = [FIRST_PAGE + 2 * i for i in range(len(pages))]
+    kids = " ".join(f"{obj} 0 R" for obj in page_objects)
+    chunks = list(template.fixed)
+    chunks.append((PAGES, f"{PAGES} 0 obj\n<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>\nendobj\n".encode()))
+    for obj, content in zip(page_objects, pages):
+        chunks.append((obj, (
+            f"{obj} 0 obj\n<< /Type /Page /Parent {PAGES} 0 R /MediaBox {template.media_box} "
+            f"/Resources {template.resources} /Contents {obj + 1} 0 R >>\nendobj\n"
+        ).encode()))
+        chunks.append((obj + 1, _stream(obj + 1, content)))
+
+    out = bytearray(template.header)
+    offsets = {}
+    for obj, data in chunks:
+        offsets[obj] = len(out)
+        out += data
+    size = max(offsets) + 1
+    xref = len(out)
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offsets[obj]:010d} 00000 n \n" for obj in range(1, size)).encode()
+    out += f"trailer\n<< /Size {size} /Root {CATALOG} 0 R /Info {INFO} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return io.BytesIO(bytes(out))
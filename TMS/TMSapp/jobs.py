@@ -0,0 +1,150 @@
+"""
+Database-backed job queue for invoice work.
+
+Requests only insert an InvoiceJob row; `manage.py runjobs` processes claim
+and run them. Claiming is a conditional UPDATE (queued -> running) so any
+number of workers, in any number of processes, can poll the same table
+without a job running twice at once. A failed attempt is requeued with
+exponential backoff until max_attempts, then left as failed with its error.
+A worker that dies mid-job leaves it running; once locked_at is older than
+lock_timeout another worker takes it over.
+
+Delivery is at-least-once: a worker killed between sending the email and
+marking the job done will send it again.
+
+Each job has a unique idempotency key ("invoice-<id>-<kind>"), so enqueueing
+the same work twice returns the existing job instead of adding another.
+"""
+import datetime
+import io
+import logging
+import os
+import socket
+import time
+import traceback
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import InvoiceJob
+from . import pdf_cache
+from .utils import send_invoice_email
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "max_attempts": 5,
+    "backoff": 30,          # seconds before the first retry, doubled per attempt
+    "max_backoff": 3600,
+    "lock_timeout": 300,    # seconds before a running job counts as abandoned
+    "poll_interval": 1.0,
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "INVOICE_JOBS", {})}
+
+
+def job_key(invoice_id, kind):
+    return f"invoice-{invoice_id}-{kind}"
+
+
+def enqueue(invoice, kind=InvoiceJob.DELIVER):
+    """Queue work for an invoice; returns (job, created)"""
+    return InvoiceJob.objects.get_or_create(
+        key=job_key(invoice.pk, kind),
+        defaults={"invoice": invoice, "kind": kind, "max_attempts": config()["max_attempts"]},
+    )
+
+
+# -------------------
+# HANDLERS
+# -------------------
+def deliver_invoice(job):
+    invoice = job.invoice
+    with open(pdf_cache.get_pdf(invoice), "rb") as pdf:
+        send_invoice_email(invoice, io.BytesIO(pdf.read()), invoice.package.user.email)
+
+
+HANDLERS = {
+    InvoiceJob.DELIVER: deliver_invoice,
+}
+
+
+# -------------------
+# WORKER
+# -------------------
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _claimable(now, lock_timeout):
+    stale = now - datetime.timedelta(seconds=lock_timeout)
+    return Q(status=InvoiceJob.QUEUED, run_after__lte=now) | Q(status=InvoiceJob.RUNNING, locked_at__lt=stale)
+
+
+def claim(worker, limit=10):
+    """Take the next due job for this worker, or None"""
+    now = timezone.now()
+    due = _claimable(now, config()["lock_timeout"])
+    candidates = InvoiceJob.objects.filter(due).order_by("run_after", "id").values_list("id", flat=True)[:limit]
+    for job_id in list(candidates):
+        claimed = InvoiceJob.objects.filter(due, id=job_id).update(
+            status=InvoiceJob.RUNNING, locked_by=worker, locked_at=now, attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return InvoiceJob.objects.select_related(
+                "invoice__package__user", "invoice__transporter"
+            ).get(id=job_id)
+    return None
+
+
+def retry_delay(attempts):
+    options = config()
+    return min(options["backoff"] * 2 ** (attempts - 1), options["max_backoff"])
+
+
+def run(job):
+    """Run a claimed job and record the outcome; returns the new status"""
+    mine = InvoiceJob.objects.filter(id=job.id, locked_by=job.locked_by, status=InvoiceJob.RUNNING)
+    try:
+        HANDLERS[job.kind](job)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error("Job %s failed after %d attempts", job.key, job.attempts)
+            mine.update(status=InvoiceJob.FAILED, last_error=error, finished_at=timezone.now(), locked_at=None)
+            return InvoiceJob.FAILED
+        delay = retry_delay(job.attempts)
+        logger.warning("Job %s attempt %d failed, retrying in %ss", job.key, job.attempts, delay)
+        mine.update(
+            status=InvoiceJob.QUEUED, last_error=error, locked_at=None,
+            run_after=timezone.now() + datetime.timedelta(seconds=delay),
+        )
+        return InvoiceJob.QUEUED
+    mine.update(status=InvoiceJob.DONE, finished_at=timezone.now(), locked_at=None)
+    return InvoiceJob.DONE
+
+
+def work(worker=None, burst=False, stop=None):
+    """
+    Claim and run jobs until stop() is true. With burst=True, return as soon
+    as nothing is due instead of polling. Returns the number of jobs run.
+    """
+    worker = worker or worker_name()
+    poll_interval = config()["poll_interval"]
+    processed = 0
+    while stop is None or not stop():
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            # Drop broken or expired connections while idle
+            close_old_connections()
+            time.sleep(poll_interval)
+            continue
+        run(job)
+        processed += 1
+    return processed
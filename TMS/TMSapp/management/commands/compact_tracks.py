@@ -0,0 +1,28 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from TMSapp.models import TrackingPoint
+from TMSapp.trajectory import compact_package
+
+
+class Command(BaseCommand):
+    help = "Roll raw GPS fixes older than --older-than-hours into compressed per-day track segments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-hours", type=int, default=24)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(hours=options["older_than_hours"])
+        package_ids = (
+            TrackingPoint.objects.filter(recorded_at__lt=before)
+            .values_list("package_id", flat=True).distinct().order_by("package_id")
+        )
+        read = kept = 0
+        for package_id in list(package_ids):
+            raw, stored = compact_package(package_id, before)
+            read += raw
+            kept += stored
+            self.stdout.write(f"package {package_id}: {raw} fixes -> {stored} points")
+        self.stdout.write(self.style.SUCCESS(f"Compacted {read} fixes into {kept} points before {before:%Y-%m-%d %H:%M}"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from TMSapp.models import Package
+from TMSapp.thumbnails import process
+
+
+class Command(BaseCommand):
+    help = "Normalize package photos and derive thumbnails for any upload not processed yet"
+
+    def handle(self, *args, **options):
+        pending = [
+            package_id
+            for package_id, name, variants in (
+                Package.objects.exclude(images="").exclude(images__isnull=True)
+                .values_list("id", "images", "image_variants").order_by("id").iterator()
+            )
+            if (variants or {}).get("source") != name
+        ]
+        done = 0
+        for package_id in pending:
+            try:
+                variants = process(package_id)
+            except Exception as exc:
+                self.stderr.write(f"package {package_id}: {exc}")
+                continue
+            if variants:
+                done += 1
+                self.stdout.write(f"package {package_id}: {variants['width']}x{variants['height']}, {len(variants['urls'])} files")
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} of {len(pending)} package photos"))
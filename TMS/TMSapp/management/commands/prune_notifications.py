@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from TMSapp import notifications
+
+
+class Command(BaseCommand):
+    help = "Delete notifications older than --keep-days (default NOTIFICATIONS['retention_days'])"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-days", type=int, default=None)
+
+    def handle(self, *args, **options):
+        days = options["keep_days"]
+        if days is None:
+            days = notifications.config()["retention_days"]
+        total = notifications.prune(days)
+        self.stdout.write(self.style.SUCCESS(f"Pruned {total} notifications older than {days} days"))
@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from TMSapp.models import TrackingPoint
+
+
+class Command(BaseCommand):
+    help = "Drop GPS history older than --keep-days, one day partition at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-days", type=int, default=90)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now().date() - datetime.timedelta(days=options["keep_days"])
+        days = (
+            TrackingPoint.objects.filter(day__lt=cutoff)
+            .values_list("day", flat=True).distinct().order_by("day")
+        )
+        total = 0
+        for day in list(days):
+            deleted, _ = TrackingPoint.objects.filter(day=day).delete()
+            total += deleted
+            self.stdout.write(f"{day}: {deleted} points")
+        self.stdout.write(self.style.SUCCESS(f"Pruned {total} points older than {cutoff}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from TMSapp.search import rebuild
+
+
+class Command(BaseCommand):
+    help = "Re-index every package for full-text search (after bulk writes that bypass signals)"
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} packages"))
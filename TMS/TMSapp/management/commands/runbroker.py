@@ -0,0 +1,37 @@
+import asyncio
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from TMSapp.broker import serve
+
+
+def run_shard(path):
+    try:
+        asyncio.run(serve(path))
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = "Run the local channel-layer broker shards configured in CHANNEL_LAYERS"
+
+    def handle(self, *args, **options):
+        config = settings.CHANNEL_LAYERS["default"]
+        shards = config.get("CONFIG", {}).get("shards")
+        if not shards:
+            raise CommandError(
+                "CHANNEL_LAYERS['default'] is not a ShardedChannelLayer; set CHANNEL_BROKER_SOCKETS."
+            )
+
+        processes = [multiprocessing.Process(target=run_shard, args=(path,), daemon=True) for path in shards]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Broker shards running on: {', '.join(shards)}")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
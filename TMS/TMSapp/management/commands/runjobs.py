@@ -0,0 +1,43 @@
+import multiprocessing
+
+from django import db
+from django.core.management.base import BaseCommand
+
+from TMSapp.jobs import work
+
+
+def run_worker(burst):
+    try:
+        work(burst=burst)
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = "Render and email queued invoices with a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--burst", action="store_true", help="Exit once no job is due")
+
+    def handle(self, *args, **options):
+        if options["workers"] <= 1:
+            processed = work(burst=options["burst"])
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs"))
+            return
+
+        # Children must open their own database connections
+        db.connections.close_all()
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(options["burst"],), daemon=True)
+            for _ in range(options["workers"])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"{len(processes)} invoice workers running")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,399 @@
+"""
+Load matching: rank open packages against a transporter's available fleet.
+
+Every process keeps the open packages (Available / Negotiating, with a
+positive weight) as NumPy columns: id, weight, pickup/drop coordinates in
+radians and listed price. Scoring a fleet is a handful of array
+operations over those columns instead of a query per vehicle.
+
+    score = fit * weight / capacity              (0 when it does not fit)
+          + proximity * closeness to ?origin / ?destination
+          + price * price_per_kg / (price_per_kg + price_reference)
+
+with the weights and scales in MATCHING (settings). Closeness is
+1 / (1 + km / proximity_km); a package without coordinates scores 0 on it.
+Only the fit term depends on the vehicle, and vehicles of the same
+capacity share one ranking. Rather than scoring every vehicle against
+every package, rank_capacities() cuts the weight-sorted packages into
+blocks with an upper bound per capacity and scores only the blocks that
+can still beat a vehicle's k-th suggestion, usually a few thousand
+packages per vehicle, with the same result as scoring them all.
+
+The book is refreshed incrementally. touch() runs when a package is
+saved, deleted or changes status (signals.py, booking.move_package). Once
+the transaction commits, it appends the ids to a journal in the cache
+shared by all workers (CACHES in settings; with a per-process cache, the
+other processes would only catch up every `rebuild_every` seconds). Before
+each ranking, a process re-reads only the journalled rows.
+It rebuilds the whole book when the journal has a gap (entries expired or
+more than `journal_limit` behind), or every `rebuild_every` seconds. The
+periodic rebuild also picks up bulk writes that skip touch().
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .geo import EARTH_RADIUS_KM
+from .models import Package
+
+OPEN = ("Available", "Negotiating")
+DEFAULTS = {
+    "weights": {"fit": 0.4, "proximity": 0.4, "price": 0.2},
+    "proximity_km": 50.0,
+    "price_reference": 5.0,     # price per kg that scores 0.5 on the price term
+    "top_k": 5,
+    "max_top_k": 50,
+    "rebuild_every": 300,
+    "journal_limit": 1000,
+    "journal_ttl": 3600,
+}
+
+SEQ_KEY = "matching:journal:seq"
+COLUMNS = ("id", "weight", "pickup_latitude", "pickup_longitude", "drop_latitude", "drop_longitude", "price_expectation")
+
+# Packages per weight block, score cells (vehicle classes x packages) held at
+# once, and packages each capacity scores in its first pass
+BLOCK_SIZE = 128
+BLOCK_CELLS = 4_000_000
+FIRST_PASS = 1024
+
+
+def config():
+    cfg = {**DEFAULTS, **getattr(settings, "MATCHING", {})}
+    cfg["weights"] = {**DEFAULTS["weights"], **cfg["weights"]}
+    return cfg
+
+
+def _entry_key(seq):
+    return f"matching:journal:{seq}"
+
+
+def touch(*package_ids):
+    """Journal package ids for every process's book, once the transaction commits"""
+    ids = [pk for pk in package_ids if pk is not None]
+    if ids:
+        transaction.on_commit(lambda: _journal(ids))
+
+
+def _next_seq():
+    while not cache.add(SEQ_KEY, 1, None):
+        try:
+            seq = cache.incr(SEQ_KEY)
+        except ValueError:
+            continue    # expired or evicted between add() and incr()
+        # The database cache's incr() is a set() with the default timeout;
+        # the sequence must never expire, or numbers would be drawn again
+        cache.touch(SEQ_KEY, None)
+        return seq
+    return 1
+
+
+def _journal(ids):
+    ttl = config()["journal_ttl"]
+    seq = _next_seq()
+    # The database cache increments by read-then-write, so two processes can
+    # draw the same number; add() lets only one of them have it
+    while not cache.add(_entry_key(seq), ids, ttl):
+        seq = _next_seq()
+
+
+# -------------------
+# OPEN PACKAGE BOOK
+# -------------------
+class OpenBook:
+    """
+    Column arrays of open packages. Rows are addressed by slot; removed
+    slots are marked dead and reused, so updates never shift the arrays.
+    """
+
+    def __init__(self, capacity=1024):
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.weight = np.zeros(capacity)
+        self.coords = np.full((capacity, 4), np.nan)   # pickup lat/lon, drop lat/lon (radians)
+        self.price = np.zeros(capacity)
+        self.live = np.zeros(capacity, dtype=bool)
+        self.slots = {}     # package id -> slot
+        self.free = []
+        self.size = 0       # slots handed out so far
+        self.seq = 0        # last journal entry applied
+        self.built_at = 0.0
+        self._columns = None
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _grow(self, needed):
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("ids", "weight", "coords", "price", "live"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            if name == "coords":
+                new.fill(np.nan)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def upsert(self, rows):
+        """rows: value tuples in COLUMNS order"""
+        if not rows:
+            return
+        slots = []
+        for row in rows:
+            slot = self.slots.get(row[0])
+            if slot is None:
+                if self.free:
+                    slot = self.free.pop()
+                else:
+                    slot = self.size
+                    self.size += 1
+                    self._grow(self.size)
+                self.slots[row[0]] = slot
+            slots.append(slot)
+        data = np.array([row[1:6] + (float(row[6]),) for row in rows], dtype=float)
+        slots = np.array(slots)
+        self.ids[slots] = [row[0] for row in rows]
+        self.weight[slots] = data[:, 0]
+        self.coords[slots] = np.radians(data[:, 1:5])
+        self.price[slots] = data[:, 5]
+        self.live[slots] = True
+        self._columns = None
+
+    def remove(self, package_ids):
+        for package_id in package_ids:
+            slot = self.slots.pop(package_id, None)
+            if slot is not None:
+                self.live[slot] = False
+                self.free.append(slot)
+                self._columns = None
+
+    def columns(self):
+        """
+        (ids, weight, coords, price) of the live rows, lightest first. The
+        arrays are copies, kept until the book next changes, so a ranking
+        can use them while another thread syncs the book.
+        """
+        if self._columns is None:
+            live = np.flatnonzero(self.live[:self.size])
+            live = live[np.argsort(self.weight[live], kind="stable")]
+            self._columns = (self.ids[live], self.weight[live], self.coords[live], self.price[live])
+        return self._columns
+
+
+def open_rows(package_ids=None):
+    qs = Package.objects.filter(status__in=OPEN, weight__gt=0)
+    if package_ids is not None:
+        qs = qs.filter(id__in=package_ids)
+    # NULL coordinates become NaN in the float columns
+    return [
+        row[:2] + tuple(np.nan if value is None else value for value in row[2:6]) + row[6:]
+        for row in qs.values_list(*COLUMNS).iterator(chunk_size=10_000)
+    ]
+
+
+def build():
+    book = OpenBook()
+    # Read the journal position first: anything journalled while the rows
+    # load is applied again on the next sync, which is harmless
+    book.seq = cache.get(SEQ_KEY, 0)
+    book.upsert(open_rows())
+    book.built_at = time.monotonic()
+    return book
+
+
+def sync(book):
+    """Apply journal entries since book.seq; returns False if a rebuild is needed"""
+    cfg = config()
+    if time.monotonic() - book.built_at > cfg["rebuild_every"]:
+        return False
+    head = cache.get(SEQ_KEY, 0)
+    if head == book.seq:
+        return True
+    if head < book.seq or head - book.seq > cfg["journal_limit"]:
+        return False
+    keys = [_entry_key(seq) for seq in range(book.seq + 1, head + 1)]
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        return False
+    dirty = {pk for ids in entries.values() for pk in ids}
+    rows = open_rows(dirty)
+    book.remove(dirty - {row[0] for row in rows})
+    book.upsert(rows)
+    book.seq = head
+    return True
+
+
+_book = None
+_lock = threading.RLock()
+
+
+def current_book():
+    global _book
+    with _lock:
+        if _book is None or not sync(_book):
+            _book = build()
+        return _book
+
+
+def current_columns():
+    """The synced book's columns, taken under the lock"""
+    with _lock:
+        return current_book().columns()
+
+
+def reset():
+    global _book
+    with _lock:
+        _book = None
+
+
+# -------------------
+# SCORING
+# -------------------
+def closeness(coords, point, scale_km):
+    """1 / (1 + haversine km / scale) from a (lat, lon) point in degrees to each row; 0 where unknown"""
+    lat, lon = np.radians(point)
+    a = np.sin((coords[:, 0] - lat) / 2) ** 2 + np.cos(lat) * np.cos(coords[:, 0]) * np.sin((coords[:, 1] - lon) / 2) ** 2
+    km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return km, np.nan_to_num(1 / (1 + km / scale_km), nan=0.0)
+
+
+def _top(scores, k):
+    """Per row: (columns, scores) of the k best, best first"""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(scores, part, 1)
+    order = np.argsort(-values, axis=1, kind="stable")
+    return np.take_along_axis(part, order, 1), np.take_along_axis(values, order, 1)
+
+
+def rank_capacities(capacities, weight, base, fit_weight, k):
+    """
+    Best k packages for each capacity (kg) by base + fit_weight * weight / capacity,
+    skipping packages heavier than the capacity or with a base of -inf.
+    Returns one (package indices, scores) pair per capacity. Weights that
+    arrive sorted (OpenBook.columns()) are not sorted again.
+
+    Packages are sorted by weight and cut into blocks of BLOCK_SIZE. A block
+    can score at most its best base plus the fit of its heaviest package,
+    so each capacity scores its most promising blocks first and stops once
+    its k-th score beats the bound of the next block.
+    """
+    results = [(np.empty(0, dtype=np.int64), np.empty(0))] * len(capacities)
+    candidates = np.flatnonzero(np.isfinite(base) & (weight <= capacities.max(initial=0)))
+    if not len(candidates) or k < 1:
+        return results
+    order = candidates
+    if np.any(np.diff(weight[order]) < 0):
+        order = order[np.argsort(weight[order], kind="stable")]
+    # Pad to whole blocks with packages no vehicle can carry
+    pad = -len(order) % BLOCK_SIZE
+    weight_sorted = np.concatenate([weight[order], np.full(pad, np.finfo(float).max)])
+    base_sorted = np.concatenate([base[order], np.full(pad, -np.inf)])
+    order = np.concatenate([order, np.zeros(pad, dtype=order.dtype)])
+    blocks = len(weight_sorted) // BLOCK_SIZE
+    block_base = base_sorted.reshape(blocks, BLOCK_SIZE).max(axis=1)
+    block_lightest = weight_sorted[::BLOCK_SIZE]
+    block_heaviest = weight_sorted[BLOCK_SIZE - 1::BLOCK_SIZE]
+
+    caps = capacities[:, None]
+    bounds = block_base + fit_weight * np.minimum(block_heaviest, caps) / caps
+    bounds[block_lightest > caps] = -np.inf
+
+    pending = np.arange(len(capacities))
+    r = min(blocks, max(1, FIRST_PASS // BLOCK_SIZE, -(-k // BLOCK_SIZE)))
+    while len(pending):
+        unresolved = []
+        per_chunk = max(1, BLOCK_CELLS // (r * BLOCK_SIZE))
+        for start in range(0, len(pending), per_chunk):
+            rows = pending[start:start + per_chunk]
+            if r < blocks:
+                # The r most promising blocks (in any order), then the next best
+                picked = np.argpartition(-bounds[rows], r, axis=1)
+                # No block past the first r can score above this
+                bound = np.take_along_axis(bounds[rows], picked[:, r:r + 1], 1)[:, 0]
+            else:
+                picked = np.broadcast_to(np.arange(blocks), (len(rows), blocks))
+                bound = np.full(len(rows), -np.inf)
+            columns = (picked[:, :r, None] * BLOCK_SIZE + np.arange(BLOCK_SIZE)).reshape(len(rows), -1)
+            w = weight_sorted[columns]
+            scores = base_sorted[columns] + fit_weight * (w / capacities[rows, None])
+            scores[w > capacities[rows, None]] = -np.inf
+            best, values = _top(scores, k)
+            done = values[:, -1] >= bound
+            found = order[np.take_along_axis(columns, best, 1)]
+            for i in np.flatnonzero(done):
+                keep = np.isfinite(values[i])
+                results[rows[i]] = (found[i][keep], values[i][keep])
+            unresolved.append(rows[~done])
+        pending = np.concatenate(unresolved)
+        r = min(blocks, r * 4)
+    return results
+
+
+def rank(vehicles, origin=None, destination=None, k=None, radius_km=None, book=None):
+    """
+    vehicles: iterable of (vehicle id, capacity in kg).
+    origin / destination: (latitude, longitude) the fleet starts from /
+    is heading to; radius_km drops packages picked up farther than that
+    from origin.
+
+    Returns {vehicle id: [{"package", "score", "fit", "price_per_kg",
+    "pickup_km", "drop_km"}, ...]}, best first.
+    """
+    cfg = config()
+    weights = cfg["weights"]
+    k = min(k or cfg["top_k"], cfg["max_top_k"])
+    vehicles = list(vehicles)
+    if not vehicles:
+        return {}
+    ids, weight, coords, price = book.columns() if book is not None else current_columns()
+
+    price_per_kg = price / weight
+    base = weights["price"] * price_per_kg / (price_per_kg + cfg["price_reference"])
+    pickup_km = drop_km = None
+    near = []
+    if origin is not None:
+        pickup_km, score = closeness(coords[:, 0:2], origin, cfg["proximity_km"])
+        near.append(score)
+        if radius_km is not None:
+            base[~(pickup_km <= radius_km)] = -np.inf
+    if destination is not None:
+        drop_km, score = closeness(coords[:, 2:4], destination, cfg["proximity_km"])
+        near.append(score)
+    if near:
+        base += weights["proximity"] * sum(near) / len(near)
+
+    capacities, classes = np.unique(np.array([capacity for _, capacity in vehicles], dtype=float), return_inverse=True)
+    ranked = rank_capacities(capacities, weight, base, weights["fit"], k)
+
+    # Every class's suggestions converted in one go; per-item numpy scalars are slow
+    counts = [len(indices) for indices, _ in ranked]
+    indices = np.concatenate([indices for indices, _ in ranked])
+    scores = np.concatenate([scores for _, scores in ranked])
+
+    def km(distances):
+        if distances is None:
+            return [None] * len(indices)
+        return [None if d != d else d for d in np.round(distances[indices], 1).tolist()]
+
+    items = [
+        {"package": pk, "score": score, "fit": fit, "price_per_kg": per_kg, "pickup_km": pickup, "drop_km": drop}
+        for pk, score, fit, per_kg, pickup, drop in zip(
+            ids[indices].tolist(),
+            np.round(scores, 4).tolist(),
+            np.round(weight[indices] / np.repeat(capacities, counts), 3).tolist(),
+            np.round(price_per_kg[indices], 2).tolist(),
+            km(pickup_km),
+            km(drop_km),
+        )
+    ]
+    offsets = np.cumsum([0] + counts).tolist()
+    suggestions = [items[offsets[c]:offsets[c + 1]] for c in range(len(capacities))]
+    return {vehicle_id: suggestions[c] for (vehicle_id, _), c in zip(vehicles, classes)}
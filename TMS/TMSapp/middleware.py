@@ -0,0 +1,31 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed, TokenError
+
+from .authentication import CachedJWTAuthentication
+
+
+@database_sync_to_async
+def user_from_token(raw_token):
+    auth = CachedJWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed, TokenError):
+        return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    WebSocket auth for the JWT frontend: ws://.../?token=<access token>.
+    Falls back to whatever user the session middleware resolved.
+    """
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get("query_string", b"").decode()).get("token")
+        if token:
+            user = await user_from_token(token[0])
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
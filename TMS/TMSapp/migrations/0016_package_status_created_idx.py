@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TMSapp', '0015_alter_package_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(fields=['status', 'create_at', 'id'], name='package_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:10
+
+import csv
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copies of TMSapp.geo as of this migration, so later changes to the
+# app's geocoder cannot change what this data migration does
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 8
+BATCH = 500
+
+
+def geohash(latitude, longitude):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < PRECISION:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text.lower())).strip()
+
+
+def load_places():
+    with open(settings.GEOCODER_GAZETTEER, newline="", encoding="utf-8") as fh:
+        return {normalize(row["name"]): (float(row["latitude"]), float(row["longitude"])) for row in csv.DictReader(fh)}
+
+
+def lookup(places, text):
+    if not text:
+        return None
+    for candidate in [text, *reversed(text.split(","))]:
+        hit = places.get(normalize(candidate))
+        if hit:
+            return hit
+    return None
+
+
+def geocode_existing(apps, schema_editor):
+    Package = apps.get_model("TMSapp", "Package")
+    places = load_places()
+    fields = [f"{prefix}_{name}" for prefix in ("pickup", "drop") for name in ("latitude", "longitude", "geohash")]
+    batch = []
+    rows = Package.objects.only("id", "pickup_location", "drop_location").order_by("id")
+    for package in rows.iterator(chunk_size=2000):
+        for prefix in ("pickup", "drop"):
+            point = lookup(places, getattr(package, f"{prefix}_location"))
+            latitude, longitude = point if point else (None, None)
+            setattr(package, f"{prefix}_latitude", latitude)
+            setattr(package, f"{prefix}_longitude", longitude)
+            setattr(package, f"{prefix}_geohash", geohash(latitude, longitude) if point else None)
+        batch.append(package)
+        if len(batch) == BATCH:
+            Package.objects.bulk_update(batch, fields, batch_size=BATCH)
+            batch = []
+    if batch:
+        Package.objects.bulk_update(batch, fields, batch_size=BATCH)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TMSapp', '0016_package_status_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='drop_geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='drop_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='drop_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='pickup_geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='pickup_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='pickup_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(geocode_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_inbox(apps, schema_editor):
+    # Existing history counts as read; only new messages show up as unread
+    ChatRoom = apps.get_model("TMSapp", "ChatRoom")
+    Chat_Message = apps.get_model("TMSapp", "Chat_Message")
+    latest = Chat_Message.objects.filter(room__isnull=False).values("room_id").annotate(last=Max("id"))
+    for row in latest:
+        ChatRoom.objects.filter(id=row["room_id"]).update(
+            last_message_id=row["last"],
+            owner_last_read_id=row["last"],
+            transporter_last_read_id=row["last"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TMSapp', '0017_package_geocoding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='TMSapp.chat_message'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='owner_last_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='owner_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='transporter_last_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='transporter_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='chat_message',
+            index=models.Index(fields=['room', 'id'], name='chat_message_room_id_idx'),
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TMSapp', '0018_chat_inbox_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tracking',
+            name='recorded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='TrackingPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('recorded_at', models.DateTimeField()),
+                ('day', models.DateField()),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracking_points', to='TMSapp.package')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['package', 'recorded_at'], name='tracking_point_pkg_time_idx'), models.Index(fields=['day'], name='tracking_point_day_idx')],
+            },
+        ),
+    ]
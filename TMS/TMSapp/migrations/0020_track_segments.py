@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TMSapp', '0019_tracking_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('start_at', models.DateTimeField()),
+                ('end_at', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='track_segments', to='TMSapp.package')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['package', 'start_at'], name='track_segment_pkg_start_idx')],
+            },
+        ),
+    ]
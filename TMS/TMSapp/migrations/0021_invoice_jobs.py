@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TMSapp', '0020_track_segments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('deliver', 'Render and email PDF')], default='deliver', max_length=20)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=5)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='TMSapp.invoice')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='invoice_job_status_run_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_offers(apps, schema_editor):
+    # Earlier prices are gone; each existing offer starts its history at its current state
+    Offer = apps.get_model("TMSapp", "Offer")
+    OfferRevision = apps.get_model("TMSapp", "OfferRevision")
+    Package = apps.get_model("TMSapp", "Package")
+    offers = Offer.objects.values_list("id", "offer_price", "status", "created_at").iterator(chunk_size=2000)
+    batch = []
+    for offer_id, price, status, created_at in offers:
+        batch.append(OfferRevision(offer_id=offer_id, event="created", price=price, status=status, created_at=created_at))
+        if len(batch) == 2000:
+            OfferRevision.objects.bulk_create(batch)
+            batch = []
+    OfferRevision.objects.bulk_create(batch)
+
+    per_package = Offer.objects.filter(package=OuterRef("pk")).order_by().values("package")
+    Package.objects.filter(offers__isnull=False).distinct().update(
+        offer_count=Coalesce(Subquery(per_package.annotate(n=Count("id")).values("n")), 0),
+        best_offer_price=Subquery(
+            per_package.filter(status__in=("pending", "accepted")).annotate(best=Min("offer_price")).values("best")
+        ),
+        last_offer_at=Subquery(per_package.annotate(last=Max("updated_at")).values("last")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TMSapp', '0021_invoice_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='best_offer_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='last_offer_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='offer_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='OfferRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('created', 'Created'), ('countered', 'Countered'), ('accepted', 'Accepted'), ('rejected', 'Rejected'), ('edited', 'Edited')], max_length=20)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('offer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='TMSapp.offer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['offer', 'id'], name='offer_revision_offer_id_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_offers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TMSapp', '0024_user_token_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# Frozen copies of the TMSapp.search schema and rebuild as of this migration,
+# so later changes to the app's search module cannot change what it does
+TABLE = "package_search"
+TEXT_FIELDS = ("title", "description", "pickup_location", "drop_location")
+PG_DOCUMENT = (
+    "setweight(to_tsvector('simple', title), 'A') || "
+    "setweight(to_tsvector('simple', pickup_location || ' ' || drop_location), 'B') || "
+    "setweight(to_tsvector('simple', description), 'C')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {TABLE} USING fts5({', '.join(TEXT_FIELDS)}, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {TABLE} (rowid, {', '.join(TEXT_FIELDS)}) "
+            f'SELECT id, {", ".join(TEXT_FIELDS)} FROM "TMSapp_package"'
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            f'CREATE TABLE {TABLE} (package_id bigint PRIMARY KEY REFERENCES "TMSapp_package" (id) '
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)"
+        )
+        schema_editor.execute(f"CREATE INDEX {TABLE}_document_idx ON {TABLE} USING GIN (document)")
+        schema_editor.execute(
+            f'INSERT INTO {TABLE} (package_id, document) SELECT id, {PG_DOCUMENT} FROM "TMSapp_package"'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TMSapp', '0025_package_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
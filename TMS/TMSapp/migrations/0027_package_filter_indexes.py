@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TMSapp', '0026_package_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='package',
+            name='booked_by',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='booked_packages', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='package',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='packages', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(fields=['user', 'status', 'create_at'], name='package_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(fields=['booked_by', 'status', 'create_at'], name='package_booked_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(fields=['status', 'weight'], name='package_status_weight_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(fields=['status', 'price_expectation'], name='package_status_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(fields=['create_at'], name='package_created_idx'),
+        ),
+        # Give the SQLite planner row counts to choose among the indexes
+        # (PostgreSQL analyzes on its own; harmless there)
+        migrations.RunSQL('ANALYZE "TMSapp_package"', migrations.RunSQL.noop, elidable=True),
+    ]
@@ -0,0 +1,194 @@
+from datetime import date
+
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from . import export, search
+from .utils import streaming_response
+
+
+class PrefetchPlanMixin:
+    """
+    Declarative select_related/prefetch_related per viewset action.
+
+    prefetch_plan = {
+        "default": {"select_related": ["user"]},
+        "download_pdf": {"select_related": ["package__user", "transporter"]},
+    }
+
+    The plan for the current action (falling back to "default") is applied to
+    get_queryset() automatically; custom actions that build their own
+    querysets pass them through plan_queryset().
+    """
+    prefetch_plan = {}
+
+    def get_prefetch_plan(self, action=None):
+        action = action or getattr(self, "action", None)
+        return self.prefetch_plan.get(action, self.prefetch_plan.get("default", {}))
+
+    def plan_queryset(self, queryset, action=None):
+        plan = self.get_prefetch_plan(action)
+        if plan.get("select_related"):
+            queryset = queryset.select_related(*plan["select_related"])
+        if plan.get("prefetch_related"):
+            queryset = queryset.prefetch_related(*plan["prefetch_related"])
+        return queryset
+
+    def get_queryset(self):
+        return self.plan_queryset(super().get_queryset())
+
+
+class QueryParamMixin:
+    """Parsing of numeric and 'latitude,longitude' query parameters"""
+
+    def _float_param(self, name, default):
+        raw = self.request.query_params.get(name)
+        if raw in (None, ""):
+            return default
+        try:
+            return float(raw)
+        except ValueError:
+            raise ValidationError({name: "Must be a number."})
+
+    def _date_param(self, name):
+        raw = self.request.query_params.get(name)
+        if raw in (None, ""):
+            return None
+        try:
+            return date.fromisoformat(raw)
+        except ValueError:
+            raise ValidationError({name: "Expected a date as YYYY-MM-DD."})
+
+    def _parse_point(self, name, raw):
+        try:
+            latitude, longitude = (float(part) for part in raw.split(","))
+        except ValueError:
+            raise ValidationError({name: "Expected 'latitude,longitude'."})
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({name: "Coordinates out of range."})
+        return latitude, longitude
+
+
+class FilterMixin(QueryParamMixin):
+    """
+    Declarative, whitelisted filtering and sorting of the list action.
+
+    filter_fields = {
+        "status": ("status", "choices"),         # ?status=Booked,Loaded
+        "created_after": ("create_at__gte", "date"),
+        "min_weight": ("weight__gte", "number"),
+        "route": (("pickup_location", "drop_location"), "text"),
+    }
+    ordering_fields = {"created": "create_at", "weight": "weight"}
+
+    "choices" takes a comma list checked against the field's choices,
+    "text" matches every word through the search index (search.filter_text).
+    ?ordering=-weight,created sorts by whitelisted keys, id breaking ties;
+    viewsets without ordering_fields (keyset-paginated ones) keep their
+    order. Anything else in the query string is left to the viewset.
+    """
+    filter_fields = {}
+    ordering_fields = {}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if getattr(self, "action", None) != "list":
+            return queryset
+        return self.sort_queryset(self.apply_filters(queryset))
+
+    def apply_filters(self, queryset):
+        params = self.request.query_params
+        for name, (lookup, kind) in self.filter_fields.items():
+            if params.get(name) in (None, ""):
+                continue
+            if kind == "choices":
+                allowed = {value for value, _ in queryset.model._meta.get_field(lookup).choices}
+                values = [value.strip() for value in params[name].split(",") if value.strip()]
+                unknown = sorted(set(values) - allowed)
+                if unknown:
+                    raise ValidationError({name: f"Unknown values: {', '.join(unknown)}"})
+                queryset = queryset.filter(**{f"{lookup}__in": values})
+            elif kind == "date":
+                queryset = queryset.filter(**{lookup: self._date_param(name)})
+            elif kind == "number":
+                queryset = queryset.filter(**{lookup: self._float_param(name, None)})
+            elif kind == "text":
+                queryset = search.filter_text(queryset, params[name], lookup)
+        return queryset
+
+    def sort_queryset(self, queryset):
+        raw = self.request.query_params.get("ordering")
+        if not raw or not self.ordering_fields:
+            return queryset
+        order = []
+        for key in (part.strip() for part in raw.split(",") if part.strip()):
+            field = self.ordering_fields.get(key.lstrip("-"))
+            if field is None:
+                raise ValidationError({"ordering": f"Sort by one of: {', '.join(sorted(self.ordering_fields))}"})
+            order.append(f"-{field}" if key.startswith("-") else field)
+        if not order:
+            return queryset
+        return queryset.order_by(*order, "-id" if order[0].startswith("-") else "id")
+
+
+class SearchMixin(FilterMixin):
+    """
+    ?q= full-text search over the viewset's queryset (see search.py),
+    narrowed by the viewset's filter_fields and paged with ?limit / ?offset.
+    Results keep the viewset's serializer and add their "search_rank".
+    """
+    search_limit = 20
+    search_max_limit = 100
+    filter_fields = {
+        "status": ("status", "choices"),
+        "min_weight": ("weight__gte", "number"),
+        "max_weight": ("weight__lte", "number"),
+    }
+
+    def search_response(self, queryset):
+        params = self.request.query_params
+        query = params.get("q", "")
+        if not search.terms(query):
+            raise ValidationError({"q": "Enter at least one word to search for."})
+        queryset = self.apply_filters(queryset)
+        try:
+            limit = min(int(params.get("limit", self.search_limit)), self.search_max_limit)
+            offset = int(params.get("offset", 0))
+        except ValueError:
+            raise ValidationError({"detail": "limit and offset must be integers."})
+        if limit < 1 or offset < 0:
+            raise ValidationError({"detail": "limit must be positive and offset not negative."})
+
+        hits = search.search(queryset, query, limit=limit, offset=offset)
+        rows = queryset.in_bulk([package_id for package_id, _ in hits])
+        found = [(rows[package_id], rank) for package_id, rank in hits if package_id in rows]
+        results = self.get_serializer([row for row, _ in found], many=True).data
+        for item, (_, rank) in zip(results, found):
+            item["search_rank"] = rank
+        return Response({"query": query, "limit": limit, "offset": offset, "results": results})
+
+
+class ExportMixin:
+    """
+    Streamed bulk export of the viewset's rows (see export.py).
+
+    export_columns = {"id": "id", "owner": "user__username", ...}
+    export_name = "packages"
+
+    export_response(queryset) answers ?output=ndjson (the default) or
+    ?output=csv as an attachment named <export_name>_<date>.<output>.
+    """
+    export_columns = {}
+    export_name = "export"
+
+    def export_response(self, queryset):
+        output = self.request.query_params.get("output", "ndjson")
+        if output not in export.FORMATS:
+            raise ValidationError({"output": f"Expected one of: {', '.join(export.FORMATS)}"})
+        response = streaming_response(
+            self.request, export.stream(queryset, self.export_columns, output), content_type=export.FORMATS[output]
+        )
+        filename = f"{self.export_name}_{timezone.localdate():%Y-%m-%d}.{output}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
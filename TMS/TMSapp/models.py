@@ -5,6 +5,8 @@ from django.utils import timezone
 from django.utils.timezone import now
 import uuid
 
+from .geo import GEO_FIELDS, geocode_package
+
 # Create your models here.
 class User(AbstractUser):
     is_owner = models.BooleanField(default=False)
@@ -14,6 +16,9 @@ class User(AbstractUser):
     address = models.TextField(blank=True, null=True)
     state = models.CharField(max_length=100, blank=True, null=True)
     country = models.CharField(max_length=100, blank=True, null=True)
+    # Embedded in JWTs; bumped on deactivation or a role change to revoke
+    # tokens issued before it (see authentication.py)
+    token_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.username
@@ -22,13 +27,15 @@ class Package(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='packages'   # Owner who created the package
+        related_name='packages',   # Owner who created the package
+        db_index=False,            # led by package_user_status_idx
     )
     booked_by = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
         null=True, blank=True,
-        related_name='booked_packages'   # Transporter who books it
+        related_name='booked_packages',  # Transporter who books it
+        db_index=False,                  # led by package_booked_status_idx
     )
 
     title = models.CharField(max_length=100)
@@ -38,6 +45,16 @@ class Package(models.Model):
     weight = models.FloatField(help_text='Weight in KG')
     price_expectation = models.DecimalField(max_digits=10, decimal_places=2)
     images = models.ImageField(upload_to='packages/', blank=True, null=True)
+    # Normalized photo and thumbnail URLs, filled by thumbnails.process()
+    image_variants = models.JSONField(default=dict, blank=True)
+
+    # Filled from pickup/drop_location by the offline geocoder (see geo.py)
+    pickup_latitude = models.FloatField(null=True, blank=True)
+    pickup_longitude = models.FloatField(null=True, blank=True)
+    pickup_geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True)
+    drop_latitude = models.FloatField(null=True, blank=True)
+    drop_longitude = models.FloatField(null=True, blank=True)
+    drop_geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True)
 
     status_choice = [
         ('Available', 'Available'),
@@ -49,6 +66,34 @@ class Package(models.Model):
     status = models.CharField(max_length=20, choices=status_choice, default='Available')
     create_at = models.DateField(auto_now_add=True)
 
+    # Denormalized offer summary, maintained by negotiation.py on every offer write
+    offer_count = models.PositiveIntegerField(default=0)
+    best_offer_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    last_offer_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Marketplace keyset pagination: status filter + (create_at, id) cursor
+            models.Index(fields=["status", "create_at", "id"], name="package_status_created_idx"),
+            # Owner and transporter lists: own packages by status, newest first
+            # (current_deliveries, loaded, ?status= on /packages/)
+            models.Index(fields=["user", "status", "create_at"], name="package_user_status_idx"),
+            models.Index(fields=["booked_by", "status", "create_at"], name="package_booked_status_idx"),
+            # Weight and price ranges on open listings (?min_weight=, ?max_price=, ...)
+            models.Index(fields=["status", "weight"], name="package_status_weight_idx"),
+            models.Index(fields=["status", "price_expectation"], name="package_status_price_idx"),
+            # Date ranges across statuses (admin lists, ?created_after=)
+            models.Index(fields=["create_at"], name="package_created_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"pickup_location", "drop_location"} & set(update_fields):
+            geocode_package(self)
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | GEO_FIELDS
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f'{self.title} ({self.pickup_location} -> {self.drop_location})'
 
@@ -58,6 +103,15 @@ class ChatRoom (models.Model):
     transporter =  models.ForeignKey(User,on_delete=models.CASCADE,related_name='transporter_rooms')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized inbox state, maintained by chat.record_messages / chat.mark_read
+    last_message = models.ForeignKey(
+        'Chat_Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    owner_last_read_id = models.BigIntegerField(default=0)
+    transporter_last_read_id = models.BigIntegerField(default=0)
+    owner_unread = models.PositiveIntegerField(default=0)
+    transporter_unread = models.PositiveIntegerField(default=0)
+
     class Meta:
         unique_together = ("package", "owner", "transporter")
 
@@ -71,6 +125,12 @@ class Chat_Message(models.Model):
     message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Incremental sync: messages of a room newer than a given id
+            models.Index(fields=["room", "id"], name="chat_message_room_id_idx"),
+        ]
+
     def __str__(self):
         return f'{self.sender.username}: {self.message[:30]}'
     
@@ -100,6 +160,56 @@ class Offer(models.Model):
         return f"Offer {self.id} - {self.package.title} ({self.status})"
 
 
+class OfferRevision(models.Model):
+    """Append-only log of every price and status an offer went through (see negotiation.py)"""
+    CREATED = "created"
+    COUNTERED = "countered"
+    ACCEPTED = "accepted"
+    REJECTED = "rejected"
+    EDITED = "edited"
+    EVENT_CHOICES = [
+        (CREATED, "Created"),
+        (COUNTERED, "Countered"),
+        (ACCEPTED, "Accepted"),
+        (REJECTED, "Rejected"),
+        (EDITED, "Edited"),
+    ]
+
+    offer = models.ForeignKey(Offer, on_delete=models.CASCADE, related_name="revisions")
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20)
+    by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # An offer's history in order
+            models.Index(fields=["offer", "id"], name="offer_revision_offer_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"Offer {self.offer_id} {self.event} at {self.price}"
+
+
+class Notification(models.Model):
+    """An event pushed to a user over ws/notifications/; the id is the client's resume cursor (see notifications.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications")
+    kind = models.CharField(max_length=40)
+    key = models.CharField(max_length=40)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Replay: a user's events after a cursor
+            models.Index(fields=["user", "id"], name="notification_user_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.user_id}"
+
+
 def generate_invoice_number():
     return f"INV-{uuid.uuid4().hex[:8].upper()}"
 
@@ -123,15 +233,95 @@ class Invoice(models.Model):
 
     def __str__(self):
         return f"Invoice {self.invoice_number} - {'Paid' if self.paid else 'Unpaid'}"
+
+
+class InvoiceJob(models.Model):
+    """Background work on an invoice, run by `manage.py runjobs` (see jobs.py)."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    DELIVER = "deliver"
+    KIND_CHOICES = [
+        (DELIVER, "Render and email PDF"),
+    ]
+
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name="jobs")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=DELIVER)
+    key = models.CharField(max_length=100, unique=True)  # idempotency key
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="invoice_job_status_run_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
 class Tracking(models.Model):
     package = models.OneToOneField(Package,on_delete=models.CASCADE,related_name='tracking')
     latitude = models.DecimalField(max_digits=9,decimal_places=6,null=True,blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    recorded_at = models.DateTimeField(null=True, blank=True)  # device time of the latest fix
     update_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f'Tracking for {self.package.title}'
 
+
+class TrackingPoint(models.Model):
+    """Append-only GPS history; Tracking keeps only the latest fix."""
+    package = models.ForeignKey(Package, on_delete=models.CASCADE, related_name='tracking_points')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    recorded_at = models.DateTimeField()
+    # Partition key: history is stored, scanned and pruned by UTC day
+    day = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["package", "recorded_at"], name="tracking_point_pkg_time_idx"),
+            models.Index(fields=["day"], name="tracking_point_day_idx"),
+        ]
+
+    def __str__(self):
+        return f'{self.package_id} @ {self.recorded_at:%Y-%m-%d %H:%M:%S}'
+
+
+class TrackSegment(models.Model):
+    """One UTC day of a package's path, simplified and delta-encoded (see trajectory.py)."""
+    package = models.ForeignKey(Package, on_delete=models.CASCADE, related_name='track_segments')
+    day = models.DateField()
+    start_at = models.DateTimeField()
+    end_at = models.DateTimeField()
+    point_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["package", "start_at"], name="track_segment_pkg_start_idx"),
+        ]
+
+    def __str__(self):
+        return f'{self.package_id} {self.day}: {self.point_count} points'
+
+
 class Vehicle(models.Model):
     transporter = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -148,6 +338,11 @@ class Vehicle(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    @property
+    def capacity_kg(self):
+        """Capacity is recorded in tonnes; package weights are in KG"""
+        return float(self.capacity) * 1000
+
     def __str__(self):
         return f"{self.truck_number} ({self.wheels} wheels)"
 
@@ -0,0 +1,94 @@
+"""
+Offer negotiation history and the per-package offer summary.
+
+An Offer row only holds the latest price, so every write to one also
+appends an OfferRevision: the full back-and-forth of a negotiation
+survives counter-offers. log() is also where the other side of the offer
+is notified (see notifications.py). Packages carry a denormalized summary of their
+offers:
+
+- offer_count: offers made on the package
+- best_offer_price: lowest price among offers still pending or accepted,
+  i.e. the cheapest way the owner can get the load moved
+- last_offer_at: when any of its offers last changed
+
+A new offer can only add to the count and lower the best price, so
+offer_created() moves the summary forward with one UPDATE of F()
+expressions. Counters, rejections and acceptances leave the count alone but
+can raise the best price; offers_changed() recomputes just that column from
+the package's live offers (an indexed lookup on offer.package_id) in the
+same UPDATE that stamps last_offer_at. refresh_summary() rebuilds all three
+columns and is used when offers are deleted. Package lists and the
+dashboard read the columns instead of aggregating the offers table.
+"""
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+
+from . import notifications
+from .models import Offer, OfferRevision, Package
+
+LIVE = ("pending", "accepted")
+
+
+def log(offer_ids, event, status, user=None, price=None):
+    """
+    Append a revision to each offer and notify the other party. With
+    price=None the offer's stored price is copied inside the INSERT, so
+    callers need not read it first.
+    """
+    now = timezone.now()
+    OfferRevision.objects.bulk_create([
+        OfferRevision(
+            offer_id=offer_id, event=event, status=status, by=user, created_at=now,
+            price=price if price is not None else Subquery(
+                Offer.objects.filter(id=offer_id).values("offer_price")[:1]
+            ),
+        )
+        for offer_id in offer_ids
+    ])
+    notifications.offers_changed(offer_ids, event, user)
+
+
+def offer_created(offer, user):
+    """Log a new offer and fold it into its package's summary"""
+    log([offer.id], OfferRevision.CREATED, offer.status, user, offer.offer_price)
+    Package.objects.filter(id=offer.package_id).update(
+        offer_count=F("offer_count") + 1,
+        best_offer_price=Least(Coalesce(F("best_offer_price"), Value(offer.offer_price)), Value(offer.offer_price)),
+        last_offer_at=offer.updated_at or timezone.now(),
+    )
+
+
+def _per_package():
+    return Offer.objects.filter(package=OuterRef("pk")).order_by().values("package")
+
+
+def _best_price():
+    return Subquery(
+        _per_package().filter(status__in=LIVE).annotate(best=Min("offer_price")).values("best")
+    )
+
+
+def _packages(package_ids=None, offer_ids=None):
+    packages = Package.objects.all()
+    if package_ids is not None:
+        packages = packages.filter(id__in=package_ids)
+    if offer_ids is not None:
+        packages = packages.filter(offers__id__in=offer_ids)
+    return packages
+
+
+def offers_changed(package_ids=None, offer_ids=None):
+    """Offers of these packages (or these offers) changed price or status"""
+    return _packages(package_ids, offer_ids).update(best_offer_price=_best_price(), last_offer_at=timezone.now())
+
+
+def refresh_summary(package_ids=None, offer_ids=None):
+    """Rebuild the whole summary of the given packages (all packages by default)"""
+    offers = _per_package()
+    return _packages(package_ids, offer_ids).update(
+        offer_count=Coalesce(Subquery(offers.annotate(n=Count("id")).values("n")), 0),
+        best_offer_price=_best_price(),
+        last_offer_at=Subquery(offers.annotate(last=Max("updated_at")).values("last")),
+    )
@@ -0,0 +1,164 @@
+"""
+Per-user notifications pushed over ws/notifications/.
+
+Offer and package transitions record typed events (offer.created,
+offer.countered, offer.accepted, offer.rejected, offer.edited,
+package.booked, package.loaded, ...) for the users on the other side of
+them. Every event is a Notification row, so its id is a cursor: a client
+that reconnects with ?after=<cursor> is replayed what it missed before it
+starts receiving live events.
+
+Events are published to the user's group once the surrounding transaction
+commits, one group_send per user per write. NotificationConsumer holds
+them for NOTIFICATIONS["window"] seconds and sends one frame per window,
+keeping only the newest event per offer or package, so a burst of counters
+on one offer reaches the client as a single update. A failed publish (the
+channel layer is down) is logged and does not fail the request: the rows
+are committed, and clients catch up from their cursor when they reconnect.
+
+Rows older than `retention_days` are deleted by `manage.py
+prune_notifications`; a client away for longer should resync.
+
+The cursor is not exact on PostgreSQL: ids are drawn at insert but rows
+become visible at commit, so a lower id can commit after a higher one. A
+connected client still receives such an event live, but a replay after it
+only reads ids above the cursor and can miss one whose transaction was open
+when the client disconnected. Events about one offer or package follow an
+UPDATE of its row, whose lock holds until commit, so they commit in id
+order; the gap is only between different objects, and a client that must
+not miss any of them should reload after a reconnect.
+"""
+import asyncio
+import datetime
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, Offer, Package
+
+DEFAULTS = {"window": 0.25, "replay_limit": 500, "retention_days": 30}
+PRUNE_BATCH = 5000
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "NOTIFICATIONS", {})}
+
+
+def notification_group(user_id):
+    return f"notifications_{user_id}"
+
+
+def as_event(notification):
+    return {
+        "id": notification.id,
+        "kind": notification.kind,
+        "key": notification.key,
+        "data": notification.data,
+        "created_at": notification.created_at.isoformat(),
+    }
+
+
+def notify(rows):
+    """
+    Record (user_id, kind, key, data) events and push them to their users
+    after the current transaction commits. key names the object the event
+    is about ("offer:12"); newer events for the same key supersede older ones.
+    """
+    notifications = Notification.objects.bulk_create([
+        Notification(user_id=user_id, kind=kind, key=key, data=data)
+        for user_id, kind, key, data in rows
+        if user_id is not None
+    ])
+    if notifications:
+        # robust: a channel layer error is logged instead of raised into
+        # the view, whose writes have already committed
+        transaction.on_commit(lambda: publish(notifications), robust=True)
+    return notifications
+
+
+def publish(notifications):
+    """One group_send per user, all from a single event-loop hop"""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    by_user = {}
+    for notification in notifications:
+        by_user.setdefault(notification.user_id, []).append(as_event(notification))
+
+    async def send_all():
+        await asyncio.gather(*(
+            layer.group_send(notification_group(user_id), {"type": "notify", "events": events})
+            for user_id, events in by_user.items()
+        ))
+
+    async_to_sync(send_all)()
+
+
+def offers_changed(offer_ids, event, user):
+    """Tell each offer's other party what `user` just did to it"""
+    offers = Offer.objects.filter(id__in=offer_ids).values_list(
+        "id", "package_id", "sender_id", "receiver_id", "offer_price", "status",
+    )
+    rows = []
+    for offer_id, package_id, sender_id, receiver_id, price, status in offers:
+        data = {"offer": offer_id, "package": package_id, "price": str(price), "status": status}
+        for user_id in {sender_id, receiver_id} - {user.id if user else None}:
+            rows.append((user_id, f"offer.{event}", f"offer:{offer_id}", data))
+    return notify(rows)
+
+
+def package_changed(package_id, status, user, owner_id=None, transporter_id=None):
+    """Tell the package's owner and transporter (other than `user`) about its new status"""
+    if owner_id is None:
+        owner_id, transporter_id = Package.objects.filter(id=package_id).values_list(
+            "user_id", "booked_by_id",
+        ).first() or (None, None)
+    data = {"package": package_id, "status": status}
+    return notify([
+        (user_id, f"package.{status.lower()}", f"package:{package_id}", data)
+        for user_id in {owner_id, transporter_id} - {user.id}
+    ])
+
+
+def coalesce(events):
+    """Keep the newest event per key, in cursor order"""
+    latest = {}
+    for event in events:
+        current = latest.get(event["key"])
+        if current is None or event["id"] > current["id"]:
+            latest[event["key"]] = event
+    return sorted(latest.values(), key=lambda event: event["id"])
+
+
+def missed(user_id, after, limit):
+    """Events after the cursor, oldest first; None if more than limit were missed"""
+    rows = list(Notification.objects.filter(user_id=user_id, id__gt=after).order_by("id")[:limit + 1])
+    if len(rows) > limit:
+        return None
+    return [as_event(row) for row in rows]
+
+
+def latest_cursor(user_id):
+    return Notification.objects.filter(user_id=user_id).order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def prune(retention_days=None):
+    """Delete notifications older than retention_days, PRUNE_BATCH rows per statement; returns the count"""
+    days = config()["retention_days"] if retention_days is None else retention_days
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    # Ids grow with created_at, so everything up to the newest expired id goes
+    last = (
+        Notification.objects.filter(created_at__lt=cutoff)
+        .order_by("-id").values_list("id", flat=True).first()
+    )
+    total = 0
+    while last is not None:
+        ids = list(Notification.objects.filter(id__lte=last).order_by("id").values_list("id", flat=True)[:PRUNE_BATCH])
+        if not ids:
+            break
+        deleted, _ = Notification.objects.filter(id__in=ids).delete()
+        total += deleted
+    return total
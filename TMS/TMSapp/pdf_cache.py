@@ -0,0 +1,84 @@
+"""
+Content-addressed cache of rendered invoice PDFs.
+
+A PDF is stored as <INVOICE_PDF_CACHE_DIR>/<invoice id>/<digest>.pdf, where
+the digest is a SHA-256 of every value printed on the invoice (plus
+RENDER_VERSION, bumped whenever generate_invoice_pdf changes its layout).
+The digest doubles as the download's ETag. Any change to a printed value
+gives a new digest, so a stale file is never served; signals still drop an
+invoice's directory when the invoice or its package is saved so old
+renders do not pile up.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .utils import generate_invoice_pdf
+
+RENDER_VERSION = 2
+
+
+def cache_dir():
+    return Path(getattr(settings, "INVOICE_PDF_CACHE_DIR", settings.BASE_DIR / "cache" / "invoices"))
+
+
+def printed_fields(invoice):
+    """Everything generate_invoice_pdf() draws; expects package__user and transporter loaded"""
+    owner = invoice.package.user
+    transporter = invoice.transporter
+    package = invoice.package
+    return [
+        RENDER_VERSION,
+        owner.company_name, owner.username, owner.email, owner.phone_no,
+        invoice.invoice_number, invoice.issue_at.strftime("%Y-%m-%d"), invoice.paid, str(invoice.amount),
+        transporter.username, transporter.email, transporter.phone_no,
+        package.title, package.pickup_location, package.drop_location, str(package.weight),
+    ]
+
+
+def digest(invoice):
+    payload = json.dumps(printed_fields(invoice), separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def pdf_path(invoice, etag=None):
+    return cache_dir() / str(invoice.pk) / f"{etag or digest(invoice)}.pdf"
+
+
+def get_pdf(invoice, etag=None):
+    """
+    Path of the invoice's rendered PDF, rendering it on a miss. The file is
+    written to a temporary name and renamed, so concurrent readers only
+    ever see a complete PDF.
+    """
+    path = pdf_path(invoice, etag)
+    if path.exists():
+        return path
+    return store_pdf(invoice, etag or digest(invoice), generate_invoice_pdf(invoice).getbuffer())
+
+
+def store_pdf(invoice, etag, data):
+    """Write an already rendered PDF into the cache; returns its path"""
+    path = pdf_path(invoice, etag)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+
+def invalidate(*invoice_ids):
+    """Drop every cached render of the given invoices"""
+    root = cache_dir()
+    for invoice_id in invoice_ids:
+        shutil.rmtree(root / str(invoice_id), ignore_errors=True)
@@ -1,7 +1,8 @@
-# from django.urls import re_path
-# from . import consumers
+from django.urls import re_path
+from . import consumers
 
-# websocket_urlpatterns = [
-#     re_path(r"ws/chat/(?P<package_id>\d+)/(?P<partner_id>\d+)/$",consumers.ChatConsumer.as_asgi()),
-#     re_path(r"ws/tracking/(?P<package_id>\d+)/$", consumers.TrackingConsumer.as_asgi()),
-# ]
\ No newline at end of file
+websocket_urlpatterns = [
+    re_path(r"ws/chat/(?P<package_id>\d+)/(?P<partner_id>\d+)/$",consumers.ChatConsumer.as_asgi()),
+    re_path(r"ws/tracking/(?P<package_id>\d+)/$", consumers.TrackingConsumer.as_asgi()),
+    re_path(r"ws/notifications/$", consumers.NotificationConsumer.as_asgi()),
+]
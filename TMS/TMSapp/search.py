@@ -0,0 +1,233 @@
+"""
+Full-text search over packages' title, description and locations.
+
+The words live in an inverted index next to the package table, so a
+search reads only the postings of its words instead of scanning every
+row with icontains:
+
+- SQLite: an FTS5 virtual table, package_search, with rowid = package id,
+  the unicode61 tokenizer (case and diacritics folded) and prefix indexes
+  for 2 and 3 characters. Hits are ranked by bm25, with the columns
+  weighted per COLUMN_WEIGHTS.
+- PostgreSQL: package_search(package_id, document tsvector) with a GIN
+  index. The title is weighted A, the locations B and the description C
+  ('simple' configuration, no stemming, since most words are place
+  names). Hits are ranked by ts_rank_cd.
+- Other databases fall back to icontains on every word.
+
+Every word in a query must match, and each word also matches as a
+prefix: "pun ste" finds "Pune steel coils". Filters (status, weight, the
+caller's visibility rules) come from a Package queryset that is joined to
+the index in the same statement. filter_text() matches the same way,
+optionally on some of the fields only and without ranking, as a plain
+queryset filter (the ?route= filter of FilterMixin).
+
+Ranking scores every candidate, so it costs time in proportion to the
+number of matches. Only the newest PACKAGE_SEARCH["rank_window"] visible
+matches are ranked. Rare words are unaffected. A word in a large share
+of all listings ranks among recent listings, which is what a marketplace
+wants anyway.
+
+The index is written in the saving transaction by signals.py. Writes that
+skip signals (bulk_create, QuerySet.update of text fields) need
+`manage.py rebuild_search_index`.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+TEXT_FIELDS = ("title", "description", "pickup_location", "drop_location")
+TABLE = "package_search"
+MAX_TERMS = 8
+# bm25 weights, in TEXT_FIELDS order
+COLUMN_WEIGHTS = (10.0, 1.0, 4.0, 4.0)
+
+# Letters and digits; everything else (punctuation, underscores, query
+# syntax of either backend) separates words
+WORD = re.compile(r"[^\W_]+")
+
+# tsvector weight labels per field, as set by PG_DOCUMENT
+PG_WEIGHTS = {"title": "A", "pickup_location": "B", "drop_location": "B", "description": "C"}
+PG_DOCUMENT = (
+    "setweight(to_tsvector('simple', {title}), 'A') || "
+    "setweight(to_tsvector('simple', {pickup} || ' ' || {drop}), 'B') || "
+    "setweight(to_tsvector('simple', {description}), 'C')"
+)
+
+
+DEFAULTS = {"rank_window": 10_000}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "PACKAGE_SEARCH", {})}
+
+
+def terms(query):
+    return [word.lower() for word in WORD.findall(query or "")][:MAX_TERMS]
+
+
+def _fts_match(words, fields=TEXT_FIELDS):
+    match = " ".join(f'"{word}"*' for word in words)
+    if tuple(fields) == TEXT_FIELDS:
+        return match
+    return f"{{{' '.join(fields)}}} : ({match})"
+
+
+def _tsquery(words, fields=TEXT_FIELDS):
+    labels = "".join(sorted({PG_WEIGHTS[field] for field in fields}))
+    if len(labels) == 3:
+        labels = ""
+    return " & ".join(f"{word}:*{labels}" for word in words)
+
+
+def _contains(words, fields=TEXT_FIELDS):
+    matches = Q()
+    for word in words:
+        either = Q()
+        for field in fields:
+            either |= Q(**{f"{field}__icontains": word})
+        matches &= either
+    return matches
+
+
+# -------------------
+# SCHEMA (rebuild_search_index; migration 0026 keeps its own copy)
+# -------------------
+def create_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {TABLE} USING fts5({', '.join(TEXT_FIELDS)}, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            f'CREATE TABLE {TABLE} (package_id bigint PRIMARY KEY REFERENCES "TMSapp_package" (id) '
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)"
+        )
+        schema_editor.execute(f"CREATE INDEX {TABLE}_document_idx ON {TABLE} USING GIN (document)")
+
+
+def drop_index(schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def rebuild():
+    """Re-index every package in one statement; returns the number indexed"""
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {TABLE}")
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, {', '.join(TEXT_FIELDS)}) "
+                f'SELECT id, {", ".join(TEXT_FIELDS)} FROM "TMSapp_package"'
+            )
+        elif connection.vendor == "postgresql":
+            document = PG_DOCUMENT.format(title="title", pickup="pickup_location", drop="drop_location", description="description")
+            cursor.execute(f"TRUNCATE {TABLE}")
+            cursor.execute(f'INSERT INTO {TABLE} (package_id, document) SELECT id, {document} FROM "TMSapp_package"')
+        else:
+            return 0
+        return cursor.rowcount
+
+
+# -------------------
+# WRITES (signals.py)
+# -------------------
+def index(package):
+    values = [getattr(package, field) or "" for field in TEXT_FIELDS]
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [package.id])
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, {', '.join(TEXT_FIELDS)}) VALUES (%s, %s, %s, %s, %s)",
+                [package.id, *values],
+            )
+        elif connection.vendor == "postgresql":
+            document = PG_DOCUMENT.format(title="%s", pickup="%s", drop="%s", description="%s")
+            title, description, pickup, drop = values
+            cursor.execute(
+                f"INSERT INTO {TABLE} (package_id, document) VALUES (%s, {document}) "
+                "ON CONFLICT (package_id) DO UPDATE SET document = EXCLUDED.document",
+                [package.id, title, pickup, drop, description],
+            )
+
+
+def remove(*package_ids):
+    if not package_ids:
+        return
+    column = {"sqlite": "rowid", "postgresql": "package_id"}.get(connection.vendor)
+    if column is None:
+        return
+    placeholders = ", ".join(["%s"] * len(package_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE {column} IN ({placeholders})", list(package_ids))
+
+
+# -------------------
+# QUERIES
+# -------------------
+def search(queryset, query, limit=20, offset=0):
+    """
+    [(package id, rank)] of the rows of `queryset` matching every word of
+    `query`, best first. Higher ranks are better; the scale is the backend's.
+    """
+    words = terms(query)
+    if not words:
+        return []
+    vendor = connection.vendor
+    base_sql, base_params = queryset.order_by().values("id").query.sql_with_params()
+
+    window = config()["rank_window"]
+    if vendor == "sqlite":
+        match = _fts_match(words)
+        weights = ", ".join(str(weight) for weight in COLUMN_WEIGHTS)
+        # FTS5 yields matches in rowid order without sorting, and bm25 is
+        # only computed for the rows the inner query emits
+        sql = (
+            f"SELECT id, score FROM (SELECT {TABLE}.rowid AS id, bm25({TABLE}, {weights}) AS score FROM {TABLE} "
+            f"JOIN ({base_sql}) AS visible ON visible.id = {TABLE}.rowid "
+            f"WHERE {TABLE} MATCH %s ORDER BY {TABLE}.rowid DESC LIMIT %s) "
+            "ORDER BY score, id LIMIT %s OFFSET %s"
+        )
+        params = [*base_params, match, window, limit, offset]
+    elif vendor == "postgresql":
+        sql = (
+            f"WITH recent AS (SELECT s.package_id, s.document FROM {TABLE} s "
+            f"JOIN ({base_sql}) AS visible ON visible.id = s.package_id "
+            "WHERE s.document @@ to_tsquery('simple', %s) ORDER BY s.package_id DESC LIMIT %s) "
+            "SELECT package_id, -ts_rank_cd(document, to_tsquery('simple', %s)) AS score FROM recent "
+            "ORDER BY score, package_id LIMIT %s OFFSET %s"
+        )
+        tsquery = _tsquery(words)
+        params = [*base_params, tsquery, window, tsquery, limit, offset]
+    else:
+        ids = queryset.filter(_contains(words)).order_by("-id").values_list("id", flat=True)[offset:offset + limit]
+        return [(package_id, None) for package_id in ids]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        # Both backends sort ascending on a negated relevance
+        return [(package_id, round(-score, 4)) for package_id, score in cursor.fetchall()]
+
+
+def filter_text(queryset, query, fields=TEXT_FIELDS):
+    """
+    `queryset` narrowed to the rows whose `fields` contain every word of
+    `query` (as prefixes), through the index; unranked, order unchanged
+    """
+    words = terms(query)
+    if not words:
+        return queryset
+    if connection.vendor == "sqlite":
+        ids = RawSQL(f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [_fts_match(words, fields)])
+    elif connection.vendor == "postgresql":
+        ids = RawSQL(
+            f"SELECT package_id FROM {TABLE} WHERE document @@ to_tsquery('simple', %s)", [_tsquery(words, fields)]
+        )
+    else:
+        return queryset.filter(_contains(words, fields))
+    return queryset.filter(id__in=ids)
@@ -3,7 +3,8 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework.exceptions import AuthenticationFailed
-from .models import Package, Chat_Message, Offer, Invoice, Tracking, Vehicle, Staff
+from .models import Package, Chat_Message, ChatRoom, Offer, OfferRevision, Invoice, InvoiceJob, Tracking, Vehicle, Staff
+from . import thumbnails
 
 User = get_user_model()
 
@@ -70,6 +71,7 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         token = super().get_token(user)
         token['is_owner'] = user.is_owner
         token['is_transporter'] = user.is_transporter
+        token['ver'] = user.token_version
         return token
 
     def validate(self, attrs):
@@ -96,21 +98,39 @@ class SafeUserSerializer(serializers.ModelSerializer):
 # -------------------
 class PublicPackageSerializer(serializers.ModelSerializer):
     """Minimal package data for marketplace & dashboards (no sensitive user info)."""
-    images = serializers.ImageField(required=False, allow_null=True)
+    # URLs come from the precomputed variant map (see thumbnails.py)
+    images = serializers.ImageField(required=False, allow_null=True, use_url=False)
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Package
         fields = [
             "id", "title", "pickup_location", "drop_location",
-            "weight", "price_expectation", "images",
-            "status", "create_at","description"
+            "weight", "price_expectation", "images", "image_srcset",
+            "status", "create_at","description",
+            "offer_count", "best_offer_price", "last_offer_at",
         ]
+        read_only_fields = ["offer_count", "best_offer_price", "last_offer_at"]
+
+    def __init__(self, *args, **kwargs):
+        # Optional projection: only emit the requested fields
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_image_srcset(self, instance):
+        return thumbnails.represent(instance, self.context)[1]
 
     def to_representation(self, instance):
         rep = super().to_representation(instance)
-        request = self.context.get("request")
-        if instance.images and request:
-            rep["images"] = request.build_absolute_uri(instance.images.url)
+        if "images" in rep:
+            rep["images"] = thumbnails.represent(instance, self.context)[0]
+        # Present when the marketplace was searched by proximity
+        for key in ("pickup_distance_km", "drop_distance_km"):
+            if hasattr(instance, key):
+                rep[key] = round(getattr(instance, key), 2)
         return rep
 
 
@@ -121,21 +141,25 @@ class PackageSerializer(serializers.ModelSerializer):
     """
     user = SafeUserSerializer(read_only=True)
     booked_by = SafeUserSerializer(read_only=True)
-    images = serializers.ImageField(required=False, allow_null=True)
+    images = serializers.ImageField(required=False, allow_null=True, use_url=False)
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Package
         fields = [
             "id", "user", "booked_by", "title", "description",
             "pickup_location", "drop_location", "weight",
-            "price_expectation", "images", "status", "create_at"
+            "price_expectation", "images", "image_srcset", "status", "create_at",
+            "offer_count", "best_offer_price", "last_offer_at",
         ]
+        read_only_fields = ["offer_count", "best_offer_price", "last_offer_at"]
+
+    def get_image_srcset(self, instance):
+        return thumbnails.represent(instance, self.context)[1]
 
     def to_representation(self, instance):
         rep = super().to_representation(instance)
-        request = self.context.get("request")
-        if instance.images and request:
-            rep["images"] = request.build_absolute_uri(instance.images.url)
+        rep["images"] = thumbnails.represent(instance, self.context)[0]
         return rep
 
 
@@ -164,6 +188,31 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class ChatRoomSummarySerializer(serializers.ModelSerializer):
+    """Inbox row: partner, last message and the viewer's unread count."""
+    package_title = serializers.CharField(source="package.title", read_only=True)
+    partner = serializers.SerializerMethodField()
+    last_message = ChatMessageSerializer(read_only=True)
+    unread = serializers.SerializerMethodField()
+    last_read_id = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ChatRoom
+        fields = ["id", "package", "package_title", "partner", "last_message", "unread", "last_read_id"]
+
+    def _is_owner(self, obj):
+        return obj.owner_id == self.context["request"].user.id
+
+    def get_partner(self, obj):
+        return SafeUserSerializer(obj.transporter if self._is_owner(obj) else obj.owner).data
+
+    def get_unread(self, obj):
+        return obj.owner_unread if self._is_owner(obj) else obj.transporter_unread
+
+    def get_last_read_id(self, obj):
+        return obj.owner_last_read_id if self._is_owner(obj) else obj.transporter_last_read_id
+
+
 # -------------------
 # INVOICE
 # -------------------
@@ -174,14 +223,24 @@ class InvoiceSerializer(serializers.ModelSerializer):
         read_only_fields = ["invoice_number", "issue_at"]
 
 
+class InvoiceJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InvoiceJob
+        fields = [
+            "id", "invoice", "kind", "status", "attempts", "max_attempts",
+            "run_after", "last_error", "created_at", "finished_at",
+        ]
+        read_only_fields = fields
+
+
 # -------------------
 # TRACKING
 # -------------------
 class TrackingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tracking
-        fields = ["id", "package", "latitude", "longitude", "update_at"]
-        read_only_fields = ["id", "update_at"]
+        fields = ["id", "package", "latitude", "longitude", "recorded_at", "update_at"]
+        read_only_fields = ["id", "recorded_at", "update_at"]
 
 
 # -------------------
@@ -207,6 +266,14 @@ class OfferSerializer(serializers.ModelSerializer):
         return Offer.objects.create(**validated_data)
 
 
+class OfferRevisionSerializer(serializers.ModelSerializer):
+    by = SafeUserSerializer(read_only=True)
+
+    class Meta:
+        model = OfferRevision
+        fields = ["id", "event", "price", "status", "by", "created_at"]
+
+
 # -------------------
 # VEHICLE
 # -------------------
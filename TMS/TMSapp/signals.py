@@ -0,0 +1,95 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import dashboard, matching, negotiation, pdf_cache, search
+from .authentication import user_cache
+from .models import Invoice, Offer, Package, User
+
+
+def _package_owner(package_id):
+    return Package.objects.filter(id=package_id).values_list("user_id", flat=True).first()
+
+
+# -------------------
+# DASHBOARD SNAPSHOTS
+# -------------------
+@receiver([post_save, post_delete], sender=Package)
+def package_changed(sender, instance, **kwargs):
+    dashboard.invalidate(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Offer)
+@receiver([post_save, post_delete], sender=Invoice)
+def package_child_changed(sender, instance, **kwargs):
+    dashboard.invalidate(_package_owner(instance.package_id))
+
+
+# -------------------
+# LOAD MATCHING
+# -------------------
+@receiver([post_save, post_delete], sender=Package)
+def package_matching_changed(sender, instance, **kwargs):
+    matching.touch(instance.id)
+
+
+# -------------------
+# FULL-TEXT SEARCH
+# -------------------
+@receiver(post_save, sender=Package)
+def package_search_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(search.TEXT_FIELDS) & set(update_fields):
+        return
+    search.index(instance)
+
+
+@receiver(post_delete, sender=Package)
+def package_search_deleted(sender, instance, **kwargs):
+    search.remove(instance.id)
+
+
+# -------------------
+# OFFER SUMMARY
+# -------------------
+@receiver(post_delete, sender=Offer)
+def offer_deleted(sender, instance, **kwargs):
+    negotiation.refresh_summary(package_ids=[instance.package_id])
+
+
+# -------------------
+# INVOICE PDF CACHE
+# -------------------
+@receiver([post_save, post_delete], sender=Invoice)
+def invoice_changed(sender, instance, **kwargs):
+    pdf_cache.invalidate(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Package)
+def package_invoices_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    pdf_cache.invalidate(*instance.invoices.values_list("id", flat=True))
+
+
+# -------------------
+# JWT USER CACHE
+# -------------------
+TOKEN_FIELDS = ("is_active", "is_owner", "is_transporter", "is_staff", "is_superuser")
+
+
+@receiver(pre_save, sender=User)
+def revoke_tokens_on_role_change(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields is not None and not set(TOKEN_FIELDS) & set(update_fields)):
+        return
+    stored = User.objects.filter(pk=instance.pk).values_list("token_version", *TOKEN_FIELDS).first()
+    if stored is None:
+        return
+    if stored[1:] != tuple(getattr(instance, field) for field in TOKEN_FIELDS):
+        instance.token_version = stored[0] + 1
+        if update_fields is not None:
+            # This save only writes update_fields; store the new version directly
+            User.objects.filter(pk=instance.pk).update(token_version=instance.token_version)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    user_cache().evict(instance.pk)
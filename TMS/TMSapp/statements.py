@@ -0,0 +1,308 @@
+"""
+Bulk invoicing and monthly statements.
+
+create_invoices() turns a set of an owner's packages into invoices with a
+fixed number of queries, all in one transaction: one to lock the packages
+(select_for_update, so two requests cannot both find a package without an
+invoice), one to check eligibility (ownership, a booked transporter, no
+invoice yet) and price every package, one bulk_create for the invoices and
+one for their delivery jobs (see jobs.py). Amounts given by the caller
+must be positive and fit Invoice.amount, or the request is refused.
+
+For statements, render_many() fills the PDF cache (see pdf_cache.py) across
+one process pool per web process, created on first use and capped at
+STATEMENTS["workers"] processes (and the CPUs the process may use), so
+concurrent requests share the workers instead of each starting their own.
+The workers come from a forkserver, not a fork of the threaded web process.
+statement_pdf() draws a single summary PDF for a month and stream_zip()
+streams the month's invoice PDFs as a ZIP without building it in memory.
+"""
+import datetime
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+import django
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils.dateparse import parse_date
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from rest_framework.exceptions import ValidationError
+
+from . import dashboard, jobs, pdf_cache
+from .models import Invoice, InvoiceJob, Offer, Package, generate_invoice_number
+from .utils import generate_invoice_pdf
+
+MAX_BULK_INVOICES = 5000
+DEFAULTS = {"workers": 4}
+
+_executor = None
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "STATEMENTS", {})}
+
+
+# -------------------
+# BULK GENERATION
+# -------------------
+def select_packages(owner, data):
+    """The owner's packages named by "package_ids" or matched by "filter" in a bulk request"""
+    package_ids = data.get("package_ids")
+    filters = data.get("filter")
+    if bool(package_ids) == bool(filters):
+        raise ValidationError({"detail": "Send either package_ids or filter."})
+
+    qs = Package.objects.filter(user=owner)
+    if package_ids:
+        if not isinstance(package_ids, list) or len(package_ids) > MAX_BULK_INVOICES:
+            raise ValidationError({"package_ids": f"Expected a list of at most {MAX_BULK_INVOICES} ids."})
+        try:
+            return qs.filter(id__in={int(i) for i in package_ids})
+        except (TypeError, ValueError):
+            raise ValidationError({"package_ids": "Expected integer ids."})
+
+    if not isinstance(filters, dict):
+        raise ValidationError({"filter": "Expected an object."})
+    qs = qs.filter(status=filters.get("status", "Delivered"))
+    for key, lookup in (("created_after", "create_at__gte"), ("created_before", "create_at__lte")):
+        if filters.get(key):
+            day = parse_date(str(filters[key]))
+            if day is None:
+                raise ValidationError({key: "Expected a YYYY-MM-DD date."})
+            qs = qs.filter(**{lookup: day})
+    return qs
+
+
+def parse_amounts(amounts):
+    """{"package id": Decimal} from a request's "amounts", or a 400 naming the bad entries"""
+    if amounts is None:
+        return {}
+    if not isinstance(amounts, dict):
+        raise ValidationError({"amounts": "Expected an object of package id: amount."})
+    field = Invoice._meta.get_field("amount")
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+    cent = Decimal(1).scaleb(-field.decimal_places)
+    parsed, errors = {}, {}
+    for key, value in amounts.items():
+        try:
+            amount = Decimal(str(value)).quantize(cent)
+            valid = not isinstance(value, bool) and amount.is_finite() and 0 < amount < limit
+        except InvalidOperation:
+            valid = False
+        if valid:
+            parsed[str(key)] = amount
+        else:
+            errors[str(key)] = f"Expected a positive amount below {limit}."
+    if errors:
+        raise ValidationError({"amounts": errors})
+    return parsed
+
+
+def create_invoices(owner, packages, amounts=None):
+    """
+    Invoice every eligible package in `packages` and queue their emails.
+
+    A package's amount is amounts[str(id)] when given, else its latest
+    accepted offer, else its price expectation. Returns (invoices, skipped)
+    where skipped maps package id to the reason it was left out.
+    """
+    amounts = parse_amounts(amounts)
+    accepted_price = (
+        Offer.objects.filter(package=OuterRef("pk"), status="accepted")
+        .order_by("-updated_at").values("offer_price")[:1]
+    )
+    now = datetime.datetime.now(datetime.timezone.utc)
+    max_attempts = jobs.config()["max_attempts"]
+    with transaction.atomic():
+        # Invoices are looked up by a second statement, after the locks are
+        # held, so it sees those committed by whoever held them before
+        locked = list(packages.select_for_update().values_list("id", flat=True)[:MAX_BULK_INVOICES + 1])
+        if len(locked) > MAX_BULK_INVOICES:
+            raise ValidationError({"detail": f"At most {MAX_BULK_INVOICES} packages per request."})
+        rows = (
+            Package.objects.filter(id__in=locked).annotate(
+                invoiced=Exists(Invoice.objects.filter(package=OuterRef("pk"))),
+                accepted_price=Subquery(accepted_price),
+            )
+            .values_list("id", "booked_by_id", "invoiced", "accepted_price", "price_expectation")
+        )
+
+        invoices, skipped = [], {}
+        for package_id, transporter_id, invoiced, accepted, expected in rows:
+            if invoiced:
+                skipped[package_id] = "Invoice already exists for this package"
+                continue
+            if transporter_id is None:
+                skipped[package_id] = "Package has no transporter"
+                continue
+            amount = amounts.get(str(package_id), accepted if accepted is not None else expected)
+            invoices.append(Invoice(
+                package_id=package_id, transporter_id=transporter_id,
+                amount=Decimal(str(amount)).quantize(Decimal("0.01")),
+                invoice_number=generate_invoice_number(), issue_at=now,
+            ))
+
+        invoices = Invoice.objects.bulk_create(invoices)
+        InvoiceJob.objects.bulk_create([
+            InvoiceJob(
+                invoice=invoice, kind=InvoiceJob.DELIVER, max_attempts=max_attempts,
+                key=jobs.job_key(invoice.pk, InvoiceJob.DELIVER),
+            )
+            for invoice in invoices
+        ])
+    # bulk_create skips post_save, which is what normally drops the snapshot
+    if invoices:
+        dashboard.invalidate(owner.id)
+    return invoices, skipped
+
+
+# -------------------
+# PARALLEL RENDERING
+# -------------------
+def _render(invoice):
+    return invoice.pk, generate_invoice_pdf(invoice).getvalue()
+
+
+def workers():
+    """Pool size: the configured workers, but no more than the CPUs this process may use"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, min(config()["workers"], cpus))
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        # A fork of the web process would copy locks held by its other
+        # threads; forkserver children start clean and set Django up from
+        # DJANGO_SETTINGS_MODULE before any invoice is unpickled. They only
+        # draw and hand the bytes back, the parent does all file writes.
+        _executor = ProcessPoolExecutor(
+            max_workers=workers(),
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=django.setup,
+        )
+    return _executor
+
+
+def render_many(invoices, parallel=None):
+    """
+    Make sure every invoice has a cached PDF, rendering the misses in the
+    process pool (unless parallel=False, or there is one CPU or one miss).
+    Invoices need package__user and transporter loaded. Returns {invoice id: path}.
+    """
+    paths, missing = {}, {}
+    for invoice in invoices:
+        digest = pdf_cache.digest(invoice)
+        path = pdf_cache.pdf_path(invoice, digest)
+        paths[invoice.pk] = path
+        if not path.exists():
+            missing[invoice.pk] = (invoice, digest)
+    if not missing:
+        return paths
+
+    if parallel is None:
+        parallel = workers() > 1 and len(missing) > 1
+    if not parallel or "forkserver" not in multiprocessing.get_all_start_methods():
+        rendered = map(_render, [invoice for invoice, _ in missing.values()])
+    else:
+        rendered = _pool().map(
+            _render, [invoice for invoice, _ in missing.values()],
+            chunksize=max(1, len(missing) // (workers() * 4)),
+        )
+    for invoice_id, data in rendered:
+        invoice, digest = missing[invoice_id]
+        pdf_cache.store_pdf(invoice, digest, data)
+    return paths
+
+
+# -------------------
+# STATEMENTS
+# -------------------
+def month_range(value):
+    """(first instant, first instant of the next month) for "YYYY-MM" """
+    try:
+        start = datetime.datetime.strptime(value, "%Y-%m").replace(tzinfo=datetime.timezone.utc)
+    except (TypeError, ValueError):
+        raise ValidationError({"month": "Expected YYYY-MM."})
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def statement_pdf(owner, month, invoices):
+    """One PDF listing the month's invoices with their total"""
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    def header():
+        p.setFont("Helvetica-Bold", 20)
+        p.drawString(50, height - 50, owner.company_name or owner.username)
+        p.setFont("Helvetica", 12)
+        p.drawString(50, height - 75, f"Statement for {month}")
+        p.setFont("Helvetica-Bold", 11)
+        y = height - 110
+        for x, label in ((50, "Invoice #"), (150, "Date"), (230, "Package"), (400, "Transporter"), (510, "Amount")):
+            p.drawString(x, y, label)
+        p.setFont("Helvetica", 10)
+        return y - 18
+
+    y = header()
+    total = Decimal("0")
+    for invoice in invoices:
+        if y < 70:
+            p.showPage()
+            y = header()
+        p.drawString(50, y, invoice.invoice_number)
+        p.drawString(150, y, invoice.issue_at.strftime("%Y-%m-%d"))
+        p.drawString(230, y, (invoice.package.title or "Untitled")[:28])
+        p.drawString(400, y, (invoice.transporter.username if invoice.transporter else "N/A")[:18])
+        p.drawRightString(width - 30, y, f"₹{invoice.amount}")
+        total += invoice.amount
+        y -= 16
+
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(50, max(y - 10, 40), f"{len(invoices)} invoices")
+    p.drawRightString(width - 30, max(y - 10, 40), f"Total: ₹{total}")
+    p.setFont("Helvetica-Oblique", 9)
+    p.setFillColor(colors.grey)
+    p.drawString(50, 25, "Generated by TMSapp")
+    p.showPage()
+    p.save()
+    buffer.seek(0)
+    return buffer
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(invoices, paths):
+    """Yield a ZIP of the invoices' cached PDFs one member at a time"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for invoice in invoices:
+            archive.write(paths[invoice.pk], arcname=f"invoice_{invoice.invoice_number}.pdf")
+            yield sink.drain()
+    yield sink.drain()
@@ -1,3 +1,1668 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import importlib
+import io
+import json
+import tempfile
+import threading
+import zipfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import (
+    User, Package, Offer, OfferRevision, Invoice, InvoiceJob, ChatRoom, Chat_Message, Vehicle, Staff,
+    Notification, Tracking, TrackingPoint, TrackSegment,
+)
+from . import consolidation, dashboard, geo, jobs, matching, notifications, pdf_cache, statements, trajectory
+from .broker import Broker
+from .buffers import get_buffer, lifespan
+from .channel_layer import ShardedChannelLayer
+from .authentication import user_cache
+from .invoice_render import render_invoice
+from .serializers import MyTokenObtainPairSerializer
+from .tracking import parse_points, update_latest
+from .views import InvoiceViewSet, MarketplaceViewSet, Packageviewset
+
+
+class QueryCountTests(TestCase):
+    """
+    Every list endpoint must issue a fixed number of queries, however many
+    rows it returns. A failing test here usually means a serializer started
+    touching a relation that the viewset's prefetch_plan does not load.
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        self.client = APIClient()
+        self.rows = 0
+
+    def add_rows(self, n):
+        for _ in range(n):
+            i = self.rows
+            self.rows += 1
+            package = Package.objects.create(
+                user=self.owner, booked_by=self.transporter, title=f"Load {i}",
+                description="d", pickup_location="Pune", drop_location="Mumbai",
+                weight=100, price_expectation=1000, status="Booked",
+            )
+            Package.objects.create(
+                user=self.owner, booked_by=self.transporter, title=f"Loaded {i}",
+                description="d", pickup_location="Pune", drop_location="Mumbai",
+                weight=100, price_expectation=1000, status="Loaded",
+            )
+            Offer.objects.create(
+                package=package, sender=self.transporter, receiver=self.owner, offer_price=900,
+            )
+            Invoice.objects.create(package=package, transporter=self.transporter, amount=900)
+            room = ChatRoom.objects.create(package=package, owner=self.owner, transporter=self.transporter)
+            Chat_Message.objects.create(room=room, sender=self.owner, message="hi")
+            Chat_Message.objects.create(room=room, sender=self.transporter, message="hello")
+            vehicle = Vehicle.objects.create(
+                transporter=self.transporter, truck_number=f"MH12-{i}", capacity=10,
+            )
+            Staff.objects.create(
+                transporter=self.transporter, vehicle=vehicle, name=f"Driver {i}",
+                contact="9999999999", role="driver",
+            )
+            Staff.objects.create(
+                transporter=self.transporter, vehicle=vehicle, name=f"Helper {i}",
+                contact="9999999999", role="helper",
+            )
+
+    def count_queries(self, user, url):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, url)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, user, url, expected):
+        self.add_rows(1)
+        small = self.count_queries(user, url)
+        self.add_rows(4)
+        large = self.count_queries(user, url)
+        self.assertEqual(small, expected, f"{url}: {small} queries for 1 row")
+        self.assertEqual(large, expected, f"{url}: {large} queries for 5 rows")
+
+    def test_packages(self):
+        self.assertConstantQueries(self.owner, "/api/packages/", 1)
+
+    def test_current_deliveries(self):
+        self.assertConstantQueries(self.transporter, "/api/packages/current_deliveries/", 1)
+
+    def test_loaded(self):
+        self.assertConstantQueries(self.transporter, "/api/packages/loaded/", 1)
+
+    def test_offers(self):
+        self.assertConstantQueries(self.owner, "/api/offers/", 1)
+
+    def test_my_offers(self):
+        self.assertConstantQueries(self.transporter, "/api/offers/my_offers/", 1)
+
+    def test_chat_messages(self):
+        self.assertConstantQueries(self.owner, "/api/chatmessages/", 1)
+
+    def test_ongoing_chats(self):
+        self.assertConstantQueries(self.owner, "/api/chatmessages/ongoing/", 1)
+
+    def test_invoices(self):
+        self.assertConstantQueries(self.owner, "/api/invoices/", 1)
+
+    def test_vehicles(self):
+        self.assertConstantQueries(self.transporter, "/api/vehicles/", 1)
+
+    def test_staff(self):
+        self.assertConstantQueries(self.transporter, "/api/staff/", 1)
+
+    def test_staff_by_vehicle(self):
+        # vehicles + drivers prefetch + helpers prefetch
+        self.assertConstantQueries(self.transporter, "/api/staff/by-vehicle/", 3)
+
+
+@override_settings(INVOICE_PDF_CACHE_DIR=tempfile.mkdtemp(prefix="tms-test-pdf-"))
+class InvoiceJobTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", email="o@example.com", password="x", is_owner=True)
+        self.transporter = User.objects.create_user(
+            "transporter", email="t@example.com", password="x", is_transporter=True,
+        )
+        self.package = Package.objects.create(
+            user=self.owner, booked_by=self.transporter, title="Load", description="d",
+            pickup_location="Pune", drop_location="Mumbai", weight=100,
+            price_expectation=1000, status="Delivered",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def generate(self):
+        return self.client.post(
+            "/api/invoices/generate/", {"package_id": self.package.id, "amount": 900}, format="json",
+        )
+
+    def test_generate_queues_instead_of_sending(self):
+        response = self.generate()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(response.data["job"]["status"], InvoiceJob.QUEUED)
+
+        self.assertEqual(jobs.work(burst=True), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].attachments[0][2], "application/pdf")
+        status = self.client.get(response["Location"])
+        self.assertEqual(status.data["status"], InvoiceJob.DONE)
+
+    def test_generate_rejects_an_unbooked_package(self):
+        Package.objects.filter(id=self.package.id).update(booked_by=None, status="Available")
+        response = self.generate()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "Package has no transporter")
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_enqueue_is_idempotent(self):
+        invoice = Invoice.objects.create(package=self.package, transporter=self.transporter, amount=900)
+        first, created = jobs.enqueue(invoice)
+        again, created_again = jobs.enqueue(invoice)
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(first.id, again.id)
+
+    def test_failures_back_off_then_fail(self):
+        invoice = Invoice.objects.create(package=self.package, transporter=self.transporter, amount=900)
+        job, _ = jobs.enqueue(invoice)
+        InvoiceJob.objects.filter(id=job.id).update(max_attempts=2)
+
+        with mock.patch.object(jobs, "send_invoice_email", side_effect=OSError("smtp down")):
+            self.assertEqual(jobs.work(burst=True), 1)
+            job.refresh_from_db()
+            self.assertEqual(job.status, InvoiceJob.QUEUED)
+            self.assertGreater(job.run_after, job.created_at)
+            self.assertEqual(jobs.work(burst=True), 0)   # not due yet
+
+            InvoiceJob.objects.filter(id=job.id).update(run_after=job.created_at)
+            self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, InvoiceJob.FAILED)
+        self.assertIn("smtp down", job.last_error)
+
+
+@override_settings(INVOICE_PDF_CACHE_DIR=tempfile.mkdtemp(prefix="tms-test-pdf-"))
+class InvoicePdfCacheTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x", is_owner=True)
+        transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        self.package = Package.objects.create(
+            user=owner, booked_by=transporter, title="Load", description="d",
+            pickup_location="Pune", drop_location="Mumbai", weight=100,
+            price_expectation=1000, status="Delivered",
+        )
+        self.invoice = Invoice.objects.create(package=self.package, transporter=transporter, amount=900)
+        self.url = f"/api/invoices/{self.invoice.id}/download_pdf/"
+        self.client = APIClient()
+        self.client.force_authenticate(owner)
+
+    def download(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        if response.status_code == 200:
+            b"".join(response.streaming_content)
+        return response
+
+    def test_repeat_downloads_render_once(self):
+        with mock.patch.object(pdf_cache, "generate_invoice_pdf", wraps=pdf_cache.generate_invoice_pdf) as render:
+            first = self.download()
+            second = self.download()
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first["ETag"], second["ETag"])
+
+        revalidated = self.download(if_none_match=first["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_long_tables_break_pages(self):
+        invoice = Invoice.objects.select_related("package__user", "transporter").get()
+        one = render_invoice(invoice).getvalue()
+        many = render_invoice(invoice, rows=[("Load", "Pune", "Mumbai", "1 kg", "1")] * 60).getvalue()
+        self.assertTrue(one.startswith(b"%PDF") and one.rstrip().endswith(b"%%EOF"))
+        self.assertEqual(one.count(b"/Type /Page "), 1)
+        self.assertEqual(many.count(b"/Type /Page "), 3)
+
+    def test_printed_changes_invalidate(self):
+        etag = self.download()["ETag"]
+
+        self.client.post(f"/api/invoices/{self.invoice.id}/mark_paid/")
+        self.assertEqual(self.download(if_none_match=etag).status_code, 200)
+        paid_etag = self.download()["ETag"]
+        self.assertNotEqual(paid_etag, etag)
+
+        self.package.title = "Renamed load"
+        self.package.save()
+        self.assertFalse((pdf_cache.cache_dir() / str(self.invoice.id)).exists())
+        self.assertNotEqual(self.download()["ETag"], paid_etag)
+
+
+@override_settings(INVOICE_PDF_CACHE_DIR=tempfile.mkdtemp(prefix="tms-test-pdf-"))
+class BulkInvoiceTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        self.packages = [
+            Package.objects.create(
+                user=self.owner, booked_by=self.transporter, title=f"Load {i}", description="d",
+                pickup_location="Pune", drop_location="Mumbai", weight=100,
+                price_expectation=1000, status="Delivered",
+            )
+            for i in range(4)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_bulk_generate_skips_ineligible(self):
+        first, second, *_ = self.packages
+        Invoice.objects.create(package=first, transporter=self.transporter, amount=900)
+        second.booked_by = None
+        second.save()
+        Offer.objects.create(package=self.packages[2], sender=self.transporter, offer_price=750, status="accepted")
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                "/api/invoices/bulk_generate/", {"filter": {"status": "Delivered"}}, format="json",
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(set(response.data["skipped"]), {first.id, second.id})
+        amounts = {i["package"]: str(i["amount"]) for i in response.data["invoices"]}
+        self.assertEqual(amounts, {self.packages[2].id: "750.00", self.packages[3].id: "1000.00"})
+        self.assertEqual(InvoiceJob.objects.count(), 2)
+        self.assertLess(len(ctx.captured_queries), 12)
+
+    def test_bulk_generate_rejects_bad_amounts(self):
+        first, second, *_ = self.packages
+        for amounts in (
+            [first.id, 900],
+            {str(first.id): "-5"},
+            {str(first.id): "1e9"},
+            {str(first.id): "NaN"},
+            {str(first.id): "900", str(second.id): "abc"},
+        ):
+            response = self.client.post(
+                "/api/invoices/bulk_generate/", {"package_ids": [first.id, second.id], "amounts": amounts},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 400, amounts)
+        self.assertEqual(response.data["amounts"], {str(second.id): "Expected a positive amount below 100000000."})
+        self.assertFalse(Invoice.objects.exists())
+
+        response = self.client.post(
+            "/api/invoices/bulk_generate/",
+            {"package_ids": [first.id], "amounts": {str(first.id): "99999999.99"}}, format="json",
+        )
+        self.assertEqual(response.data["invoices"][0]["amount"], Decimal("99999999.99"))
+
+    def test_render_many_shares_one_pool(self):
+        self.client.post(
+            "/api/invoices/bulk_generate/", {"package_ids": [p.id for p in self.packages]}, format="json",
+        )
+        invoices = list(Invoice.objects.select_related("package__user", "transporter").order_by("id"))
+        with override_settings(STATEMENTS={"workers": 2}):
+            paths = statements.render_many(invoices[:2], parallel=True)
+            pool = statements._pool()
+            paths.update(statements.render_many(invoices[2:], parallel=True))
+            self.assertIs(statements._pool(), pool)
+        self.assertEqual(set(paths), {invoice.id for invoice in invoices})
+        self.assertTrue(all(path.read_bytes().startswith(b"%PDF") for path in paths.values()))
+
+    def test_statement_zip(self):
+        self.client.post(
+            "/api/invoices/bulk_generate/", {"package_ids": [p.id for p in self.packages]}, format="json",
+        )
+        month = Invoice.objects.first().issue_at.strftime("%Y-%m")
+        response = self.client.get(f"/api/invoices/statement/?month={month}&output=zip")
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(len(archive.namelist()), 4)
+        self.assertTrue(archive.read(archive.namelist()[0]).startswith(b"%PDF"))
+
+        pdf = self.client.get(f"/api/invoices/statement/?month={month}")
+        self.assertEqual(pdf.status_code, 200)
+        self.assertTrue(b"".join(pdf.streaming_content).startswith(b"%PDF"))
+
+
+@override_settings(INVOICE_PDF_CACHE_DIR=tempfile.mkdtemp(prefix="tms-test-pdf-"))
+class TransitionTests(TestCase):
+    """Status transitions are a single targeted UPDATE when they succeed"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        self.stranger = User.objects.create_user("stranger", password="x", is_transporter=True)
+        self.package = Package.objects.create(
+            user=self.owner, booked_by=self.transporter, title="Load", description="d",
+            pickup_location="Pune", drop_location="Mumbai", weight=100,
+            price_expectation=1000, status="Booked",
+        )
+        self.client = APIClient()
+
+    def post(self, user, url, data=None):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, data or {}, format="json")
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        return response, writes
+
+    def test_mark_loaded(self):
+        url = f"/api/packages/{self.package.id}/mark_loaded/"
+        self.assertEqual(self.post(self.stranger, url)[0].status_code, 403)
+
+        response, writes = self.post(self.transporter, url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], "Loaded")
+        self.assertEqual(len(writes), 1)
+        self.assertNotIn("images", writes[0])
+
+        self.assertEqual(self.post(self.transporter, url)[0].status_code, 409)
+
+    def test_book_is_scoped_to_other_owners_transporters(self):
+        self.package.status = "Available"
+        self.package.booked_by = None
+        self.package.save()
+        url = f"/api/packages/{self.package.id}/book/"
+        other_owner = User.objects.create_user("other-owner", password="x", is_owner=True)
+        self.assertEqual(self.post(other_owner, url)[0].status_code, 404)
+        self.owner.is_transporter = True
+        self.owner.save()
+        self.assertEqual(self.post(self.owner, url)[0].status_code, 403)
+        self.package.refresh_from_db()
+        self.assertIsNone(self.package.booked_by_id)
+
+        response, writes = self.post(self.stranger, url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(w.startswith('UPDATE "TMSapp_package"') for w in writes), 1)
+        self.assertEqual(self.post(self.transporter, url)[0].status_code, 409)
+
+    def test_counter(self):
+        self.package.status = "Available"
+        self.package.booked_by = None
+        self.package.save()
+        offer = Offer.objects.create(
+            package=self.package, sender=self.transporter, receiver=self.owner, offer_price=900,
+        )
+        url = f"/api/offers/{offer.id}/counter/"
+        self.assertEqual(self.post(self.stranger, url, {"offer_price": 800})[0].status_code, 404)
+
+        response, writes = self.post(self.owner, url, {"offer_price": 950})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(w.startswith('UPDATE "TMSapp_offer"') for w in writes), 1)
+        offer.refresh_from_db()
+        self.assertEqual((offer.offer_price, offer.changed_by_owner), (950, True))
+
+    def test_mark_paid_is_idempotent(self):
+        invoice = Invoice.objects.create(package=self.package, transporter=self.transporter, amount=900)
+        url = f"/api/invoices/{invoice.id}/mark_paid/"
+        for _ in range(2):
+            response, _ = self.post(self.owner, url)
+            self.assertEqual(response.status_code, 200)
+        invoice.refresh_from_db()
+        self.assertTrue(invoice.paid)
+        self.assertEqual(self.post(self.transporter, url)[0].status_code, 404)
+
+
+class NegotiationTests(TestCase):
+    """Offer writes are logged and kept in the package's offer summary"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.carriers = [
+            User.objects.create_user(f"carrier{i}", password="x", is_transporter=True) for i in range(2)
+        ]
+        self.package = Package.objects.create(
+            user=self.owner, title="Load", description="d", pickup_location="Pune",
+            drop_location="Mumbai", weight=100, price_expectation=1000,
+        )
+        self.client = APIClient()
+
+    def offer(self, carrier, price):
+        self.client.force_authenticate(carrier)
+        response = self.client.post("/api/offers/", {"package_id": self.package.id, "offer_price": price}, format="json")
+        self.assertEqual(response.status_code, 201)
+        return response.data["id"]
+
+    def summary(self):
+        self.package.refresh_from_db()
+        return self.package.offer_count, self.package.best_offer_price
+
+    def test_summary_and_history(self):
+        first = self.offer(self.carriers[0], 900)
+        self.offer(self.carriers[1], 950)
+        self.assertEqual(self.summary(), (2, 900))
+
+        # The owner pushes the best bid up; the best price follows
+        self.client.force_authenticate(self.owner)
+        self.client.post(f"/api/offers/{first}/counter/", {"offer_price": 980}, format="json")
+        self.assertEqual(self.summary(), (2, 950))
+
+        self.client.force_authenticate(self.carriers[0])
+        self.client.post(f"/api/offers/{first}/counter/", {"offer_price": 920}, format="json")
+        response = self.client.get(f"/api/offers/{first}/history/")
+        self.assertEqual(
+            [(r["event"], r["price"]) for r in response.data],
+            [("created", "900.00"), ("countered", "980.00"), ("countered", "920.00")],
+        )
+
+        self.client.force_authenticate(self.owner)
+        self.client.post(f"/api/offers/{first}/reject/")
+        self.assertEqual(self.summary(), (2, 950))
+        self.assertEqual(
+            list(OfferRevision.objects.filter(offer_id=first).values_list("event", "price").order_by("-id")[:1]),
+            [("rejected", 920)],
+        )
+
+        Offer.objects.filter(id=first).delete()
+        self.assertEqual(self.summary(), (1, 950))
+        self.assertEqual(dashboard.compute_snapshot(self.owner)["total_offers"], 1)
+
+
+class CachedJWTTests(TestCase):
+    """Authenticated requests reuse the cached user row until its token version moves"""
+
+    def setUp(self):
+        user_cache().clear()
+        self.user = User.objects.create_user("owner", password="x", is_owner=True)
+        self.client = APIClient()
+
+    def login(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {MyTokenObtainPairSerializer.get_token(self.user).access_token}")
+
+    def get_me(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/users/")
+        return response, len(ctx.captured_queries)
+
+    def test_cached_user_and_revocation(self):
+        self.login()
+        self.assertEqual(self.get_me()[1], 1)
+        response, queries = self.get_me()
+        self.assertEqual((response.status_code, response.data["is_owner"], queries), (200, True, 0))
+
+        # A role change bumps the version: the old token stops working
+        self.user.is_owner = False
+        self.user.is_transporter = True
+        self.user.save()
+        self.assertEqual(self.get_me()[0].status_code, 401)
+        self.user.refresh_from_db()
+        self.login()
+        self.assertEqual(self.get_me()[0].data["is_transporter"], True)
+
+        # Profile edits keep existing tokens valid
+        self.user.company_name = "Acme"
+        self.user.save()
+        self.assertEqual(self.get_me()[0].data["company_name"], "Acme")
+
+        self.user.is_active = False
+        self.user.save(update_fields=["is_active"])
+        self.assertEqual(self.get_me()[0].status_code, 401)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix="tms-test-media-"), PACKAGE_IMAGES={"eager": True})
+class PackageImageTests(TestCase):
+    """Uploads are normalized to WebP with thumbnails, and listed without per-row URL building"""
+
+    def upload(self):
+        image = Image.new("RGB", (400, 200), "red")
+        exif = Image.Exif()
+        exif[0x0112] = 6    # rotate 90 degrees clockwise to display
+        exif[0x010F] = "PhoneMaker"
+        out = io.BytesIO()
+        image.save(out, "JPEG", exif=exif)
+        return SimpleUploadedFile("photo.jpg", out.getvalue(), content_type="image/jpeg")
+
+    def test_upload_pipeline(self):
+        owner = User.objects.create_user("owner", password="x", is_owner=True)
+        client = APIClient()
+        client.force_authenticate(owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post("/api/packages/", {
+                "title": "Load", "description": "d", "pickup_location": "Pune", "drop_location": "Mumbai",
+                "weight": 100, "price_expectation": 1000, "images": self.upload(),
+            }, format="multipart")
+        self.assertEqual(response.status_code, 201)
+
+        package = Package.objects.get()
+        self.assertTrue(package.images.name.endswith(".webp"))
+        with package.images.open("rb") as stored, Image.open(stored) as image:
+            self.assertEqual((image.format, image.size), ("WEBP", (200, 400)))
+            self.assertFalse(image.getexif())
+        self.assertEqual(sorted(package.image_variants["urls"]), ["160", "full"])
+        self.assertEqual(list((Path(settings.MEDIA_ROOT) / "packages").glob("*.jpg")), [])
+
+        with CaptureQueriesContext(connection) as ctx:
+            rows = client.get("/api/packages/").data
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertTrue(rows[0]["images"].startswith("http://testserver/media/packages/"))
+        self.assertEqual(sorted(rows[0]["image_srcset"]), ["160w", "200w"])
+
+
+class ChatSyncTests(TestCase):
+    """Inbox counters follow new messages and read markers; sync sends only what is new"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        package = Package.objects.create(
+            user=self.owner, title="Load", description="d", pickup_location="Pune",
+            drop_location="Mumbai", weight=100, price_expectation=1000,
+        )
+        self.room = ChatRoom.objects.create(package=package, owner=self.owner, transporter=self.transporter)
+        self.client = APIClient()
+
+    def say(self, user, text):
+        self.client.force_authenticate(user)
+        return self.client.post("/api/chatmessages/", {"room": self.room.id, "message": text}, format="json").data["id"]
+
+    def inbox(self, user, since=""):
+        self.client.force_authenticate(user)
+        return self.client.get("/api/chatmessages/sync/", {"since": since}).data
+
+    def read(self, user, last_read_id):
+        self.client.force_authenticate(user)
+        return self.client.post("/api/chatmessages/read/", {"room": self.room.id, "last_read_id": last_read_id})
+
+    def test_sync_sends_newer_messages_and_unread_counts(self):
+        first = self.say(self.transporter, "hi")
+        second = self.say(self.transporter, "still there?")
+        reply = self.say(self.owner, "yes")
+
+        data = self.inbox(self.owner, f"{self.room.id}:{first}")
+        self.assertEqual(data["rooms"][0]["unread"], 2)
+        self.assertEqual(data["rooms"][0]["last_message"]["message"], "yes")
+        page = data["messages"][str(self.room.id)]
+        self.assertEqual([m["id"] for m in page["messages"]], [second, reply])
+        self.assertFalse(page["has_more"])
+        self.assertEqual(self.inbox(self.owner)["messages"], {})
+        self.assertEqual(self.inbox(self.transporter)["rooms"][0]["unread"], 1)
+
+        with mock.patch("TMSapp.views.SYNC_PAGE", 1):
+            page = self.inbox(self.owner, f"{self.room.id}:0")["messages"][str(self.room.id)]
+        self.assertEqual(([m["id"] for m in page["messages"]], page["has_more"]), ([first], True))
+        self.assertEqual(self.client.get("/api/chatmessages/sync/", {"since": "x:1"}).status_code, 400)
+
+    def test_read_moves_the_marker_forward_only(self):
+        first = self.say(self.transporter, "hi")
+        second = self.say(self.transporter, "still there?")
+        self.say(self.owner, "yes")
+
+        self.assertEqual(self.read(self.owner, first).data, {"room": self.room.id, "unread": 1})
+        # An older marker neither moves back nor recounts what was read
+        self.assertEqual(self.read(self.owner, 0).data["unread"], 1)
+        self.assertEqual(self.read(self.owner, second).data["unread"], 0)
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.owner_last_read_id, self.room.owner_unread), (second, 0))
+        self.assertEqual(self.room.transporter_unread, 1)
+
+        self.assertEqual(self.read(self.owner, "abc").status_code, 400)
+        stranger = User.objects.create_user("stranger", password="x", is_transporter=True)
+        self.assertEqual(self.read(stranger, second).status_code, 404)
+
+
+class MarketplacePaginationTests(TestCase):
+    """The marketplace is paged by a (create_at, id) cursor, newest first"""
+
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.ids = [
+            Package.objects.create(
+                user=owner, title=f"Load {i}", description="d", pickup_location="Pune",
+                drop_location="Mumbai", weight=100, price_expectation=1000,
+            ).id
+            for i in range(5)
+        ]
+        Package.objects.create(
+            user=owner, title="Taken", description="d", pickup_location="Pune",
+            drop_location="Mumbai", weight=100, price_expectation=1000, status="Booked",
+        )
+        self.client = APIClient()
+
+    def test_cursor_walks_every_listing_once(self):
+        seen = []
+        url = "/api/marketplace/?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            seen += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(seen, self.ids[::-1])
+
+    def test_fields_projection(self):
+        response = self.client.get("/api/marketplace/", {"fields": "id,title"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([set(row) for row in response.data["results"]], [{"id", "title"}] * 5)
+        response = self.client.get("/api/marketplace/", {"fields": "id,user"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("user", response.data["fields"])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/marketplace/", {"cursor": "not-a-cursor"}).status_code, 404)
+
+
+class GeoTests(TestCase):
+    """Geohash cells narrow a proximity search before the exact distance check"""
+
+    def test_geohash_encode(self):
+        self.assertEqual(geo.geohash_encode(42.6, -5.6, 5), "ezs42")
+        self.assertEqual(geo.geohash_encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(geo.geohash_encode(18.52043, 73.856744), geo.geohash_encode(18.52043, 73.856744, 12)[:8])
+
+    def test_covering_cells_cover_the_circle(self):
+        rng = np.random.default_rng(11)
+        for latitude, longitude, radius in [(18.52, 73.86, 50), (0.01, 179.99, 30), (64.1, -21.9, 5), (28.7, 77.1, 400)]:
+            cells = geo.covering_cells(latitude, longitude, radius)
+            self.assertLessEqual(len(cells), geo.MAX_COVER_CELLS)
+            # Points inside the circle, up to its rim, fall in one of the cells
+            for bearing, fraction in zip(rng.uniform(0, 2 * np.pi, 200), np.sqrt(rng.uniform(0, 1, 200))):
+                d = radius * fraction / geo.EARTH_RADIUS_KM
+                lat = np.degrees(np.arcsin(np.sin(np.radians(latitude)) * np.cos(d) + np.cos(np.radians(latitude)) * np.sin(d) * np.cos(bearing)))
+                lon = longitude + np.degrees(np.arctan2(
+                    np.sin(bearing) * np.sin(d) * np.cos(np.radians(latitude)),
+                    np.cos(d) - np.sin(np.radians(latitude)) * np.sin(np.radians(lat)),
+                ))
+                point = geo.geohash_encode(float(lat), float((lon + 180) % 360 - 180))
+                self.assertTrue(any(point.startswith(cell) for cell in cells), (latitude, longitude, radius))
+
+    def test_within_radius(self):
+        owner = User.objects.create_user("owner", password="x", is_owner=True)
+        ids = {
+            city: Package.objects.create(
+                user=owner, title="Load", description="d", pickup_location=city,
+                drop_location="Delhi", weight=100, price_expectation=1000,
+            ).id
+            for city in ("Pune", "Mumbai", "Nashik", "Nowhere")
+        }
+        packages = Package.objects.all()
+
+        def near(radius):
+            rows = geo.within_radius(packages, 18.52, 73.86, radius).order_by("pickup_distance_km")
+            return [(row.id, round(row.pickup_distance_km)) for row in rows]
+
+        self.assertEqual(near(20), [(ids["Pune"], 0)])
+        self.assertEqual([row for row, _ in near(170)], [ids["Pune"], ids["Mumbai"], ids["Nashik"]])
+        self.assertEqual(near(170)[1][1], round(geo.haversine_km(18.52, 73.86, 19.075984, 72.877656)))
+
+    def test_geocoding_migration_matches_the_geocoder(self):
+        from django.apps import apps
+        migration = importlib.import_module("TMSapp.migrations.0017_package_geocoding")
+        owner = User.objects.create_user("owner", password="x", is_owner=True)
+        for pickup in ("Pune", "Andheri East, Mumbai", "Nowhere"):
+            Package.objects.create(
+                user=owner, title="Load", description="d", pickup_location=pickup,
+                drop_location="Nashik", weight=100, price_expectation=1000,
+            )
+        fields = sorted(geo.GEO_FIELDS)
+        expected = list(Package.objects.order_by("id").values_list(*fields))
+        Package.objects.update(**dict.fromkeys(fields))
+        with mock.patch.object(migration, "BATCH", 2):
+            migration.geocode_existing(apps, None)
+        self.assertEqual(list(Package.objects.order_by("id").values_list(*fields)), expected)
+
+
+class MatchingTests(TestCase):
+    """Fleet suggestions come from the in-memory book, which follows package changes"""
+
+    def setUp(self):
+        matching.reset()
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        self.small = Vehicle.objects.create(transporter=self.transporter, truck_number="MH12-1", capacity=1)
+        self.large = Vehicle.objects.create(transporter=self.transporter, truck_number="MH12-2", capacity=10)
+        Vehicle.objects.create(transporter=self.transporter, truck_number="MH12-3", capacity=10, available=False)
+        self.near = self.package("Pune", "Mumbai", 800, 8000)
+        self.heavy = self.package("Pune", "Mumbai", 6000, 30000)
+        self.far = self.package("Nashik", "Mumbai", 900, 9000)
+        self.package("Pune", "Mumbai", 500, 9000, status="Booked")
+        self.client = APIClient()
+        self.client.force_authenticate(self.transporter)
+
+    def package(self, pickup, drop, weight, price, status="Available"):
+        return Package.objects.create(
+            user=self.owner, title="Load", description="d", pickup_location=pickup,
+            drop_location=drop, weight=weight, price_expectation=price, status=status,
+        )
+
+    def suggestions(self):
+        response = self.client.get("/api/vehicles/matches/", {"origin": "18.52,73.85"})
+        self.assertEqual(response.status_code, 200)
+        return {row["vehicle"]: [item["package"] for item in row["matches"]] for row in response.data}
+
+    def test_fleet_suggestions_follow_status_changes(self):
+        ranked = self.suggestions()
+        self.assertEqual(set(ranked), {self.small.id, self.large.id})
+        self.assertEqual(ranked[self.small.id], [self.near.id, self.far.id])
+        self.assertEqual(ranked[self.large.id][0], self.heavy.id)
+
+        book = matching.current_book()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/packages/{self.near.id}/book/")
+        self.assertEqual(self.suggestions()[self.small.id], [self.far.id])
+        # Applied from the journal, not rebuilt
+        self.assertIs(matching.current_book(), book)
+        self.assertEqual(len(book), 2)
+
+    def test_journal_keeps_entries_when_sequence_numbers_collide(self):
+        cache.set(matching.SEQ_KEY, 1, None)
+        cache.set(matching._entry_key(2), [self.far.id])
+        # Another process drew 2 as well; this one must move on to 3
+        matching._journal([self.near.id])
+        self.assertEqual(cache.get(matching._entry_key(2)), [self.far.id])
+        self.assertEqual(cache.get(matching._entry_key(3)), [self.near.id])
+        self.assertEqual(cache.get(matching.SEQ_KEY), 3)
+
+    def test_journal_sequence_outlives_the_default_timeout(self):
+        for _ in range(3):
+            matching._journal([self.near.id])
+        later = timezone.now() + datetime.timedelta(seconds=settings.CACHES["default"].get("TIMEOUT", 300) + 60)
+        with mock.patch("django.core.cache.backends.db.tz_now", return_value=later):
+            self.assertEqual(cache.get(matching.SEQ_KEY), 3)
+
+    def test_pruned_ranking_matches_exhaustive_scoring(self):
+        rng = np.random.default_rng(7)
+        weight = rng.uniform(10, 12_000, 5000)
+        base = rng.uniform(0, 0.6, 5000)
+        base[rng.random(5000) < 0.1] = -np.inf
+        capacities = np.array([500.0, 1000.0, 9000.0, 25_000.0])
+        for capacity, (indices, scores) in zip(capacities, matching.rank_capacities(capacities, weight, base, 0.4, 10)):
+            exhaustive = np.where(weight <= capacity, base + 0.4 * weight / capacity, -np.inf)
+            np.testing.assert_allclose(scores, np.sort(exhaustive)[::-1][:10])
+            np.testing.assert_allclose(exhaustive[indices], scores)
+
+
+class ConsolidationTests(TestCase):
+    """Packages on one corridor are packed into as few loads as fit the vehicle"""
+
+    def test_vehicle_plan(self):
+        owner = User.objects.create_user("owner", password="x", is_owner=True)
+        transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        other = User.objects.create_user("other", password="x", is_transporter=True)
+        truck = Vehicle.objects.create(transporter=transporter, truck_number="MH12-10", capacity=20, wheels=10)
+
+        def package(pickup, weight):
+            return Package.objects.create(
+                user=owner, title="Load", description="d", pickup_location=pickup,
+                drop_location="Mumbai", weight=weight, price_expectation=1000,
+            ).id
+
+        first = [package("Pune", 9000), package("Pune", 7000), package("Pune", 3000)]
+        second = [package("Pune", 2500), package("Pune", 1500)]
+        package("Nashik", 1000)
+        package("Pune", 25_000)
+
+        client = APIClient()
+        client.force_authenticate(other)
+        self.assertEqual(client.get(f"/api/vehicles/{truck.id}/consolidate/").status_code, 404)
+        client.force_authenticate(transporter)
+        loads = client.get(f"/api/vehicles/{truck.id}/consolidate/").data["loads"]
+        self.assertEqual([[p["id"] for p in load["packages"]] for load in loads], [first, second])
+        self.assertEqual((loads[0]["weight"], loads[0]["utilization"]), (19000, 0.95))
+
+    def test_process_pool_packs_like_serial(self):
+        rng = np.random.default_rng(5)
+        groups = {
+            (f"c{c}", "d"): [(c * 1000 + i, float(w)) for i, w in enumerate(rng.uniform(100, 8000, 200))]
+            for c in range(6)
+        }
+        serial = consolidation.pack(groups, 20_000, parallel=False)
+        self.assertEqual(sorted(consolidation.pack(groups, 20_000, parallel=True)), sorted(serial))
+        for _, total, _ in serial:
+            self.assertLessEqual(total, 20_000)
+        self.assertEqual(sorted(i for _, _, ids in serial for i in ids), sorted(i for items in groups.values() for i, _ in items))
+
+
+class SearchTests(TestCase):
+    """Package search reads the inverted index, ranked, with prefixes and filters"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.other = User.objects.create_user("other", password="x", is_owner=True)
+        self.coils = self.package(self.owner, "Steel coils", "Hot rolled", "Pune", 5000)
+        self.bales = self.package(self.owner, "Cotton bales", "Banded with steel straps", "Pune", 800)
+        self.pipes = self.package(self.other, "Steel pipes", "Seamless", "Nashik", 9000)
+        self.package(self.owner, "Steel beams", "Booked already", "Pune", 3000, status="Booked")
+        self.client = APIClient()
+
+    def package(self, user, title, description, pickup, weight, status="Available"):
+        return Package.objects.create(
+            user=user, title=title, description=description, pickup_location=pickup,
+            drop_location="Mumbai", weight=weight, price_expectation=1000, status=status,
+        )
+
+    def ids(self, url, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+        return [item["id"] for item in response.data["results"]]
+
+    def test_marketplace_search(self):
+        url = "/api/marketplace/search/"
+        # Title matches rank above description matches; booked packages are not listed
+        found = self.ids(url, {"q": "STE"})
+        self.assertEqual((set(found[:2]), found[2:]), ({self.coils.id, self.pipes.id}, [self.bales.id]))
+        self.assertEqual(self.ids(url, {"q": "pun steel"}), [self.coils.id, self.bales.id])
+        self.assertEqual(self.ids(url, {"q": "steel", "min_weight": 1000, "max_weight": 6000}), [self.coils.id])
+        self.assertEqual(self.client.get(url, {"q": "  *  "}).status_code, 400)
+
+        self.coils.title = "Aluminium coils"
+        self.coils.save()
+        self.pipes.delete()
+        self.assertEqual(self.ids(url, {"q": "steel"}), [self.bales.id])
+        self.assertEqual(self.ids(url, {"q": "alumin"}), [self.coils.id])
+
+    def test_owner_search_is_scoped(self):
+        self.client.force_authenticate(self.owner)
+        found = self.ids("/api/packages/search/", {"q": "steel", "status": "Available,Booked"})
+        self.assertEqual(len(found), 3)
+        self.assertNotIn(self.pipes.id, found)
+
+
+class PackageFilterTests(TestCase):
+    """Whitelisted filters and sorting on package lists, each served by an index"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        self.light = self.package("Pune", "Mumbai", 200, 900)
+        self.heavy = self.package("Pune", "Nashik", 9000, 40000, status="Booked")
+        self.mid = self.package("Nagpur", "Pune", 3000, 15000)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def package(self, pickup, drop, weight, price, status="Available"):
+        return Package.objects.create(
+            user=self.owner, title="Load", description="-", pickup_location=pickup, drop_location=drop,
+            weight=weight, price_expectation=price, status=status,
+        )
+
+    def ids(self, params):
+        response = self.client.get("/api/packages/", params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [item["id"] for item in response.data]
+
+    def test_filters_and_sorting(self):
+        self.assertEqual(self.ids({"status": "Booked"}), [self.heavy.id])
+        self.assertEqual(self.ids({"min_weight": 1000, "ordering": "weight"}), [self.mid.id, self.heavy.id])
+        self.assertEqual(self.ids({"max_price": 20000, "ordering": "-price"}), [self.mid.id, self.light.id])
+        self.assertEqual(self.ids({"route": "pune mum"}), [self.light.id])
+        self.assertEqual(set(self.ids({"route": "pune", "created_after": "2000-01-01"})), {
+            self.light.id, self.heavy.id, self.mid.id})
+        self.assertEqual(self.ids({"created_before": "2000-01-01"}), [])
+
+        for params in ({"status": "Lost"}, {"ordering": "title"}, {"min_price": "cheap"}, {"created_after": "May"}):
+            self.assertEqual(self.client.get("/api/packages/", params).status_code, 400, params)
+
+    @skipUnless(connection.vendor == "sqlite", "reads SQLite's EXPLAIN QUERY PLAN")
+    def test_every_filter_uses_an_index(self):
+        values = {
+            "status": "Booked", "created_after": "2026-01-01", "created_before": "2026-12-31",
+            "min_weight": "10", "max_weight": "10", "min_price": "5", "max_price": "5", "route": "pune",
+        }
+        # Index expected to serve each filter on open listings
+        listing_index = {
+            "status": "package_status_created_idx", "created_after": "package_status_created_idx",
+            "created_before": "package_status_created_idx", "min_weight": "package_status_weight_idx",
+            "max_weight": "package_status_weight_idx", "min_price": "package_status_price_idx",
+            "max_price": "package_status_price_idx", "route": "package_search",
+        }
+        scopes = [
+            (Packageviewset, self.owner, "package_user_status_idx"),
+            (Packageviewset, self.transporter, None),
+            (MarketplaceViewSet, self.transporter, None),
+        ]
+        for viewset, user, scope_index in scopes:
+            for name in viewset.filter_fields:
+                request = Request(APIRequestFactory().get("/", {name: values[name]}))
+                request.user = user
+                view = viewset(request=request, action="list", format_kwarg=None, kwargs={})
+                plan = view.filter_queryset(view.get_queryset()).explain()
+                with self.subTest(viewset=viewset.__name__, user=user.username, filter=name):
+                    self.assertNotIn("SCAN TMSapp_package", plan)
+                    self.assertIn(scope_index or listing_index[name], plan)
+
+
+class ExportTests(TestCase):
+    """Bulk exports stream value rows from one query, as NDJSON or CSV"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        other = User.objects.create_user("other", password="x", is_owner=True)
+        self.packages = [
+            Package.objects.create(
+                user=self.owner, title=title, description="-", pickup_location="Pune", drop_location="Mumbai",
+                weight=100 * (i + 1), price_expectation="1250.50", status=status,
+            )
+            for i, (title, status) in enumerate([
+                ("Steel coils", "Available"), ("=HYPERLINK(\"x\")", "Available"), ("Rice", "Booked"),
+            ])
+        ]
+        Package.objects.create(
+            user=other, title="Not mine", description="-", pickup_location="Pune", drop_location="Mumbai",
+            weight=1, price_expectation=1,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def fetch(self, url, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+            self.assertTrue(response.streaming)
+            body = b"".join(response.streaming_content).decode()
+        # One query for the rows, however many chunks they stream in
+        self.assertEqual(len(ctx.captured_queries), 1)
+        return response, body
+
+    @override_settings(EXPORT={"chunk_size": 2})
+    def test_package_export(self):
+        response, body = self.fetch("/api/packages/export/", {"ordering": "weight"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertIn('filename="packages_', response["Content-Disposition"])
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [package.id for package in self.packages])
+        self.assertEqual(rows[0]["owner"], "owner")
+        self.assertEqual(rows[0]["price_expectation"], "1250.50")
+        self.assertEqual(rows[0]["create_at"], self.packages[0].create_at.isoformat())
+
+        _, body = self.fetch("/api/packages/export/", {"output": "csv", "status": "Available", "ordering": "weight"})
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([row["title"] for row in rows], ["Steel coils", "'=HYPERLINK(\"x\")"])
+        self.assertEqual(rows[0]["transporter"], "")
+
+        self.assertEqual(self.client.get("/api/packages/export/", {"output": "xlsx"}).status_code, 400)
+
+    @override_settings(EXPORT={"chunk_size": 2})
+    async def test_export_streams_chunks_under_asgi(self):
+        headers = {"authorization": f"Bearer {AccessToken.for_user(self.owner)}"}
+        with mock.patch("TMSapp.utils.ASYNC_STREAM_BYTES", 1):
+            response = await AsyncClient().get("/api/packages/export/", {"ordering": "weight"}, headers=headers)
+            self.assertTrue(response.is_async)
+            parts = [part async for part in response.streaming_content]
+        # One part per chunk of rows, read as the response is sent
+        self.assertEqual(len(parts), 2)
+        rows = [json.loads(line) for line in b"".join(parts).decode().splitlines()]
+        self.assertEqual([row["id"] for row in rows], [package.id for package in self.packages])
+
+    def test_invoice_export(self):
+        paid = Invoice.objects.create(package=self.packages[2], transporter=self.transporter, amount=900, paid=True)
+        unpaid = Invoice.objects.create(package=self.packages[0], transporter=self.transporter, amount=500)
+        month = paid.issue_at.strftime("%Y-%m")
+
+        _, body = self.fetch("/api/invoices/export/", {"output": "csv", "month": month})
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual({row["invoice_number"] for row in rows}, {paid.invoice_number, unpaid.invoice_number})
+        self.assertEqual({row["transporter"] for row in rows}, {"transporter"})
+
+        _, body = self.fetch("/api/invoices/export/", {"paid": "false"})
+        self.assertEqual([json.loads(line)["id"] for line in body.splitlines()], [unpaid.id])
+
+        # Invoices are listed to the package owner: only a header for anyone else
+        self.client.force_authenticate(self.transporter)
+        _, body = self.fetch("/api/invoices/export/", {"output": "csv", "month": month})
+        self.assertEqual(body.splitlines(), [",".join(InvoiceViewSet.export_columns)])
+
+
+class TrackingTests(TestCase):
+    """Positions are written only by the package's transporter, through ingest"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        self.stranger = User.objects.create_user("stranger", password="x", is_transporter=True)
+        self.package = Package.objects.create(
+            user=self.owner, booked_by=self.transporter, title="Load", description="-",
+            pickup_location="Pune", drop_location="Mumbai", weight=100, price_expectation=1000, status="Loaded",
+        )
+        self.client = APIClient()
+
+    def ingest(self, user, points):
+        self.client.force_authenticate(user)
+        return self.client.post("/api/tracking/ingest/", {"points": points}, format="json")
+
+    def test_only_the_transporter_moves_a_package(self):
+        point = {"package": self.package.id, "latitude": 18.5, "longitude": 73.8}
+        self.client.force_authenticate(self.stranger)
+        self.assertEqual(self.client.post("/api/tracking/", point, format="json").status_code, 405)
+        self.assertEqual(self.ingest(self.stranger, [point]).status_code, 403)
+        self.assertFalse(Tracking.objects.exists())
+
+        self.assertEqual(self.ingest(self.transporter, [point]).status_code, 201)
+        tracking = Tracking.objects.get(package=self.package)
+        self.client.force_authenticate(self.stranger)
+        self.assertEqual(self.client.get(f"/api/tracking/{tracking.id}/").status_code, 404)
+        self.assertEqual(self.client.patch(f"/api/tracking/{tracking.id}/", {"latitude": 1}).status_code, 405)
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get(f"/api/tracking/{tracking.id}/").data["latitude"], "18.500000")
+
+
+    def test_parse_points(self):
+        points = parse_points([
+            {"package": "7", "latitude": "18.5", "longitude": 73.8, "recorded_at": "2026-03-01T10:00:00"},
+            {"package": 8, "latitude": 0, "longitude": 0},
+        ])
+        self.assertEqual([point.package_id for point in points], [7, 8])
+        self.assertEqual(points[0].recorded_at, datetime.datetime(2026, 3, 1, 10, tzinfo=datetime.timezone.utc))
+        self.assertEqual(points[0].day, datetime.date(2026, 3, 1))
+        self.assertIsNotNone(points[1].recorded_at)
+        self.assertEqual(parse_points([{"latitude": 1, "longitude": 2}], package_id=9)[0].package_id, 9)
+        for raw in (
+            [], {}, [{"package": 1, "latitude": 1}], [{"package": 1, "latitude": 91, "longitude": 0}],
+            [{"package": 1, "latitude": 1, "longitude": 1, "recorded_at": "yesterday"}],
+        ):
+            with self.assertRaises(ValidationError, msg=raw):
+                parse_points(raw)
+
+    def test_ingest_keeps_the_newest_fix(self):
+        other = Package.objects.create(
+            user=self.owner, booked_by=self.stranger, title="Other", description="-",
+            pickup_location="Pune", drop_location="Mumbai", weight=100, price_expectation=1000, status="Loaded",
+        )
+
+        def fix(minute, latitude, package=self.package):
+            return {"package": package.id, "latitude": latitude, "longitude": 73.8,
+                    "recorded_at": f"2026-03-01T10:{minute:02d}:00Z"}
+
+        # A batch naming someone else's package is refused whole
+        self.assertEqual(self.ingest(self.transporter, [fix(0, 18.0), fix(0, 19.0, other)]).status_code, 403)
+        self.assertFalse(TrackingPoint.objects.exists())
+
+        response = self.ingest(self.transporter, [fix(5, 18.5), fix(3, 18.3)])
+        self.assertEqual(response.data, {"accepted": 2, "updated": 1})
+        # A late batch is kept in the history but does not move the position back
+        response = self.ingest(self.transporter, [fix(1, 18.1)])
+        self.assertEqual(response.data, {"accepted": 1, "updated": 0})
+        tracking = Tracking.objects.get(package=self.package)
+        self.assertEqual((tracking.latitude, tracking.recorded_at.minute), (Decimal("18.500000"), 5))
+        self.assertEqual(TrackingPoint.objects.count(), 3)
+
+        self.assertEqual(len(update_latest(parse_points([fix(9, 18.9)]))), 1)
+        tracking.refresh_from_db()
+        self.assertEqual(tracking.latitude, Decimal("18.900000"))
+
+
+@override_settings(TRACKING_WRITE_BEHIND={"max_batch": 50, "max_delay": 0.05})
+class TrackingConsumerTests(TransactionTestCase):
+    """The transporter streams fixes over ws/tracking/<id>/; the owner watches"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        self.stranger = User.objects.create_user("stranger", password="x", is_transporter=True)
+        self.package = Package.objects.create(
+            user=self.owner, booked_by=self.transporter, title="Load", description="-",
+            pickup_location="Pune", drop_location="Mumbai", weight=100, price_expectation=1000, status="Loaded",
+        )
+
+    async def connect(self, user):
+        from .routing import websocket_urlpatterns
+        scope = {
+            "type": "websocket", "path": f"/ws/tracking/{self.package.id}/", "query_string": b"",
+            "headers": [], "subprotocols": [], "user": user,
+        }
+        socket = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+        await socket.send_input({"type": "websocket.connect"})
+        return socket, (await socket.receive_output(2))["type"]
+
+    def test_fixes_reach_the_owner_and_the_table(self):
+        async def scenario():
+            stranger, kind = await self.connect(self.stranger)
+            self.assertEqual(kind, "websocket.close")
+            owner, kind = await self.connect(self.owner)
+            self.assertEqual(kind, "websocket.accept")
+            driver, _ = await self.connect(self.transporter)
+
+            await owner.send_input({"type": "websocket.receive", "text": json.dumps({"latitude": 1, "longitude": 2})})
+            self.assertTrue(await owner.receive_nothing(0.2))
+            await driver.send_input({"type": "websocket.receive", "text": json.dumps({"points": [
+                {"latitude": 18.5, "longitude": 73.8, "recorded_at": "2026-03-01T10:05:00Z"},
+                {"latitude": 18.4, "longitude": 73.7, "recorded_at": "2026-03-01T10:04:00Z"},
+            ]})})
+            event = json.loads((await owner.receive_output(2))["text"])
+            self.assertEqual((event["package"], event["latitude"]), (self.package.id, 18.5))
+
+            await driver.send_input({"type": "websocket.receive", "text": json.dumps({"latitude": 95, "longitude": 0})})
+            self.assertEqual(json.loads((await driver.receive_output(2))["text"])["latitude"], 18.5)
+            self.assertEqual(json.loads((await driver.receive_output(2))["text"])["type"], "error")
+            for socket in (owner, driver):
+                await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+                await socket.wait(2)
+            await asyncio.sleep(0.2)
+
+        async_to_sync(scenario)()
+        self.assertEqual(TrackingPoint.objects.filter(package=self.package).count(), 2)
+        self.assertEqual(Tracking.objects.get(package=self.package).latitude, Decimal("18.500000"))
+
+
+@override_settings(CHAT_WRITE_BEHIND={"max_batch": 3, "max_delay": 60})
+class ChatWriteBehindTests(TransactionTestCase):
+    """Chat messages are written in batches, and nothing queued is lost when a socket closes"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        self.package = Package.objects.create(
+            user=self.owner, title="Load", description="d", pickup_location="Pune",
+            drop_location="Mumbai", weight=100, price_expectation=1000,
+        )
+
+    async def connect(self, user=None, partner=None):
+        from .routing import websocket_urlpatterns
+        user, partner = user or self.owner, partner or self.transporter
+        scope = {
+            "type": "websocket", "path": f"/ws/chat/{self.package.id}/{partner.id}/",
+            "query_string": b"", "headers": [], "subprotocols": [], "user": user,
+        }
+        socket = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+        await socket.send_input({"type": "websocket.connect"})
+        self.assertEqual((await socket.receive_output(2))["type"], "websocket.accept")
+        return socket
+
+    async def say(self, socket, n):
+        await socket.send_input({"type": "websocket.receive", "text": json.dumps({"message": f"m{n}", "client_id": n})})
+
+    async def frames(self, socket, count):
+        return [json.loads((await socket.receive_output(2))["text"]) for _ in range(count)]
+
+    def test_batches_and_flush_on_disconnect(self):
+        count = sync_to_async(Chat_Message.objects.count)
+
+        async def scenario():
+            socket = await self.connect()
+            for n in range(2):
+                await self.say(socket, n)
+            # Held until the batch is full (max_delay is a minute)
+            self.assertTrue(await socket.receive_nothing(0.2))
+            self.assertEqual(await count(), 0)
+            await self.say(socket, 2)
+            # An ack and the room broadcast per message, once it is written
+            frames = await self.frames(socket, 6)
+            acks = [frame for frame in frames if frame.get("type") == "ack"]
+            self.assertEqual(sorted(ack["client_id"] for ack in acks), [0, 1, 2])
+
+            await self.say(socket, 3)
+            self.assertEqual(await count(), 3)
+            await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+            await socket.wait(2)
+            self.assertEqual(await count(), 4)
+
+        async_to_sync(scenario)()
+        room = ChatRoom.objects.get()
+        self.assertEqual((room.transporter_unread, room.last_message.message), (4, "m3"))
+
+    def test_broadcast_carries_the_sync_cursor(self):
+        client = APIClient()
+        client.force_authenticate(self.transporter)
+        sync = sync_to_async(lambda since: client.get("/api/chatmessages/sync/", {"since": since}).data)
+
+        async def scenario():
+            owner = await self.connect()
+            partner = await self.connect(self.transporter, self.owner)
+            for n in range(3):
+                await self.say(owner, n)
+            seen = await self.frames(partner, 3)
+            self.assertEqual([event["message"] for event in seen], ["m0", "m1", "m2"])
+            room_id = (await sync(""))["rooms"][0]["id"]
+
+            # Reconnecting with the last id it was sent, the partner gets nothing twice
+            self.assertEqual((await sync(f"{room_id}:{seen[-1]['id']}"))["messages"], {})
+            newer = (await sync(f"{room_id}:{seen[0]['id']}"))["messages"][str(room_id)]["messages"]
+            self.assertEqual([m["id"] for m in newer], [event["id"] for event in seen[1:]])
+            for socket in (owner, partner):
+                await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+                await socket.wait(2)
+
+        async_to_sync(scenario)()
+
+    def test_lifespan_shutdown_flushes(self):
+        async def scenario():
+            buffer = get_buffer("chat", Chat_Message, max_batch=50, max_delay=60)
+            room = await sync_to_async(ChatRoom.objects.create)(
+                package=self.package, owner=self.owner, transporter=self.transporter,
+            )
+            saved = buffer.add(Chat_Message(room=room, sender=self.owner, message="bye"))
+            server = ApplicationCommunicator(lifespan, {"type": "lifespan"})
+            await server.send_input({"type": "lifespan.startup"})
+            self.assertEqual((await server.receive_output(2))["type"], "lifespan.startup.complete")
+            await server.send_input({"type": "lifespan.shutdown"})
+            self.assertEqual((await server.receive_output(2))["type"], "lifespan.shutdown.complete")
+            self.assertEqual((await saved).message, "bye")
+
+        async_to_sync(scenario)()
+        self.assertEqual(Chat_Message.objects.get().message, "bye")
+
+
+class SlowBroker(Broker):
+    """Replies to group_add only after a delay, to cancel a caller mid-request"""
+
+    async def handle(self, request):
+        if request.get("op") == "group_add":
+            await asyncio.sleep(0.2)
+        return await super().handle(request)
+
+
+class ShardedChannelLayerTests(SimpleTestCase):
+    """The channel layer over two in-process broker shards"""
+
+    def run_with_layers(self, scenario, broker=Broker):
+        async def main():
+            with tempfile.TemporaryDirectory() as tmp:
+                paths = [f"{tmp}/shard-{i}.sock" for i in range(2)]
+                servers = [await asyncio.start_unix_server(broker().serve_client, path=path) for path in paths]
+                # Two layer instances stand in for two worker processes
+                layers = [ShardedChannelLayer(paths), ShardedChannelLayer(paths)]
+                try:
+                    await asyncio.wait_for(scenario(*layers), 10)
+                finally:
+                    for layer in layers:
+                        await layer.close()
+                    for server in servers:
+                        server.close()
+                        await server.wait_closed()
+        asyncio.run(main())
+
+    def test_group_send_reaches_other_processes(self):
+        async def scenario(sender, receiver):
+            channels = [await receiver.new_channel() for _ in range(3)]
+            for channel in channels:
+                await receiver.group_add("package_1", channel)
+            await receiver.group_discard("package_1", channels[2])
+            await sender.group_send("package_1", {"type": "hello", "n": 1})
+            for channel in channels[:2]:
+                self.assertEqual(await receiver.receive(channel), {"type": "hello", "n": 1})
+            await sender.send("direct", {"type": "ping"})
+            self.assertEqual(await receiver.receive("direct"), {"type": "ping"})
+        self.run_with_layers(scenario)
+
+    def test_cancelled_request_does_not_shift_replies(self):
+        async def scenario(sender, receiver):
+            channel = await receiver.new_channel()
+            pending = asyncio.create_task(sender.group_add("package_1", channel))
+            await asyncio.sleep(0.05)   # the request is written, its reply not yet read
+            pending.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await pending
+            await sender.group_add("package_1", channel)
+            await sender.group_send("package_1", {"type": "hello"})
+            self.assertEqual(await receiver.receive(channel), {"type": "hello"})
+        self.run_with_layers(scenario, broker=SlowBroker)
+
+    def test_cancelled_receive_leaves_no_waiter(self):
+        async def scenario(sender, receiver):
+            pending = asyncio.create_task(receiver.receive("direct"))
+            await asyncio.sleep(0.05)   # the broker is holding a waiter for it
+            pending.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await pending
+            await sender.send("direct", {"type": "ping"})
+            self.assertEqual(await receiver.receive("direct"), {"type": "ping"})
+        self.run_with_layers(scenario)
+
+    def test_messages_for_a_departed_receiver_are_dropped(self):
+        async def scenario(sender, receiver):
+            gone, live = await receiver.new_channel(), await receiver.new_channel()
+            for channel in (gone, live):
+                await receiver.group_add("package_1", channel)
+            pending = asyncio.create_task(receiver.receive(gone))
+            await asyncio.sleep(0.05)
+            pending.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await pending
+            await sender.group_send("package_1", {"type": "hello"})
+            self.assertEqual(await receiver.receive(live), {"type": "hello"})
+            await asyncio.sleep(0.1)
+            self.assertEqual(list(receiver._state()["buffers"]), [live])
+        self.run_with_layers(scenario)
+
+
+class TrajectoryTests(TestCase):
+    """Varint segments, path simplification and the /tracking/{package}/path/ endpoint"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporter = User.objects.create_user("transporter", password="x", is_transporter=True)
+        self.package = Package.objects.create(
+            user=self.owner, booked_by=self.transporter, title="Load", description="-",
+            pickup_location="Pune", drop_location="Mumbai", weight=100, price_expectation=1000, status="Loaded",
+        )
+        self.start = datetime.datetime(2026, 3, 1, 6, tzinfo=datetime.timezone.utc)
+        # A straight drive north with one detour east at the midpoint
+        self.track = [
+            (18.5 + i * 0.001, 73.8 + (0.01 if i == 50 else 0), self.start + datetime.timedelta(seconds=10 * i))
+            for i in range(101)
+        ]
+
+    def test_codec_round_trip(self):
+        data = trajectory.encode_points(self.track, self.start)
+        self.assertLess(len(data), 101 * 3 * 3)
+        decoded = trajectory.decode_points(data, self.start)
+        self.assertEqual(len(decoded), len(self.track))
+        for (lat, lon, at), (lat2, lon2, at2) in zip(self.track, decoded):
+            self.assertAlmostEqual(lat, lat2, places=5)
+            self.assertAlmostEqual(lon, lon2, places=5)
+            self.assertEqual(at, at2)
+        # Google's reference example
+        polyline = [(38.5, -120.2, None), (40.7, -120.95, None), (43.252, -126.453, None)]
+        self.assertEqual(trajectory.encode_polyline(polyline), "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+    def test_downsample(self):
+        three = trajectory.downsample(self.track, max_points=3)
+        self.assertEqual([p[2] for p in three], [self.track[i][2] for i in (0, 50, 100)])
+        # Zoomed out the detour (~1 km) is below a pixel; zoomed in it survives
+        self.assertEqual(len(trajectory.downsample(self.track, zoom=3)), 2)
+        self.assertIn(self.track[50], trajectory.downsample(self.track, zoom=15))
+        self.assertEqual(trajectory.downsample(self.track[:2], max_points=2), self.track[:2])
+
+    def test_compaction_keeps_points_it_did_not_encode(self):
+        TrackingPoint.objects.bulk_create([
+            TrackingPoint(package=self.package, latitude=lat, longitude=lon, recorded_at=at, day=at.date())
+            for lat, lon, at in self.track
+        ])
+        late = self.start + datetime.timedelta(seconds=5)
+        encode = trajectory.encode_points
+
+        def encode_while_a_late_batch_lands(points, start):
+            TrackingPoint.objects.create(
+                package=self.package, latitude=18.5, longitude=73.8, recorded_at=late, day=late.date(),
+            )
+            return encode(points, start)
+
+        before = self.start + datetime.timedelta(days=1)
+        with mock.patch.object(trajectory, "encode_points", encode_while_a_late_batch_lands):
+            self.assertEqual(trajectory.compact_package(self.package.id, before)[0], 101)
+        self.assertEqual(list(TrackingPoint.objects.values_list("recorded_at", flat=True)), [late])
+        track = trajectory.load_track(self.package.id)
+        self.assertEqual(len(track), TrackSegment.objects.get().point_count + 1)
+        times = [at for _, _, at in track]
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(times[1], late)
+
+    def test_path_takes_a_package_id(self):
+        TrackingPoint.objects.bulk_create([
+            TrackingPoint(package=self.package, latitude=lat, longitude=lon, recorded_at=at, day=at.date())
+            for lat, lon, at in self.track
+        ])
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.get(f"/api/tracking/{self.package.id}/path/", {"max_points": 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["package"], response.data["source_count"]), (self.package.id, 101))
+        self.assertEqual([p[2] for p in response.data["points"]], [0, 500, 1000])
+
+        client.force_authenticate(User.objects.create_user("stranger", password="x", is_transporter=True))
+        self.assertEqual(client.get(f"/api/tracking/{self.package.id}/path/").status_code, 404)
+
+
+class DashboardCacheTests(TestCase):
+    """Dashboard snapshots live in the shared cache and are dropped by signals"""
+
+    def setUp(self):
+        cache.clear()
+        dashboard.reset_stats()
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.admin = User.objects.create_user("admin", password="x", is_staff=True)
+        self.client = APIClient()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_signals_invalidate_snapshots(self):
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get("/api/dashboard/").data["total_packages"], 0)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/api/dashboard/")
+        self.assertFalse(any("TMSapp_package" in q["sql"] for q in ctx.captured_queries))
+
+        package = Package.objects.create(
+            user=self.owner, title="Load", description="-", pickup_location="Pune", drop_location="Mumbai",
+            weight=100, price_expectation=1000,
+        )
+        self.assertEqual(self.client.get("/api/dashboard/").data["total_packages"], 1)
+        Invoice.objects.create(package=package, amount=250)
+        self.assertEqual(self.client.get("/api/dashboard/").data["total_invoice_amount"], 250.0)
+        package.delete()
+        self.assertEqual(self.client.get("/api/dashboard/").data["total_packages"], 0)
+
+    def test_hit_and_miss_counters(self):
+        dashboard.get_snapshot(self.owner)
+        dashboard.get_snapshot(self.owner)
+        dashboard.get_snapshot(self.owner)
+        dashboard.invalidate(self.owner.id)
+        dashboard.get_snapshot(self.owner)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get("/api/dashboard/cache-stats/").data, {"hits": 2, "misses": 2, "hit_rate": 0.5})
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get("/api/dashboard/cache-stats/").status_code, 403)
+
+    def test_a_hit_costs_fewer_queries_than_a_miss(self):
+        def queries():
+            with CaptureQueriesContext(connection) as ctx:
+                dashboard.get_snapshot(self.owner)
+            return len(ctx.captured_queries)
+
+        miss, hit = queries(), queries()
+        self.assertEqual(dashboard.cache_stats()["hits"], 1)
+        self.assertLess(hit, miss)
+        self.assertEqual(hit, 1)
+
+
+class BookingRaceTests(TransactionTestCase):
+    """
+    Many transporters hit the same package at once; the state machine must
+    let exactly one of them through and answer 409 to the rest.
+    """
+    THREADS = 16
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.transporters = [
+            User.objects.create_user(f"transporter{i}", password="x", is_transporter=True)
+            for i in range(self.THREADS)
+        ]
+        self.package = Package.objects.create(
+            user=self.owner, title="Load", description="d", pickup_location="Pune",
+            drop_location="Mumbai", weight=100, price_expectation=1000,
+        )
+
+    def race(self, calls):
+        barrier = threading.Barrier(len(calls))
+        codes = []
+
+        def run(user, url):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                codes.append(client.post(url).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=call) for call in calls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(codes)
+
+    def test_direct_booking_has_one_winner(self):
+        url = f"/api/packages/{self.package.id}/book/"
+        codes = self.race([(t, url) for t in self.transporters])
+        self.assertEqual(codes, [200] + [409] * (self.THREADS - 1))
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.status, "Booked")
+        self.assertIn(self.package.booked_by, self.transporters)
+
+    # SQLite has no row locks; there the second writer fails with "database is locked"
+    @skipUnless(connection.features.has_select_for_update, "needs SELECT ... FOR UPDATE")
+    def test_concurrent_bulk_invoicing_invoices_once(self):
+        transporter = self.transporters[0]
+        packages = [
+            Package.objects.create(
+                user=self.owner, booked_by=transporter, title=f"Load {i}", description="d",
+                pickup_location="Pune", drop_location="Mumbai", weight=100,
+                price_expectation=1000, status="Delivered",
+            )
+            for i in range(3)
+        ]
+        barrier = threading.Barrier(4)
+        created = []
+
+        def run():
+            client = APIClient()
+            client.force_authenticate(self.owner)
+            barrier.wait()
+            try:
+                response = client.post(
+                    "/api/invoices/bulk_generate/", {"package_ids": [p.id for p in packages]}, format="json",
+                )
+                created.append(response.data["created"])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(created), 3)
+        self.assertEqual(Invoice.objects.filter(package__in=packages).count(), 3)
+
+    def test_accepting_rival_offers_has_one_winner(self):
+        offers = [
+            Offer.objects.create(package=self.package, sender=t, receiver=self.owner, offer_price=900 + i)
+            for i, t in enumerate(self.transporters)
+        ]
+        codes = self.race([(self.owner, f"/api/offers/{o.id}/accept/") for o in offers])
+        self.assertEqual(codes, [200] + [409] * (self.THREADS - 1))
+
+        accepted = Offer.objects.get(status="accepted")
+        self.assertEqual(Offer.objects.filter(status="rejected").count(), self.THREADS - 1)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.booked_by_id, accepted.sender_id)
+        self.assertEqual(self.package.price_expectation, accepted.offer_price)
+
+
+@override_settings(NOTIFICATIONS={"window": 0.1, "replay_limit": 10})
+class NotificationTests(TransactionTestCase):
+    """Offer events reach the other party, coalesced, and replay after a reconnect"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", is_owner=True)
+        self.carrier = User.objects.create_user("carrier", password="x", is_transporter=True)
+        self.package = Package.objects.create(
+            user=self.owner, title="Load", description="d", pickup_location="Pune",
+            drop_location="Mumbai", weight=100, price_expectation=1000,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.carrier)
+
+    async def connect(self, query=b""):
+        from .routing import websocket_urlpatterns
+        scope = {
+            "type": "websocket", "path": "/ws/notifications/", "query_string": query,
+            "headers": [], "subprotocols": [], "user": self.owner,
+        }
+        socket = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+        await socket.send_input({"type": "websocket.connect"})
+        self.assertEqual((await socket.receive_output(2))["type"], "websocket.accept")
+        return socket
+
+    async def frame(self, socket):
+        return json.loads((await socket.receive_output(2))["text"])
+
+    async def close(self, socket):
+        await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+        await socket.wait(2)
+
+    def test_publish_failure_does_not_fail_the_request(self):
+        with mock.patch("TMSapp.notifications.get_channel_layer", side_effect=ConnectionError("layer down")):
+            with self.assertLogs("django.db.backends.base", "ERROR"):
+                response = self.client.post(
+                    "/api/offers/", {"package_id": self.package.id, "offer_price": 900}, format="json",
+                )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Notification.objects.get().kind, "offer.created")
+
+    def test_prune_keeps_recent_events(self):
+        old, recent = Notification.objects.bulk_create([
+            Notification(user=self.owner, kind="offer.created", key="offer:1"),
+            Notification(user=self.owner, kind="offer.created", key="offer:2"),
+        ])
+        Notification.objects.filter(id=old.id).update(created_at=timezone.now() - datetime.timedelta(days=31))
+        with mock.patch("TMSapp.notifications.PRUNE_BATCH", 1):
+            call_command("prune_notifications", stdout=io.StringIO())
+        self.assertEqual(list(Notification.objects.values_list("id", flat=True)), [recent.id])
+        self.assertEqual(notifications.prune(0), 1)
+
+    def test_late_commit_below_the_cursor_is_delivered(self):
+        create = sync_to_async(Notification.objects.bulk_create)
+        layer = get_channel_layer()
+        group = notifications.notification_group(self.owner.id)
+
+        async def scenario():
+            live = await self.connect()
+            self.assertEqual((await self.frame(live))["events"], [])
+            first, second = await create([
+                Notification(user=self.owner, kind="offer.created", key="offer:1"),
+                Notification(user=self.owner, kind="offer.created", key="offer:2"),
+            ])
+            # The transaction that drew the lower id commits last
+            for row in (second, first):
+                await layer.group_send(group, {"type": "notify", "events": [notifications.as_event(row)]})
+                frame = await self.frame(live)
+                self.assertEqual([e["id"] for e in frame["events"]], [row.id])
+            self.assertEqual(frame["cursor"], second.id)
+            await self.close(live)
+
+        async_to_sync(scenario)()
+
+    def test_push_coalesce_and_resume(self):
+        post = sync_to_async(self.client.post)
+
+        async def scenario():
+            live = await self.connect()
+            self.assertEqual((await self.frame(live))["events"], [])
+
+            offer = (await post("/api/offers/", {"package_id": self.package.id, "offer_price": 900}, format="json")).data
+            for price in (880, 870):
+                await post(f"/api/offers/{offer['id']}/counter/", {"offer_price": price}, format="json")
+            frame = await self.frame(live)
+            self.assertEqual([(e["kind"], e["data"]["price"]) for e in frame["events"]], [("offer.countered", "870.00")])
+            self.assertTrue(await live.receive_nothing(0.3))
+            await self.close(live)
+
+            await post(f"/api/offers/{offer['id']}/counter/", {"offer_price": 860}, format="json")
+            resumed = await self.connect(f"after={frame['cursor']}".encode())
+            replay = await self.frame(resumed)
+            self.assertEqual([e["data"]["price"] for e in replay["events"]], ["860.00"])
+            self.assertGreater(replay["cursor"], frame["cursor"])
+            await self.close(resumed)
+
+        async_to_sync(scenario)()
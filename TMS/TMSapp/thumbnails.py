@@ -0,0 +1,165 @@
+"""
+Package photo pipeline.
+
+Uploads are processed off the request thread once the saving transaction
+commits (a small thread pool; `manage.py process_images` catches up on
+anything a restart interrupted):
+
+- EXIF orientation is applied to the pixels and every bit of metadata
+  (EXIF, GPS, ICC, XMP) is dropped by re-encoding;
+- the normalized photo, capped at PACKAGE_IMAGES["max_side"], replaces the
+  raw upload as WebP;
+- a WebP thumbnail is derived for each width in PACKAGE_IMAGES["sizes"].
+
+Files go through the images field's storage, so the same code serves the
+local FileSystemStorage and Cloudinary. Their URLs are computed once, at
+processing time, and kept in Package.image_variants:
+
+    {"source": <images.name>, "width": w, "height": h,
+     "urls": {"full": url, "160": url, "480": url, ...}}
+
+Serializers read the map instead of asking storage for a URL per row.
+Root-relative URLs (FileSystemStorage) are made absolute with an origin
+worked out once per response (see absolute_url()). A map whose source is
+not the current images name is stale and ignored.
+"""
+import hashlib
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Package
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {"sizes": [160, 480, 1200], "max_side": 2048, "quality": 80, "workers": 2, "eager": False}
+
+_executor = None
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "PACKAGE_IMAGES", {})}
+
+
+def schedule(package_id):
+    """Process the package's photo after the current transaction commits"""
+    transaction.on_commit(lambda: _submit(package_id))
+
+
+def _submit(package_id):
+    global _executor
+    if config()["eager"]:
+        process(package_id)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=config()["workers"], thread_name_prefix="package-images")
+    _executor.submit(_run, package_id)
+
+
+def _run(package_id):
+    try:
+        process(package_id)
+    except Exception:
+        logger.exception("Processing the photo of package %s failed", package_id)
+    finally:
+        close_old_connections()
+
+
+def _encode(image, quality):
+    out = io.BytesIO()
+    image.save(out, "WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+def render(data, sizes, max_side, quality):
+    """
+    Raw upload bytes -> (width, height, {"full": webp bytes, "<width>": webp bytes})
+    Orientation is baked in; nothing but pixels survives the re-encode.
+    """
+    with Image.open(io.BytesIO(data)) as raw:
+        image = ImageOps.exif_transpose(raw)
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in raw.info else "RGB")
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    outputs = {"full": _encode(image, quality)}
+    for width in sorted(sizes):
+        if width >= image.width:
+            continue
+        thumb = image.resize((width, max(1, round(image.height * width / image.width))), Image.Resampling.LANCZOS)
+        outputs[str(width)] = _encode(thumb, quality)
+    return image.width, image.height, outputs
+
+
+def process(package_id):
+    """Normalize a package's photo and derive its thumbnails; returns the variant map"""
+    package = Package.objects.only("id", "images", "image_variants").filter(id=package_id).first()
+    if package is None or not package.images:
+        return None
+    source = package.images.name
+    if package.image_variants.get("source") == source:
+        return package.image_variants
+
+    cfg = config()
+    storage = package.images.storage
+    with package.images.open("rb") as upload:
+        data = upload.read()
+    width, height, outputs = render(data, cfg["sizes"], cfg["max_side"], cfg["quality"])
+
+    stem = posixpath.splitext(posixpath.basename(source))[0]
+    tag = hashlib.sha256(data).hexdigest()[:12]
+    names = {}
+    for key, blob in outputs.items():
+        suffix = "" if key == "full" else f"-{key}"
+        names[key] = storage.save(f"packages/{package_id}/{stem}-{tag}{suffix}.webp", ContentFile(blob))
+
+    variants = {
+        "source": names["full"], "width": width, "height": height,
+        "urls": {key: storage.url(name) for key, name in names.items()},
+    }
+    # Conditional on the upload we read, so a newer upload is never overwritten
+    updated = Package.objects.filter(id=package_id, images=source).update(
+        images=names["full"], image_variants=variants,
+    )
+    if not updated:
+        for name in names.values():
+            storage.delete(name)
+        return None
+    storage.delete(source)
+    return variants
+
+
+def is_current(package):
+    variants = package.image_variants or {}
+    return bool(package.images) and variants.get("source") == package.images.name
+
+
+def absolute_url(url, context):
+    """
+    Make a root-relative URL absolute with the request's origin, computed
+    once per serializer tree (context is shared by list children).
+    """
+    if not url.startswith("/"):
+        return url
+    origin = context.get("media_origin")
+    if origin is None:
+        request = context.get("request")
+        origin = context["media_origin"] = request.build_absolute_uri("/").rstrip("/") if request else ""
+    return origin + url
+
+
+def represent(package, context):
+    """(full URL, srcset map) for a serialized package; (None, {}) without a photo"""
+    if not package.images:
+        return None, {}
+    if not is_current(package):
+        # Not processed yet: the raw upload, and no thumbnails
+        return absolute_url(package.images.url, context), {}
+    urls = package.image_variants["urls"]
+    srcset = {f"{key}w": absolute_url(url, context) for key, url in urls.items() if key != "full"}
+    srcset[f"{package.image_variants['width']}w"] = absolute_url(urls["full"], context)
+    return absolute_url(urls["full"], context), srcset
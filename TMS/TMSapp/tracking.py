@@ -0,0 +1,179 @@
+import asyncio
+import datetime
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Package, Tracking, TrackingPoint
+
+MAX_POINTS_PER_BATCH = 5000
+# Rows per upsert statement (5 parameters each, under SQLite's limit)
+UPSERT_BATCH = 500
+
+
+def tracking_group(package_id):
+    return f"tracking_{package_id}"
+
+
+def parse_points(raw, package_id=None):
+    """
+    Validate raw GPS fixes into unsaved TrackingPoint rows.
+
+    Each fix is {"package", "latitude", "longitude", "recorded_at"?}; when
+    package_id is given (one socket per package) it overrides "package".
+    Fixes without recorded_at are stamped with the server time.
+    """
+    if not isinstance(raw, list) or not raw:
+        raise ValidationError({"points": "Expected a non-empty list of points."})
+    if len(raw) > MAX_POINTS_PER_BATCH:
+        raise ValidationError({"points": f"At most {MAX_POINTS_PER_BATCH} points per batch."})
+
+    now = timezone.now()
+    points = []
+    for i, item in enumerate(raw):
+        try:
+            package = int(package_id if package_id is not None else item["package"])
+            latitude = float(item["latitude"])
+            longitude = float(item["longitude"])
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError({"points": f"Point {i}: package, latitude and longitude are required."})
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({"points": f"Point {i}: coordinates out of range."})
+
+        recorded_at = now
+        if item.get("recorded_at"):
+            recorded_at = parse_datetime(str(item["recorded_at"]))
+            if recorded_at is None:
+                raise ValidationError({"points": f"Point {i}: recorded_at is not an ISO 8601 datetime."})
+            if timezone.is_naive(recorded_at):
+                recorded_at = timezone.make_aware(recorded_at, datetime.timezone.utc)
+
+        points.append(TrackingPoint(
+            package_id=package, latitude=latitude, longitude=longitude,
+            recorded_at=recorded_at, day=recorded_at.astimezone(datetime.timezone.utc).date(),
+        ))
+    return points
+
+
+def senders_packages(user, package_ids):
+    """The subset of package_ids this user may report positions for"""
+    return set(
+        Package.objects.filter(id__in=package_ids, booked_by=user).values_list("id", flat=True)
+    )
+
+
+def store_points(points):
+    """Append a batch to the history table and move the latest positions forward"""
+    TrackingPoint.objects.bulk_create(points, batch_size=1000)
+    return update_latest(points)
+
+
+def update_latest(points):
+    """
+    Upsert the Tracking row of every package in the batch with its newest fix.
+    Late batches never move a position backwards: the comparison with the
+    stored recorded_at is part of the upsert, so concurrent writers cannot
+    overwrite a newer fix between a read and a write. Returns the fixes applied.
+    """
+    latest = {}
+    for point in points:
+        best = latest.get(point.package_id)
+        if best is None or point.recorded_at >= best.recorded_at:
+            latest[point.package_id] = point
+    if not latest:
+        return []
+
+    if connection.features.supports_update_conflicts_with_target:
+        applied = _upsert_newer(list(latest.values()))
+    else:
+        applied = _update_locked(latest)
+    return [point for package_id, point in latest.items() if package_id in applied]
+
+
+def _upsert_newer(points):
+    """INSERT ... ON CONFLICT DO UPDATE ... WHERE older; the package ids written"""
+    fields = [Tracking._meta.get_field(name) for name in ("package", "latitude", "longitude", "recorded_at", "update_at")]
+    table = connection.ops.quote_name(Tracking._meta.db_table)
+    columns = [connection.ops.quote_name(field.column) for field in fields]
+    package, _, _, recorded_at, _ = columns
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES {{rows}} "
+        f"ON CONFLICT ({package}) DO UPDATE SET "
+        f"{', '.join(f'{column} = EXCLUDED.{column}' for column in columns[1:])} "
+        f"WHERE {table}.{recorded_at} IS NULL OR {table}.{recorded_at} <= EXCLUDED.{recorded_at} "
+        f"RETURNING {package}"
+    )
+    now = timezone.now()
+    applied = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(points), UPSERT_BATCH):
+            batch = points[start:start + UPSERT_BATCH]
+            params = []
+            for point in batch:
+                values = (
+                    point.package_id, Decimal(f"{point.latitude:.6f}"), Decimal(f"{point.longitude:.6f}"),
+                    point.recorded_at, now,
+                )
+                params += [field.get_db_prep_save(value, connection) for field, value in zip(fields, values)]
+            rows = ", ".join([f"({', '.join(['%s'] * len(fields))})"] * len(batch))
+            cursor.execute(sql.format(rows=rows), params)
+            applied.update(package_id for package_id, in cursor.fetchall())
+    return applied
+
+
+def _update_locked(latest):
+    """Backends without ON CONFLICT: compare under row locks, then upsert"""
+    with transaction.atomic():
+        current = dict(
+            Tracking.objects.select_for_update().filter(package_id__in=latest).values_list("package_id", "recorded_at")
+        )
+        fresh = [
+            point for package_id, point in latest.items()
+            if current.get(package_id) is None or point.recorded_at >= current[package_id]
+        ]
+        Tracking.objects.bulk_create(
+            [
+                Tracking(
+                    package_id=point.package_id,
+                    latitude=Decimal(f"{point.latitude:.6f}"),
+                    longitude=Decimal(f"{point.longitude:.6f}"),
+                    recorded_at=point.recorded_at,
+                )
+                for point in fresh
+            ],
+            update_conflicts=True,
+            unique_fields=["package"],
+            update_fields=["latitude", "longitude", "recorded_at", "update_at"],
+        )
+    return {point.package_id for point in fresh}
+
+
+def position_event(point):
+    return {
+        "type": "location_update",
+        "package": point.package_id,
+        "latitude": point.latitude,
+        "longitude": point.longitude,
+        "recorded_at": point.recorded_at.isoformat(),
+    }
+
+
+def broadcast(points):
+    """Push the latest position of each package to its watchers (sync callers)"""
+    layer = get_channel_layer()
+    if layer is None or not points:
+        return
+
+    # One event-loop hop for the whole batch instead of one per package
+    async def send_all():
+        await asyncio.gather(*(
+            layer.group_send(tracking_group(point.package_id), position_event(point))
+            for point in points
+        ))
+
+    async_to_sync(send_all)()
@@ -0,0 +1,257 @@
+"""
+Compressed trip paths.
+
+Raw fixes land in TrackingPoint (see tracking.py). compact_package() rolls
+finished stretches of them up into TrackSegment rows, one per package and
+UTC day: the path is first thinned with Douglas-Peucker at a small tolerance,
+then stored as delta-encoded varints (coordinates quantized to 1e-5 degrees,
+about a metre; times in milliseconds).
+
+load_track() returns a package's path from segments plus any raw points not
+compacted yet, and downsample() cuts it to a point budget or to what is
+visible at a map zoom level.
+"""
+import datetime
+import heapq
+import math
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import TrackingPoint, TrackSegment
+
+COORD_SCALE = 100_000           # 1e-5 degrees per unit
+METERS_PER_DEGREE = 111_320.0
+# Metres per pixel at zoom 0 on the equator in Web Mercator (256 px tiles)
+ZOOM0_METERS_PER_PIXEL = 156_543.03392
+# Raw point ids per DELETE after compaction, under every backend's parameter limit
+DELETE_BATCH = 900
+
+
+# -------------------
+# VARINT CODEC
+# -------------------
+def _write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def encode_points(points, start):
+    """
+    Pack [(latitude, longitude, recorded_at), ...] (ordered by time) into bytes.
+    Every point is three varints: zigzag lat/lon deltas and the millisecond
+    gap since the previous point (the first one is relative to start).
+    """
+    out = bytearray()
+    prev_lat = prev_lon = 0
+    prev_ms = 0
+    for latitude, longitude, recorded_at in points:
+        lat = round(latitude * COORD_SCALE)
+        lon = round(longitude * COORD_SCALE)
+        ms = round((recorded_at - start).total_seconds() * 1000)
+        _write_varint(out, _zigzag(lat - prev_lat))
+        _write_varint(out, _zigzag(lon - prev_lon))
+        _write_varint(out, ms - prev_ms)
+        prev_lat, prev_lon, prev_ms = lat, lon, ms
+    return bytes(out)
+
+
+def decode_points(data, start):
+    """Inverse of encode_points()"""
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+
+    points = []
+    lat = lon = ms = 0
+    for i in range(0, len(values) - 2, 3):
+        lat += _unzigzag(values[i])
+        lon += _unzigzag(values[i + 1])
+        ms += values[i + 2]
+        points.append((
+            lat / COORD_SCALE,
+            lon / COORD_SCALE,
+            start + datetime.timedelta(milliseconds=ms),
+        ))
+    return points
+
+
+def encode_polyline(points):
+    """Google encoded polyline (precision 5) of the coordinates, for map SDKs"""
+    chars = []
+    prev_lat = prev_lon = 0
+    for latitude, longitude, _ in points:
+        lat = round(latitude * COORD_SCALE)
+        lon = round(longitude * COORD_SCALE)
+        for delta in (lat - prev_lat, lon - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chars.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chars.append(chr(value + 63))
+        prev_lat, prev_lon = lat, lon
+    return "".join(chars)
+
+
+# -------------------
+# SIMPLIFICATION
+# -------------------
+def _projected(points):
+    """Equirectangular metres around the first point; plenty for truck routes"""
+    if not points:
+        return []
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(points[0][0]))
+    return [(p[1] * scale_x, p[0] * METERS_PER_DEGREE) for p in points]
+
+
+def significance(points):
+    """
+    Douglas-Peucker tolerance (in metres) at which each point stops being
+    kept. A point's value never exceeds its parent split's, so "every point
+    above epsilon" is exactly the Douglas-Peucker result for epsilon and the
+    top N values give the best N-point approximation. Endpoints are infinite.
+    """
+    n = len(points)
+    sig = [0.0] * n
+    if n == 0:
+        return sig
+    sig[0] = sig[-1] = math.inf
+    xy = _projected(points)
+    stack = [(0, n - 1, math.inf)]
+    while stack:
+        first, last, ceiling = stack.pop()
+        if last - first < 2:
+            continue
+        ax, ay = xy[first]
+        bx, by = xy[last]
+        dx, dy = bx - ax, by - ay
+        length = math.hypot(dx, dy)
+        best, index = -1.0, first + 1
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            if length:
+                distance = abs(dy * (px - ax) - dx * (py - ay)) / length
+            else:
+                distance = math.hypot(px - ax, py - ay)
+            if distance > best:
+                best, index = distance, i
+        value = min(best, ceiling)
+        sig[index] = value
+        stack.append((first, index, value))
+        stack.append((index, last, value))
+    return sig
+
+
+def simplify(points, tolerance_m):
+    """Douglas-Peucker: drop points closer than tolerance_m to the kept path"""
+    sig = significance(points)
+    return [p for p, s in zip(points, sig) if s > tolerance_m]
+
+
+def zoom_tolerance(zoom, latitude):
+    """Ground distance covered by one screen pixel at a Web Mercator zoom level"""
+    return ZOOM0_METERS_PER_PIXEL * math.cos(math.radians(latitude)) / (2 ** zoom)
+
+
+def downsample(points, max_points=None, zoom=None):
+    """Thin a path to what a zoom level can show, then to at most max_points"""
+    if len(points) <= 2:
+        return points
+    sig = significance(points)
+    keep = range(len(points))
+    if zoom is not None:
+        tolerance = zoom_tolerance(zoom, points[0][0])
+        keep = [i for i in keep if sig[i] > tolerance]
+    if max_points is not None and len(keep) > max_points:
+        keep = sorted(heapq.nlargest(max(max_points, 2), keep, key=sig.__getitem__))
+    return [points[i] for i in keep]
+
+
+# -------------------
+# STORAGE
+# -------------------
+def compact_tolerance():
+    return getattr(settings, "TRACK_COMPACT_TOLERANCE_M", 3.0)
+
+
+def compact_package(package_id, before):
+    """
+    Move a package's raw fixes older than `before` into per-day segments.
+    The fixes are read (and locked, where the database supports it) in the
+    same transaction that stores the segments, and only the rows actually
+    encoded are deleted: a late batch with old timestamps that commits
+    meanwhile stays raw until the next run. Returns (raw points read,
+    points kept).
+    """
+    with transaction.atomic():
+        raw = list(
+            TrackingPoint.objects.select_for_update()
+            .filter(package_id=package_id, recorded_at__lt=before)
+            .order_by("recorded_at", "id")
+            .values_list("id", "latitude", "longitude", "recorded_at", "day")
+        )
+        if not raw:
+            return 0, 0
+
+        by_day = {}
+        for _, latitude, longitude, recorded_at, day in raw:
+            by_day.setdefault(day, []).append((latitude, longitude, recorded_at))
+
+        tolerance = compact_tolerance()
+        segments = []
+        for day, points in by_day.items():
+            kept = simplify(points, tolerance)
+            segments.append(TrackSegment(
+                package_id=package_id,
+                day=day,
+                start_at=kept[0][2],
+                end_at=kept[-1][2],
+                point_count=len(kept),
+                data=encode_points(kept, kept[0][2]),
+            ))
+
+        TrackSegment.objects.bulk_create(segments)
+        ids = [row[0] for row in raw]
+        for start in range(0, len(ids), DELETE_BATCH):
+            TrackingPoint.objects.filter(id__in=ids[start:start + DELETE_BATCH]).delete()
+    return len(raw), sum(segment.point_count for segment in segments)
+
+
+def load_track(package_id, since=None, until=None):
+    """The package's path as [(latitude, longitude, recorded_at)], oldest first"""
+    segments = TrackSegment.objects.filter(package_id=package_id).order_by("start_at")
+    raw = TrackingPoint.objects.filter(package_id=package_id).order_by("recorded_at", "id")
+    if since is not None:
+        segments = segments.filter(end_at__gte=since)
+        raw = raw.filter(recorded_at__gte=since)
+    if until is not None:
+        segments = segments.filter(start_at__lte=until)
+        raw = raw.filter(recorded_at__lte=until)
+
+    # Each segment and the raw rows are sorted on their own, but a late fix
+    # left raw, or segments from separate compactions, can overlap in time
+    streams = [decode_points(bytes(data), start_at) for start_at, data in segments.values_list("start_at", "data")]
+    streams.append(list(raw.values_list("latitude", "longitude", "recorded_at")))
+    points = list(heapq.merge(*streams, key=lambda point: point[2]))
+    if since is not None or until is not None:
+        points = [
+            p for p in points
+            if (since is None or p[2] >= since) and (until is None or p[2] <= until)
+        ]
+    return points
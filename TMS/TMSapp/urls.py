@@ -3,7 +3,7 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     Registerview, MarketplaceViewSet, Packageviewset, OfferViewSet, 
     ChatMessageViewSet, InvoiceViewSet, TrackingViewSet, 
-    DashboardAnalytics, MyTokenObtainPairView, CurrentUserView,
+    DashboardAnalytics, DashboardCacheStats, MyTokenObtainPairView, CurrentUserView,
     VehicleViewSet, StaffViewSet,
 )
 
@@ -12,7 +12,7 @@ router.register(r"packages",Packageviewset , basename="packages")
 router.register(r"offers", OfferViewSet, basename="offers")
 router.register(r"chatmessages", ChatMessageViewSet, basename="chatmessage")
 router.register(r"invoices", InvoiceViewSet, basename="invoice")
-# router.register(r"tracking", TrackingViewSet, basename="tracking")
+router.register(r"tracking", TrackingViewSet, basename="tracking")
 router.register(r"marketplace", MarketplaceViewSet, basename="marketplace")
 router.register(r"vehicles", VehicleViewSet, basename="vehicle")
 router.register(r"staff", StaffViewSet, basename="staff")
@@ -24,5 +24,7 @@ urlpatterns = [
     path('api/login/', MyTokenObtainPairView.as_view(), name='login'),
     
     # Dashboards
+    path('api/dashboard/', DashboardAnalytics.as_view(), name='dashboard'),
+    path('api/dashboard/cache-stats/', DashboardCacheStats.as_view(), name='dashboard-cache-stats'),
     path('api/', include(router.urls)),
 ]
@@ -1,75 +1,18 @@
 # TMSapp/utils.py
-import io
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.core.mail import EmailMessage
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import inch
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
 
-def generate_invoice_pdf(invoice):
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    # ---------- Header ----------
-    p.setFont("Helvetica-Bold", 24)
-    p.drawString(50, height - 50, invoice.package.user.company_name or invoice.package.user.username)
-
-    p.setFont("Helvetica", 12)
-    p.drawString(50, height - 80, f"Owner: {invoice.package.user.username}")
-    p.drawString(50, height - 100, f"Email: {invoice.package.user.email}")
-    p.drawString(50, height - 120, f"Phone: {invoice.package.user.phone_no or 'N/A'}")
-
-    # ---------- Invoice Title ----------
-    p.setFont("Helvetica-Bold", 22)
-    p.drawString(400, height - 50, "INVOICE")
-
-    # ---------- Invoice Info ----------
-    p.setFont("Helvetica", 12)
-    p.drawString(400, height - 80, f"Invoice #: {invoice.invoice_number}")
-    p.drawString(400, height - 100, f"Issue Date: {invoice.issue_at.strftime('%Y-%m-%d')}")
-    p.drawString(400, height - 120, f"Status: {'Paid' if invoice.paid else 'Unpaid'}")
-
-    # ---------- Receiver Info ----------
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(50, height - 170, "Bill To:")
-    p.setFont("Helvetica", 12)
-    p.drawString(50, height - 190, f"Name: {invoice.transporter.username}")
-    p.drawString(50, height - 210, f"Email: {invoice.transporter.email}")
-    p.drawString(50, height - 230, f"Phone: {invoice.transporter.phone_no or 'N/A'}")
+from .invoice_render import render_invoice
 
-    # ---------- Package Details Table ----------
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(50, height - 270, "Package Details:")
+# Under ASGI, streamed content is read this much at a time per trip to the sync thread
+ASYNC_STREAM_BYTES = 64 * 1024
 
-    # Table headers
-    y = height - 290
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(50, y, "Title")
-    p.drawString(200, y, "Pickup")
-    p.drawString(350, y, "Drop")
-    p.drawString(450, y, "Weight")
-    p.drawString(520, y, "Price")
-
-    # Table content
-    y -= 20
-    p.setFont("Helvetica", 12)
-    p.drawString(50, y, invoice.package.title or "Untitled")
-    p.drawString(200, y, invoice.package.pickup_location or "N/A")
-    p.drawString(350, y, invoice.package.drop_location or "N/A")
-    p.drawString(450, y, f"{invoice.package.weight} kg" if invoice.package.weight else "N/A")
-    p.drawString(520, y, f"₹{invoice.amount}")
-
-    # ---------- Footer ----------
-    p.setFont("Helvetica-Oblique", 10)
-    p.setFillColor(colors.grey)
-    p.drawString(50, 50, "Thank you for using TMSapp. We appreciate your business!")
-
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-    return buffer
+def generate_invoice_pdf(invoice):
+    """Render an invoice to a BytesIO (see invoice_render.py)"""
+    return render_invoice(invoice)
 
 def send_invoice_email(invoice, pdf_buffer, owner_email):
     """
@@ -89,4 +32,51 @@ def send_invoice_email(invoice, pdf_buffer, owner_email):
         content=pdf_buffer.getvalue(),
         mimetype="application/pdf",
     )
-    email.send()
\ No newline at end of file
+    email.send()
+
+
+def stream_json_array(rows):
+    """
+    Yield a JSON array one element at a time, for StreamingHttpResponse.
+    """
+    encoder = JSONEncoder()
+    yield "["
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + encoder.encode(row)
+    yield "]"
+
+
+def _read_batch(iterator, size):
+    """The next parts of `iterator` joined until about `size` long; None once it is exhausted"""
+    parts, length = [], 0
+    for part in iterator:
+        parts.append(part)
+        length += len(part)
+        if length >= size:
+            break
+    return parts[0][:0].join(parts) if parts else None
+
+
+async def _read_async(iterator):
+    read = sync_to_async(_read_batch)
+    try:
+        while (batch := await read(iterator, ASYNC_STREAM_BYTES)) is not None:
+            yield batch
+    finally:
+        if hasattr(iterator, "close"):
+            await sync_to_async(iterator.close)()
+
+
+def streaming_response(request, content, **kwargs):
+    """
+    StreamingHttpResponse of the iterator `content`.
+
+    Under ASGI, Django reads a synchronous iterator to the end before it
+    sends anything, so an export would sit in memory whole. There the
+    iterator is wrapped in an async one that reads ASYNC_STREAM_BYTES at a
+    time in the request's sync thread, where its database cursor lives.
+    Under WSGI it is passed through as is.
+    """
+    if isinstance(getattr(request, "_request", request), ASGIRequest):
+        content = _read_async(iter(content))
+    return StreamingHttpResponse(content, **kwargs)
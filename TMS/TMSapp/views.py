@@ -1,5 +1,13 @@
+import datetime
+from decimal import Decimal, InvalidOperation
+
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum, Q
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.db.models import Q, F, Prefetch, Window
+from django.db.models.functions import RowNumber
 from django.contrib.auth import authenticate, login
 
 from rest_framework.views import APIView
@@ -10,19 +18,28 @@ from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 
-from .models import Package, Offer, Chat_Message, Invoice, Tracking, Vehicle, Staff,ChatRoom
+from .models import Package, Offer, OfferRevision, Chat_Message, Invoice, InvoiceJob, Tracking, Vehicle, Staff,ChatRoom
 from .serializers import (
     RegisterSerializer, LoginSerializer, PackageSerializer,
     ChatMessageSerializer, InvoiceSerializer, TrackingSerializer,
     UserSerializer, OfferSerializer, MyTokenObtainPairSerializer,
-    VehicleSerializer, StaffSerializer,PublicPackageSerializer,SafeUserSerializer
+    VehicleSerializer, StaffSerializer,PublicPackageSerializer,SafeUserSerializer,
+    ChatRoomSummarySerializer, InvoiceJobSerializer, OfferRevisionSerializer,
 )
-from django.http import FileResponse
-from django.core.mail import EmailMessage
-from .utils import generate_invoice_pdf, send_invoice_email
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from .utils import stream_json_array, streaming_response
 from .permissions import isOwnerOrReadonly
+from .pagination import KeysetPagination
+from .mixins import ExportMixin, PrefetchPlanMixin, QueryParamMixin, SearchMixin
+from .geo import within_radius
+from . import dashboard
+from .chat import record_messages, mark_read
+from .tracking import parse_points, senders_packages, store_points, broadcast
+from .trajectory import load_track, downsample, encode_polyline
+from . import booking, consolidation, jobs, matching, negotiation, pdf_cache, statements, thumbnails
 
 
 
@@ -76,14 +93,44 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.db.models import Q
 
-class Packageviewset(viewsets.ModelViewSet):
+class Packageviewset(ExportMixin, SearchMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Package.objects.all().order_by('-create_at')
     serializer_class = PackageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    lookup_value_regex = r"\d+"
     parser_classes = [MultiPartParser, FormParser, JSONParser]
+    prefetch_plan = {
+        "default": {"select_related": ["user", "booked_by"]},
+    }
+    # Each filter is served by an index of Package.Meta or the search index
+    filter_fields = {
+        "status": ("status", "choices"),
+        "created_after": ("create_at__gte", "date"),
+        "created_before": ("create_at__lte", "date"),
+        "min_weight": ("weight__gte", "number"),
+        "max_weight": ("weight__lte", "number"),
+        "min_price": ("price_expectation__gte", "number"),
+        "max_price": ("price_expectation__lte", "number"),
+        "route": (("pickup_location", "drop_location"), "text"),
+    }
+    ordering_fields = {"created": "create_at", "weight": "weight", "price": "price_expectation"}
+    export_name = "packages"
+    export_columns = {
+        "id": "id", "title": "title", "status": "status", "owner": "user__username",
+        "transporter": "booked_by__username", "pickup_location": "pickup_location",
+        "drop_location": "drop_location", "weight": "weight", "price_expectation": "price_expectation",
+        "offer_count": "offer_count", "best_offer_price": "best_offer_price", "create_at": "create_at",
+    }
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        package = serializer.save(user=self.request.user)
+        if package.images:
+            thumbnails.schedule(package.id)
+
+    def perform_update(self, serializer):
+        package = serializer.save()
+        if serializer.validated_data.get("images"):
+            thumbnails.schedule(package.id)
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -106,6 +153,16 @@ class Packageviewset(viewsets.ModelViewSet):
 
         return qs.none()
 
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """Full-text search over the packages this user can list (?q=, see SearchMixin)"""
+        return self.search_response(self.get_queryset())
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """The packages this user can list, with the list filters, streamed as ?output=ndjson|csv"""
+        return self.export_response(self.sort_queryset(self.apply_filters(self.get_queryset())))
+
     def perform_destroy(self, instance):
         user = self.request.user
         is_admin = getattr(user, "is_staff", False) or getattr(user, "is_superuser", False)
@@ -115,119 +172,122 @@ class Packageviewset(viewsets.ModelViewSet):
 
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated])
     def book(self, request, pk=None):
-        package = self.get_object()
-        package.booked_by = request.user
-        package.status = "Booked"
-        package.save()
-        return Response({"message": "Package booked successfully"})
+        state = booking.book_package(int(pk), request.user)
+        return Response({"message": "Package booked successfully", **state})
 
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def current_deliveries(self, request):
         user = request.user
-        qs = Package.objects.filter(
+        qs = self.plan_queryset(Package.objects.filter(
             booked_by=user,
             status="Booked"
-        ).order_by('-create_at')
+        ).order_by('-create_at'))
         return Response(PackageSerializer(qs, many=True, context={"request": request}).data)
 
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated])
     def mark_loaded(self, request, pk=None):
-        package = self.get_object()
-
-        if package.booked_by != request.user:
-            return Response(
-                {"error": "You are not allowed to mark this package as loaded."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        package.status = "Loaded"
-        package.save()
-        return Response({"message": "Package marked as loaded."}, status=status.HTTP_200_OK)
+        state = booking.mark_loaded(int(pk), request.user)
+        return Response({"message": "Package marked as loaded.", **state}, status=status.HTTP_200_OK)
 
     # ✅ NEW endpoint for Loaded Packages
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def loaded(self, request):
         user = request.user
-        qs = Package.objects.filter(
-            Q(user=user) | Q(booked_by=user),
-            status="Loaded"
-        ).order_by('-create_at')
+        # status inside each branch: both are served by their (user|booked_by, status) index
+        qs = self.plan_queryset(Package.objects.filter(
+            Q(user=user, status="Loaded") | Q(booked_by=user, status="Loaded")
+        ).order_by('-create_at'))
         return Response(PackageSerializer(qs, many=True, context={"request": request}).data)
 
 
 
-class OfferViewSet(viewsets.ModelViewSet):
+class OfferViewSet(ExportMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Offer.objects.all().order_by("-created_at")
     serializer_class = OfferSerializer
     permission_classes = [permissions.IsAuthenticated]
+    lookup_value_regex = r"\d+"
+    prefetch_plan = {
+        "default": {"select_related": ["sender", "package"]},
+    }
+    export_name = "offers"
+    export_columns = {
+        "id": "id", "package_id": "package_id", "package_title": "package__title", "sender": "sender__username",
+        "receiver": "receiver__username", "offer_price": "offer_price", "status": "status",
+        "changed_by_owner": "changed_by_owner", "created_at": "created_at", "updated_at": "updated_at",
+    }
 
     def get_queryset(self):
         """Only show offers where user is sender or receiver"""
         user = self.request.user
-        return self.queryset.filter(Q(sender=user) | Q(receiver=user))
+        return super().get_queryset().filter(Q(sender=user) | Q(receiver=user))
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """This user's sent and received offers, streamed as ?output=ndjson|csv"""
+        return self.export_response(self.get_queryset())
 
     def perform_create(self, serializer):
         """When creating an offer, set sender and receiver"""
         package = serializer.validated_data["package"]
-        serializer.save(
-            sender=self.request.user,
-            receiver=package.user
-        )
+        booking.ensure_open(package)
+        with transaction.atomic():
+            offer = serializer.save(
+                sender=self.request.user,
+                receiver=package.user
+            )
+            negotiation.offer_created(offer, self.request.user)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            offer = serializer.save()
+            negotiation.log([offer.id], OfferRevision.EDITED, offer.status, self.request.user, offer.offer_price)
+            negotiation.offers_changed(package_ids=[offer.package_id])
 
     # ----------------- Actions ----------------- #
 
     @action(detail=True, methods=["post"])
     def accept(self, request, pk=None):
-        """Owner accepts an offer → package booked"""
+        """Owner accepts an offer → package booked, rival offers rejected"""
         offer = self.get_object()
-        offer.status = "accepted"
-        offer.changed_by_owner = False
-        offer.save()
-
-        package = offer.package
-        package.status = "Booked"
-        package.booked_by = offer.sender
-        package.price_expectation = offer.offer_price  # ✅ final agreed price
-        package.save()
-
-        return Response({"message": "Offer accepted and package booked."}, status=status.HTTP_200_OK)
+        rejected = booking.accept_offer(offer, request.user)
+        return Response(
+            {"message": "Offer accepted and package booked.", "rejected_offers": rejected},
+            status=status.HTTP_200_OK,
+        )
 
     @action(detail=True, methods=["post"])
     def reject(self, request, pk=None):
         """Owner rejects an offer"""
-        offer = self.get_object()
-        offer.status = "rejected"
-        offer.changed_by_owner = False
-        offer.save()
-        return Response({"message": "Offer rejected."}, status=status.HTTP_200_OK)
+        state = booking.reject_offer(int(pk), request.user)
+        return Response({"message": "Offer rejected.", **state}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["post"])
     def counter(self, request, pk=None):
         """Owner OR Transporter sends counter-offer"""
-        offer = self.get_object()
-
-        # Only sender or receiver can counter
-        if request.user not in [offer.sender, offer.receiver]:
-            return Response({"error": "Not allowed."}, status=status.HTTP_403_FORBIDDEN)
-
         new_price = request.data.get("offer_price")
         if not new_price:
             return Response({"error": "New offer price required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            new_price = Decimal(str(new_price)).quantize(Decimal("0.01"))
+        except InvalidOperation:
+            return Response({"error": "Invalid offer price."}, status=status.HTTP_400_BAD_REQUEST)
 
-        offer.offer_price = new_price
-        offer.status = "pending"
-        offer.changed_by_owner = (request.user == offer.receiver)  # ✅ True if owner countered
-        offer.save()
+        # Only sender or receiver can counter; booking.counter_offer checks it in the UPDATE
+        state = booking.counter_offer(int(pk), request.user, new_price)
 
-        return Response(
-            {"message": "Counter offer sent.", "offer_price": new_price},
-            status=status.HTTP_200_OK
-        )
+        return Response({"message": "Counter offer sent.", **state}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["get"])
+    def history(self, request, pk=None):
+        """Every price and status the offer went through, oldest first"""
+        offer = self.get_object()
+        revisions = offer.revisions.select_related("by").order_by("id")
+        return Response(OfferRevisionSerializer(revisions, many=True).data)
 
     @action(detail=False, methods=["get"])
     def my_offers(self, request):
         """Return offers created by the logged-in user"""
-        offers = self.queryset.filter(sender=request.user)
+        offers = self.plan_queryset(self.queryset.filter(sender=request.user))
         serializer = self.get_serializer(offers, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -235,22 +295,20 @@ class OfferViewSet(viewsets.ModelViewSet):
     def book(self, request, pk=None):
         """Transporter finalizes booking AFTER owner accepts"""
         offer = self.get_object()
-        if offer.status != "accepted":
-            return Response({"error": "Only accepted offers can be booked."}, status=status.HTTP_400_BAD_REQUEST)
-
-        package = offer.package
-        package.status = "Booked"
-        package.booked_by = offer.sender
-        package.price_expectation = offer.offer_price
-        package.save()
-
+        booking.finalize_offer(offer, request.user)
         return Response({"message": "Booking finalized."}, status=status.HTTP_200_OK)
     
 # ✅ Chat Messages CRUD
-class ChatMessageViewSet(viewsets.ModelViewSet):
+SYNC_PAGE = 200
+
+
+class ChatMessageViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Chat_Message.objects.all().order_by("timestamp")
     serializer_class = ChatMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    prefetch_plan = {
+        "default": {"select_related": ["sender"]},
+    }
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -260,7 +318,76 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
         return qs
 
     def perform_create(self, serializer):
-        serializer.save(sender=self.request.user)
+        message = serializer.save(sender=self.request.user)
+        record_messages([message])
+
+    @action(detail=False, methods=["get"])
+    def sync(self, request):
+        """
+        Incremental sync. ?since=<room id>:<last seen id>,... returns only the
+        newer messages of those rooms (at most SYNC_PAGE per room, with
+        has_more), plus an inbox summary of every room the user is in.
+        """
+        user = request.user
+        since = {}
+        for part in filter(None, request.query_params.get("since", "").split(",")):
+            try:
+                room_id, last_seen = (int(x) for x in part.split(":"))
+            except ValueError:
+                raise ValidationError({"since": "Expected <room id>:<last seen id> pairs."})
+            since[room_id] = last_seen
+
+        rooms = list(
+            ChatRoom.objects.filter(Q(owner=user) | Q(transporter=user))
+            .select_related("package", "owner", "transporter", "last_message__sender")
+            .order_by(F("last_message_id").desc(nulls_last=True), "-id")
+        )
+
+        newer = Q()
+        for room in rooms:
+            if room.id in since:
+                newer |= Q(room_id=room.id, id__gt=since[room.id])
+
+        by_room = {}
+        if newer:
+            # Window function caps each room at SYNC_PAGE + 1 rows in one query
+            messages = (
+                Chat_Message.objects.filter(newer)
+                .annotate(rank=Window(RowNumber(), partition_by=F("room_id"), order_by=F("id").asc()))
+                .filter(rank__lte=SYNC_PAGE + 1)
+                .select_related("sender")
+                .order_by("room_id", "id")
+            )
+            for message in messages:
+                by_room.setdefault(message.room_id, []).append(message)
+
+        return Response({
+            "rooms": ChatRoomSummarySerializer(rooms, many=True, context={"request": request}).data,
+            "messages": {
+                str(room_id): {
+                    "messages": ChatMessageSerializer(batch[:SYNC_PAGE], many=True).data,
+                    "has_more": len(batch) > SYNC_PAGE,
+                }
+                for room_id, batch in by_room.items()
+            },
+        })
+
+    @action(detail=False, methods=["post"])
+    def read(self, request):
+        """Mark a room read up to last_read_id"""
+        try:
+            room_id = int(request.data.get("room"))
+            last_read_id = int(request.data.get("last_read_id"))
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "room and last_read_id are required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        room = get_object_or_404(
+            ChatRoom.objects.filter(Q(owner=request.user) | Q(transporter=request.user)), id=room_id
+        )
+        unread = mark_read(room, request.user, last_read_id)
+        return Response({"room": room.id, "unread": unread})
 
     @action(detail=False, methods=["get"])
     def ongoing(self, request):
@@ -271,37 +398,74 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
         ).select_related("package")
 
         # Get latest messages from all rooms of this user
-        messages = Chat_Message.objects.filter(room__in=rooms) \
-            .select_related("room", "sender", "room__package") \
-            .order_by("timestamp")
+        messages = self.plan_queryset(
+            Chat_Message.objects.filter(room__in=rooms).order_by("timestamp")
+        )
 
         return Response(self.get_serializer(messages, many=True).data)
 
 
 # ✅ Invoice CRUD
 
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(ExportMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Invoice.objects.all().order_by("-issue_at")
     serializer_class = InvoiceSerializer
     permission_classes = [permissions.IsAuthenticated]
+    lookup_value_regex = r"\d+"
+    prefetch_plan = {
+        # The PDF prints owner and transporter details
+        "download_pdf": {"select_related": ["package__user", "transporter"]},
+    }
+    export_name = "invoices"
+    export_columns = {
+        "id": "id", "invoice_number": "invoice_number", "package_id": "package_id",
+        "package_title": "package__title", "owner": "package__user__username",
+        "transporter": "transporter__username", "amount": "amount", "paid": "paid", "issue_at": "issue_at",
+    }
 
     def get_queryset(self):
         user = self.request.user
+        qs = super().get_queryset()
         if user.is_staff:
-            return self.queryset
-        return self.queryset.filter(package__user=user)
+            return qs
+        return qs.filter(package__user=user)
 
     @action(detail=True, methods=["post"])
     def mark_paid(self, request, pk=None):
-        """Mark invoice as paid"""
-        invoice = self.get_object()
-        invoice.paid = True
-        invoice.save()
-        return Response({"status": "Invoice marked as paid"}, status=status.HTTP_200_OK)
+        """Mark invoice as paid: one UPDATE of the paid column, idempotent"""
+        invoices = self.get_queryset().filter(id=int(pk))
+        if invoices.filter(paid=False).update(paid=True):
+            # update() skips post_save; drop the cached PDF that says "Unpaid"
+            pdf_cache.invalidate(int(pk))
+            dashboard.invalidate(invoices.values_list("package__user_id", flat=True).first())
+        elif not invoices.exists():
+            raise NotFound()
+        return Response({"status": "Invoice marked as paid", "id": int(pk), "paid": True}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Invoices streamed as ?output=ndjson|csv, optionally for one month
+        (?month=YYYY-MM) or only ?paid=true|false
+        """
+        qs = self.get_queryset()
+        month = request.query_params.get("month")
+        if month:
+            start, end = statements.month_range(month)
+            qs = qs.filter(issue_at__gte=start, issue_at__lt=end)
+        paid = request.query_params.get("paid")
+        if paid in ("true", "false"):
+            qs = qs.filter(paid=paid == "true")
+        elif paid:
+            raise ValidationError({"paid": "Expected true or false."})
+        return self.export_response(qs)
 
     @action(detail=False, methods=["post"])
     def generate(self, request):
-        """Generate invoice for a package, send PDF via email"""
+        """
+        Create the invoice for a package and queue its PDF email; answers 202
+        at once with the delivery job and a URL to poll its status.
+        """
         package_id = request.data.get("package_id")
         amount = request.data.get("amount")
 
@@ -311,59 +475,213 @@ class InvoiceViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        package = get_object_or_404(Package, id=package_id)
-
-        # Only package owner can generate invoice
-        if package.user != request.user:
-            return Response(
-                {"error": "You are not allowed to generate invoice for this package"},
-                status=status.HTTP_403_FORBIDDEN,
+        with transaction.atomic():
+            # The lock keeps a concurrent generate or bulk_generate from
+            # invoicing the package between the check and the insert
+            package = get_object_or_404(Package.objects.select_for_update(), id=package_id)
+
+            # Only package owner can generate invoice
+            if package.user != request.user:
+                return Response(
+                    {"error": "You are not allowed to generate invoice for this package"},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+
+            # Prevent duplicate invoices
+            if package.invoices.exists():
+                return Response(
+                    {"error": "Invoice already exists for this package"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            # The invoice is billed to the booked transporter, as in bulk_generate
+            if package.booked_by_id is None:
+                return Response(
+                    {"error": "Package has no transporter"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            # Create the invoice; rendering and mailing happen in `manage.py runjobs`
+            invoice = Invoice.objects.create(
+                package=package,
+                transporter=package.booked_by,   # assuming Package has transporter field
+                amount=amount,
             )
+            job, _ = jobs.enqueue(invoice)
 
-        # Prevent duplicate invoices
-        if package.invoices.exists():
-            return Response(
-                {"error": "Invoice already exists for this package"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # Create the invoice
-        invoice = Invoice.objects.create(
-            package=package,
-            transporter=package.booked_by,   # assuming Package has transporter field
-            amount=amount,
+        status_url = request.build_absolute_uri(reverse("invoice-delivery", args=[invoice.id]))
+        return Response(
+            {
+                **InvoiceSerializer(invoice).data,
+                "job": InvoiceJobSerializer(job).data,
+                "status_url": status_url,
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": status_url},
         )
 
-        # Generate PDF
-        pdf_buffer = generate_invoice_pdf(invoice)
+    @action(detail=False, methods=["post"])
+    def bulk_generate(self, request):
+        """
+        Invoice many packages at once: {"package_ids": [...]} or
+        {"filter": {"status", "created_after", "created_before"}}, with an
+        optional {"amounts": {package_id: amount}}. Emails are queued like
+        generate(); answers 202 with the new invoices and skipped packages.
+        """
+        packages = statements.select_packages(request.user, request.data)
+        invoices, skipped = statements.create_invoices(request.user, packages, request.data.get("amounts"))
+        return Response(
+            {
+                "created": len(invoices),
+                "invoices": [
+                    {"id": i.id, "package": i.package_id, "invoice_number": i.invoice_number, "amount": i.amount}
+                    for i in invoices
+                ],
+                "skipped": skipped,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
 
-        # Send email using Owner's email as reply_to
-        owner_email = package.user.email
-        send_invoice_email(invoice, pdf_buffer, owner_email)
+    @action(detail=False, methods=["get"])
+    def statement(self, request):
+        """
+        The month's invoices (?month=YYYY-MM) as one summary PDF, or with
+        ?output=zip as a streamed ZIP of every invoice PDF.
+        """
+        month = request.query_params.get("month", timezone.now().strftime("%Y-%m"))
+        start, end = statements.month_range(month)
+        invoices = list(
+            self.get_queryset().filter(issue_at__gte=start, issue_at__lt=end)
+            .select_related("package__user", "transporter").order_by("issue_at", "id")
+        )
+        if request.query_params.get("output") == "zip":
+            paths = statements.render_many(invoices)
+            response = streaming_response(
+                request, statements.stream_zip(invoices, paths), content_type="application/zip"
+            )
+            response["Content-Disposition"] = f'attachment; filename="invoices_{month}.zip"'
+            return response
+        return FileResponse(
+            statements.statement_pdf(request.user, month, invoices),
+            as_attachment=True, filename=f"Statement_{month}.pdf", content_type="application/pdf",
+        )
 
-        return Response(InvoiceSerializer(invoice).data, status=status.HTTP_201_CREATED)
+    @action(detail=True, methods=["get"])
+    def delivery(self, request, pk=None):
+        """Status of the invoice's background PDF email"""
+        invoice = self.get_object()
+        job = get_object_or_404(InvoiceJob, invoice=invoice, kind=InvoiceJob.DELIVER)
+        return Response(InvoiceJobSerializer(job).data)
 
     @action(detail=True, methods=["get"])
     def download_pdf(self, request, pk=None):
-        """Download invoice as a PDF"""
+        """
+        Download invoice as a PDF, served from the render cache. The ETag is
+        the content digest, so If-None-Match revalidation skips the file too.
+        """
         invoice = self.get_object()
-        buffer = generate_invoice_pdf(invoice)
-        filename = f"Invoice_{invoice.invoice_number}.pdf"
-
-        return FileResponse(
-            buffer, as_attachment=True, filename=filename, content_type="application/pdf"
-        )
+        digest = pdf_cache.digest(invoice)
+        etag = quote_etag(digest)
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            path = pdf_cache.get_pdf(invoice, digest)
+            filename = f"Invoice_{invoice.invoice_number}.pdf"
+            response = FileResponse(
+                open(path, "rb"), as_attachment=True, filename=filename, content_type="application/pdf"
+            )
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
 # ✅ Tracking CRUD
-class TrackingViewSet(viewsets.ModelViewSet):
+class TrackingViewSet(PrefetchPlanMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Latest positions, read-only: positions are written by the booked
+    transporter through `ingest` (or the tracking socket) only.
+    """
     queryset = Tracking.objects.all()
     serializer_class = TrackingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    lookup_value_regex = r"\d+"
 
     def get_queryset(self):
         user = self.request.user
+        qs = super().get_queryset()
         if user.is_staff:
-            return self.queryset
-        return self.queryset.filter(package__user=user)
+            return qs
+        return qs.filter(Q(package__user=user) | Q(package__booked_by=user))
+
+    @action(detail=False, methods=["post"])
+    def ingest(self, request):
+        """
+        Bulk GPS ingest from drivers: {"points": [{"package", "latitude",
+        "longitude", "recorded_at"}, ...]}. Points go to the history table in
+        one bulk insert; each package's latest position is upserted and pushed
+        to its watchers.
+        """
+        points = parse_points(request.data.get("points"))
+        package_ids = {point.package_id for point in points}
+        if package_ids - senders_packages(request.user, package_ids):
+            raise PermissionDenied("You can only report positions for packages you have booked.")
+
+        fresh = store_points(points)
+        broadcast(fresh)
+        return Response({"accepted": len(points), "updated": len(fresh)}, status=status.HTTP_201_CREATED)
+
+    TRACK_MAX_POINTS = 1000
+    TRACK_POINT_LIMIT = 10000
+
+    @action(detail=True, methods=["get"])
+    def path(self, request, pk=None):
+        """
+        The trip path of package `pk` (a package id, not a tracking row id),
+        downsampled for a map: ?max_points=N (default 1000) and/or ?zoom=0-22,
+        optional ?since=/&until= ISO datetimes. ?encoding=polyline returns a
+        Google encoded polyline instead of a list. Points are [latitude,
+        longitude, seconds since "start"].
+        """
+        packages = Package.objects.all()
+        if not request.user.is_staff:
+            packages = packages.filter(Q(user=request.user) | Q(booked_by=request.user))
+        package_id = get_object_or_404(packages.values_list("id", flat=True), id=pk)
+        params = request.query_params
+        try:
+            max_points = min(int(params.get("max_points", self.TRACK_MAX_POINTS)), self.TRACK_POINT_LIMIT)
+            zoom = int(params["zoom"]) if params.get("zoom") else None
+        except ValueError:
+            raise ValidationError({"detail": "max_points and zoom must be integers."})
+        if max_points < 2 or (zoom is not None and not 0 <= zoom <= 22):
+            raise ValidationError({"detail": "max_points must be at least 2 and zoom between 0 and 22."})
+        since, until = self._datetime_param("since"), self._datetime_param("until")
+
+        track = load_track(package_id, since=since, until=until)
+        points = downsample(track, max_points=max_points, zoom=zoom)
+        start = points[0][2] if points else None
+        payload = {
+            "package": package_id,
+            "start": start,
+            "source_count": len(track),
+            "count": len(points),
+        }
+        offsets = [round((p[2] - start).total_seconds(), 1) for p in points]
+        if params.get("encoding") == "polyline":
+            payload["polyline"] = encode_polyline(points)
+            payload["offsets"] = offsets
+        else:
+            payload["points"] = [[p[0], p[1], t] for p, t in zip(points, offsets)]
+        return Response(payload)
+
+    def _datetime_param(self, name):
+        raw = self.request.query_params.get(name)
+        if not raw:
+            return None
+        value = parse_datetime(raw)
+        if value is None:
+            raise ValidationError({name: "Expected an ISO 8601 datetime."})
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, datetime.timezone.utc)
+        return value
 
 
 # ✅ Dashboard Analytics
@@ -371,66 +689,214 @@ class DashboardAnalytics(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        base_qs = Package.objects.filter(user=user) if not user.is_staff else Package.objects.all()
-
-        total_packages = base_qs.count()
-        current = base_qs.filter(status="Available").count()
-        negotiating = base_qs.filter(status="Negotiating").count()
-        ready_to_load = base_qs.filter(status="Booked").count()
-        delivered = base_qs.filter(status="Delivered").count()
-        total_offers = Offer.objects.filter(package__in=base_qs).count()
-        total_invoice_amount = Invoice.objects.filter(package__in=base_qs).aggregate(total=Sum("amount"))["total"] or 0
-
-        data = {
-            "total_packages": total_packages,
-            "current_packages": current,
-            "negotiating_packages": negotiating,
-            "ready_to_load": ready_to_load,
-            "delivered_packages": delivered,
-            "total_offers": total_offers,
-            "total_invoice_amount": float(total_invoice_amount),
-        }
-        return Response(data)
+        return Response(dashboard.get_snapshot(request.user))
+
+
+class DashboardCacheStats(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(dashboard.cache_stats())
 
 
 # ✅ Marketplace (public)
-class MarketplaceViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Package.objects.filter(status="Available")
+class MarketplaceViewSet(SearchMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Package.objects.filter(status="Available").order_by("-create_at", "-id")
     serializer_class = PublicPackageSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
+    # max_weight is handled by filter_proximity, with the vehicle capacity
+    filter_fields = {
+        "created_after": ("create_at__gte", "date"),
+        "created_before": ("create_at__lte", "date"),
+        "min_weight": ("weight__gte", "number"),
+        "min_price": ("price_expectation__gte", "number"),
+        "max_price": ("price_expectation__lte", "number"),
+        "route": (("pickup_location", "drop_location"), "text"),
+    }
+
+    def get_projection(self):
+        """Fields requested through ?fields=a,b,c (None means the full payload)"""
+        raw = self.request.query_params.get("fields")
+        if not raw:
+            return None
+        requested = [name.strip() for name in raw.split(",") if name.strip()]
+        unknown = sorted(set(requested) - set(PublicPackageSerializer.Meta.fields))
+        if unknown:
+            raise ValidationError({"fields": f"Unknown fields: {', '.join(unknown)}"})
+        return requested
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        fields = self.get_projection()
+        if fields:
+            # The cursor columns are always needed by the paginator
+            columns = set(fields) | {"id", "create_at"}
+            if columns & {"images", "image_srcset"}:
+                columns = (columns - {"image_srcset"}) | {"images", "image_variants"}
+            qs = qs.only(*columns)
+        return self.filter_proximity(qs)
+
+    def filter_proximity(self, qs):
+        """
+        ?pickup_near=lat,lon / ?drop_near=lat,lon within ?radius_km (default 50),
+        and ?max_weight=<kg> or ?vehicle=<id> to cap weight at a truck's capacity.
+        """
+        params = self.request.query_params
+        radius = self._float_param("radius_km", 50.0)
+        if radius <= 0:
+            raise ValidationError({"radius_km": "Must be positive."})
+        for prefix in ("pickup", "drop"):
+            point = params.get(f"{prefix}_near")
+            if point:
+                latitude, longitude = self._parse_point(f"{prefix}_near", point)
+                qs = within_radius(qs, latitude, longitude, radius, prefix=prefix)
+
+        max_weight = self._float_param("max_weight", None)
+        vehicle_id = params.get("vehicle")
+        if vehicle_id:
+            user = self.request.user
+            if not user.is_authenticated:
+                raise PermissionDenied("Log in to search by vehicle capacity.")
+            vehicle = get_object_or_404(Vehicle, id=vehicle_id, transporter=user)
+            capacity = vehicle.capacity_kg
+            max_weight = capacity if max_weight is None else min(max_weight, capacity)
+        if max_weight is not None:
+            qs = qs.filter(weight__lte=max_weight)
+        return qs
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_projection()
+        if fields:
+            kwargs["fields"] = fields
+        return super().get_serializer(*args, **kwargs)
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """Full-text search over open listings (?q=), combinable with the proximity filters"""
+        return self.search_response(self.get_queryset())
 
 
 
-class VehicleViewSet(viewsets.ModelViewSet):
+class VehicleViewSet(QueryParamMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Vehicle.objects.all().order_by("-created_at")
     serializer_class = VehicleSerializer
     permission_classes = [permissions.IsAuthenticated]
-    print('iam in')
+    prefetch_plan = {
+        "default": {"select_related": ["transporter"]},
+    }
+
     def get_queryset(self):
         user = self.request.user
+        qs = super().get_queryset()
         if user.is_transporter:
-            print(self.queryset.filter(transporter=user))
-            return self.queryset.filter(transporter=user)
-        return self.queryset.none()
+            return qs.filter(transporter=user)
+        return qs.none()
 
     def perform_create(self, serializer):
         serializer.save(transporter=self.request.user)
 
+    @action(detail=False, methods=["get"])
+    def matches(self, request):
+        """
+        Suggested open packages for each of the transporter's available
+        vehicles, best first (see matching.py). ?origin=lat,lon and
+        ?destination=lat,lon weigh in route proximity, ?radius_km drops
+        pickups farther than that from origin, ?k (default 5) per vehicle.
+        """
+        params = request.query_params
+        origin = self._parse_point("origin", params["origin"]) if params.get("origin") else None
+        destination = self._parse_point("destination", params["destination"]) if params.get("destination") else None
+        radius = self._float_param("radius_km", None)
+        if radius is not None and (origin is None or radius <= 0):
+            raise ValidationError({"radius_km": "Must be positive and used with origin."})
+        try:
+            k = int(params.get("k", 0)) or None
+        except ValueError:
+            raise ValidationError({"k": "Must be an integer."})
+
+        vehicles = list(
+            self.get_queryset().filter(available=True).values_list("id", "truck_number", "capacity")
+        )
+        ranked = matching.rank(
+            [(pk, float(capacity) * 1000) for pk, _, capacity in vehicles],
+            origin=origin, destination=destination, k=k, radius_km=radius,
+        )
+        # One query for the suggested packages; rows booked since the book
+        # was last refreshed drop out here
+        package_ids = {item["package"] for items in ranked.values() for item in items}
+        packages = {
+            row["id"]: row for row in Package.objects.filter(id__in=package_ids, status__in=matching.OPEN).values(
+                "id", "title", "pickup_location", "drop_location", "weight", "price_expectation",
+            )
+        }
+        return Response([
+            {
+                "vehicle": pk, "truck_number": number, "capacity": capacity,
+                "matches": [{**packages[item["package"]], **item} for item in ranked[pk] if item["package"] in packages],
+            }
+            for pk, number, capacity in vehicles
+        ])
+
+    @action(detail=True, methods=["get"])
+    def consolidate(self, request, pk=None):
+        """
+        Open packages on a shared corridor that this vehicle could carry
+        together, fullest load first (see consolidation.py).
+        ?pickup_near=lat,lon within ?radius_km (default 50) limits the
+        candidates; ?min_packages (default 2) and ?limit shape the plan.
+        """
+        vehicle = self.get_object()
+        params = request.query_params
+        queryset = None
+        if params.get("pickup_near"):
+            radius = self._float_param("radius_km", 50.0)
+            if radius <= 0:
+                raise ValidationError({"radius_km": "Must be positive."})
+            latitude, longitude = self._parse_point("pickup_near", params["pickup_near"])
+            queryset = within_radius(Package.objects.all(), latitude, longitude, radius)
+        try:
+            min_packages = int(params["min_packages"]) if params.get("min_packages") else None
+            limit = int(params["limit"]) if params.get("limit") else None
+        except ValueError:
+            raise ValidationError({"detail": "min_packages and limit must be integers."})
+
+        loads = consolidation.plan(vehicle.capacity_kg, queryset=queryset, min_packages=min_packages, max_loads=limit)
+        packages = Package.objects.only(
+            "title", "weight", "pickup_location", "drop_location", "price_expectation",
+        ).in_bulk([package_id for load in loads for package_id in load["packages"]])
+        for load in loads:
+            load["packages"] = [
+                {
+                    "id": package.id, "title": package.title, "weight": package.weight,
+                    "pickup_location": package.pickup_location, "drop_location": package.drop_location,
+                    "price_expectation": package.price_expectation,
+                }
+                for package in map(packages.get, load["packages"]) if package is not None
+            ]
+        return Response({"vehicle": vehicle.id, "capacity": vehicle.capacity, "loads": loads})
+
 
 # ✅ Staff Management
-class StaffViewSet(viewsets.ModelViewSet):
+ROSTER_CHUNK_SIZE = 1000
+
+
+class StaffViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Staff.objects.all().order_by("-created_at")
     serializer_class = StaffSerializer
     permission_classes = [permissions.IsAuthenticated]
+    prefetch_plan = {
+        "default": {"select_related": ["transporter", "vehicle__transporter"]},
+    }
 
     def get_queryset(self):
         user = self.request.user
+        qs = super().get_queryset()
         if getattr(user, "is_superuser", False):
-            return self.queryset
+            return qs
         if getattr(user, "is_transporter", False):
-            return self.queryset.filter(transporter=user)
-        return self.queryset.none()
+            return qs.filter(transporter=user)
+        return qs.none()
 
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
@@ -445,16 +911,27 @@ class StaffViewSet(viewsets.ModelViewSet):
         """
         Return staff grouped by vehicle: one driver + helpers
         """
-        user = request.user
-        vehicles = Vehicle.objects.filter(transporter=user)
+        staff_qs = Staff.objects.select_related("transporter").order_by("created_at")
+        vehicles = (
+            Vehicle.objects.filter(transporter=request.user)
+            .select_related("transporter")
+            .prefetch_related(
+                Prefetch("staff", queryset=staff_qs.filter(role="driver"), to_attr="drivers"),
+                Prefetch("staff", queryset=staff_qs.filter(role="helper"), to_attr="helpers"),
+            )
+            .order_by("id")
+        )
+        return streaming_response(
+            request, stream_json_array(self._roster_rows(vehicles)),
+            content_type="application/json",
+        )
 
-        data = []
-        for v in vehicles:
-            driver = v.staff.filter(role="driver").first()
-            helpers = v.staff.filter(role="helper")
-            data.append({
+    def _roster_rows(self, vehicles):
+        # Prefetches run once per chunk, so large fleets stream out chunk by chunk
+        for v in vehicles.iterator(chunk_size=ROSTER_CHUNK_SIZE):
+            driver = v.drivers[0] if v.drivers else None
+            yield {
                 "truck_number": v.truck_number,
                 "driver": StaffSerializer(driver).data if driver else None,
-                "helpers": StaffSerializer(helpers, many=True).data,
-            })
-        return response.Response(data)
\ No newline at end of file
+                "helpers": StaffSerializer(v.helpers, many=True).data,
+            }
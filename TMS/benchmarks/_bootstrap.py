@@ -0,0 +1,66 @@
+"""
+Shared setup for the benchmark scripts.
+
+Benchmarks run against a throwaway SQLite database so they never touch
+db.sqlite3. With BENCH_DATABASE_URL they run on that server instead, in a
+scratch test_<name> database created like the test runner's and dropped on
+exit, so nothing they write is left in the named database. Run them from the
+TMS directory, e.g. ``python -m benchmarks.bench_geosearch``.
+"""
+import atexit
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup():
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "TMS.settings")
+
+    from django.conf import settings
+
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if url:
+        import dj_database_url
+        settings.DATABASES["default"] = dj_database_url.parse(url)
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix="tms-bench-"), "bench.sqlite3")
+        settings.DATABASES["default"]["NAME"] = path
+    settings.ALLOWED_HOSTS = ["*"]
+    settings.DEBUG = False
+    django.setup()
+
+    if url:
+        from django.db import connection
+        name = connection.settings_dict["NAME"]
+        # Migrates and creates the cache table, as for the test suite
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        atexit.register(connection.creation.destroy_test_db, name, verbosity=0)
+    else:
+        from django.core.management import call_command
+        call_command("migrate", verbosity=0)
+        call_command("createcachetable", verbosity=0)
+
+
+def timed(fn, repeat=5):
+    """Run fn repeat times; return (best seconds, last result)"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(title, rows):
+    print(f"\n{title}")
+    width = max(len(name) for name, _ in rows)
+    for name, value in rows:
+        print(f"  {name.ljust(width)}  {value}")
@@ -0,0 +1,91 @@
+"""
+Time per 1,000 invoices: one generate call per package against a single
+bulk_generate call, then rendering the PDFs serially against a process
+pool, and building the month's statement PDF and streamed ZIP.
+
+    python -m benchmarks.bench_bulk_invoices [--invoices 1000] [--workers 0 (= cpu count)]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks._bootstrap import report, setup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from TMSapp import statements
+    from TMSapp.models import Invoice, InvoiceJob, Package, User
+
+    settings.INVOICE_PDF_CACHE_DIR = tempfile.mkdtemp(prefix="tms-bench-pdf-")
+    settings.STATEMENTS = {"workers": args.workers or os.cpu_count() or 1}
+    workers = statements.workers()
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    driver = User.objects.create_user("bench-driver", password="x", is_transporter=True)
+    client = APIClient()
+    client.force_authenticate(owner)
+
+    def new_packages():
+        return Package.objects.bulk_create([
+            Package(
+                user=owner, booked_by=driver, title=f"Load {i}", description="bench",
+                pickup_location="Pune", drop_location="Mumbai", weight=1000,
+                price_expectation=1000, status="Delivered",
+            )
+            for i in range(args.invoices)
+        ])
+
+    def reset():
+        Invoice.objects.all().delete()
+        Package.objects.all().delete()
+
+    def per_thousand(seconds):
+        return f"{seconds / args.invoices * 1000:7.2f} s per 1,000"
+
+    rows = []
+    packages = new_packages()
+    start = time.perf_counter()
+    for package in packages:
+        response = client.post("/api/invoices/generate/", {"package_id": package.id, "amount": 900}, format="json")
+        assert response.status_code == 202, response.content
+    rows.append(("generate, one call per package", per_thousand(time.perf_counter() - start)))
+    reset()
+
+    packages = new_packages()
+    start = time.perf_counter()
+    response = client.post(
+        "/api/invoices/bulk_generate/", {"package_ids": [p.id for p in packages]}, format="json",
+    )
+    rows.append(("bulk_generate, one call", per_thousand(time.perf_counter() - start)))
+    assert response.data["created"] == args.invoices, response.data
+    assert InvoiceJob.objects.count() == args.invoices
+
+    invoices = list(Invoice.objects.select_related("package__user", "transporter").order_by("id"))
+    for label, parallel in (("render PDFs, 1 process", False), (f"render PDFs, {workers} processes", True)):
+        shutil.rmtree(settings.INVOICE_PDF_CACHE_DIR, ignore_errors=True)
+        start = time.perf_counter()
+        statements.render_many(invoices, parallel=parallel)
+        rows.append((label, per_thousand(time.perf_counter() - start)))
+
+    month = timezone.now().strftime("%Y-%m")
+    for label, query in (("statement PDF", ""), ("statement ZIP (cached PDFs)", "&output=zip")):
+        start = time.perf_counter()
+        response = client.get(f"/api/invoices/statement/?month={month}{query}")
+        size = sum(len(chunk) for chunk in response.streaming_content)
+        rows.append((label, f"{per_thousand(time.perf_counter() - start)}, {size / 1024:,.0f} KiB"))
+
+    report(f"{args.invoices:,} invoices", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Cross-process fan-out through ShardedChannelLayer and the local broker.
+
+N worker processes each hold C channels (one per simulated WebSocket) in one
+group; a publisher group_sends M timestamped messages. Reports delivered
+messages/second and delivery latency percentiles.
+
+    python -m benchmarks.bench_channel_layer [--workers 4] [--sockets 25] [--messages 2000]
+                                             [--shards 2] [--rate 0]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks._bootstrap import BASE_DIR, report
+
+sys.path.insert(0, str(BASE_DIR))
+
+from TMSapp.broker import serve  # noqa: E402
+from TMSapp.channel_layer import ShardedChannelLayer  # noqa: E402
+
+GROUP = "bench"
+
+
+def run_shard(path):
+    asyncio.run(serve(path, capacity=10_000))
+
+
+def run_worker(shards, sockets, messages, ready, results):
+    async def main():
+        layer = ShardedChannelLayer(shards)
+        channels = [await layer.new_channel() for _ in range(sockets)]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+        ready.release()
+
+        latencies = []
+
+        async def socket(channel):
+            for _ in range(messages):
+                message = await layer.receive(channel)
+                latencies.append(time.time() - message["sent"])
+
+        await asyncio.gather(*(socket(channel) for channel in channels))
+        results.put((latencies, time.time()))
+        await layer.close()
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--sockets", type=int, default=25, help="channels per worker")
+    parser.add_argument("--messages", type=int, default=2000, help="group_send calls")
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=0, help="group_send calls/s (0 = as fast as possible)")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="tms-broker-")
+    shards = [os.path.join(tmp, f"shard-{i}.sock") for i in range(args.shards)]
+    brokers = [multiprocessing.Process(target=run_shard, args=(path,), daemon=True) for path in shards]
+    for broker in brokers:
+        broker.start()
+    while not all(os.path.exists(path) for path in shards):
+        time.sleep(0.01)
+
+    ready = multiprocessing.Semaphore(0)
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=run_worker, args=(shards, args.sockets, args.messages, ready, results)
+        )
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        ready.acquire()
+
+    async def publish():
+        layer = ShardedChannelLayer(shards)
+        for i in range(args.messages):
+            if args.rate:
+                delay = start + i / args.rate - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await layer.group_send(GROUP, {"type": "chat.message", "n": i, "sent": time.time()})
+        await layer.close()
+
+    start = time.time()
+    asyncio.run(publish())
+    published = time.time()
+
+    latencies = []
+    finished = start
+    for _ in workers:
+        worker_latencies, done = results.get()
+        latencies.extend(worker_latencies)
+        finished = max(finished, done)
+    for worker in workers:
+        worker.join()
+    for broker in brokers:
+        broker.terminate()
+
+    latencies.sort()
+    delivered = len(latencies)
+    p = lambda q: latencies[min(int(q * delivered), delivered - 1)] * 1000  # noqa: E731
+    report(
+        f"{args.workers} workers x {args.sockets} sockets, {args.shards} shards, "
+        f"{args.messages} group_sends -> {delivered} deliveries",
+        [
+            ("group_send rate", f"{args.messages / (published - start):10.0f} /s"),
+            ("delivered", f"{delivered / (finished - start):10.0f} msg/s"),
+            ("latency p50", f"{p(0.50):10.2f} ms"),
+            ("latency p99", f"{p(0.99):10.2f} ms"),
+            ("latency mean", f"{statistics.fmean(latencies) * 1000:10.2f} ms"),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
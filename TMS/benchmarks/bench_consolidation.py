@@ -0,0 +1,68 @@
+"""
+Consolidation planner on a synthetic fleet: trips needed when every open
+package travels alone against the first-fit-decreasing loads per
+corridor, and the time to plan them serially and in the process pool.
+
+    python -m benchmarks.bench_consolidation [--packages 100000] [--corridors 400] [--workers 4]
+"""
+import argparse
+import random
+
+from benchmarks._bootstrap import report, setup, timed
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Truck classes in tonnes and how many of each the fleet has
+FLEET = {7.5: 40, 12: 30, 20: 20, 31: 10}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=100_000)
+    parser.add_argument("--corridors", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from TMSapp import consolidation
+    from TMSapp.models import Package, User
+
+    settings.CONSOLIDATION = {"workers": args.workers}
+    rng = random.Random(5)
+    cell = lambda: "".join(rng.choice(BASE32) for _ in range(4))
+    corridors = [(cell(), cell()) for _ in range(args.corridors)]
+    suffix = lambda: "".join(rng.choice(BASE32) for _ in range(4))
+
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    for start in range(0, args.packages, 10_000):
+        rows = []
+        for i in range(start, min(start + 10_000, args.packages)):
+            pickup, drop = rng.choice(corridors)
+            rows.append(Package(
+                user=owner, title=f"Load {i}", description="bench", pickup_location="-", drop_location="-",
+                weight=round(min(rng.lognormvariate(7.8, 0.8), 30_000), 1), price_expectation=1000,
+                pickup_geohash=pickup + suffix(), drop_geohash=drop + suffix(),
+            ))
+        Package.objects.bulk_create(rows)
+
+    rows = []
+    for tonnes, count in FLEET.items():
+        capacity = tonnes * 1000
+        query, groups = timed(lambda: consolidation.corridors(capacity, 4), repeat=1)
+        packages = sum(len(items) for items in groups.values())
+        serial, loads = timed(lambda: consolidation.pack(groups, capacity, parallel=False), repeat=1)
+        consolidation.pack(groups, capacity, parallel=True)     # start the pool
+        parallel, _ = timed(lambda: consolidation.pack(groups, capacity, parallel=True), repeat=3)
+        combined = [load for load in loads if len(load[2]) > 1]
+        fill = sum(load[1] for load in loads) / (len(loads) * capacity)
+        rows.append((f"{tonnes:g} t x{count}", (
+            f"{packages} pkgs -> {len(loads)} loads ({packages / len(loads):.1f}/load, {fill:.0%} full, "
+            f"{len(combined)} combined)   query {query * 1000:.0f} ms   "
+            f"FFD {serial * 1000:.0f} ms serial / {parallel * 1000:.0f} ms x{consolidation.workers()} procs"
+        )))
+
+    report(f"{args.packages} open packages over {args.corridors} corridors", rows)
+
+
+if __name__ == "__main__":
+    main()
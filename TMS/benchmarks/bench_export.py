@@ -0,0 +1,127 @@
+"""
+Bulk export: rows per second of /packages/export/ as NDJSON and CSV (export.py)
+against rendering the same rows with PackageSerializer, and the peak Python
+memory of an export at a tenth of the rows and at all of them, served as
+under WSGI and as under ASGI (utils.streaming_response).
+
+    python -m benchmarks.bench_export [--packages 1000000] [--serializer-rows 50000]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from benchmarks._bootstrap import report, setup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=1_000_000)
+    parser.add_argument("--serializer-rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    setup()
+    from asgiref.sync import async_to_sync
+    from django.db import transaction
+    from django.test import AsyncRequestFactory
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from TMSapp.models import Package, User
+    from TMSapp.serializers import PackageSerializer
+    from TMSapp.views import Packageviewset
+
+    rng = random.Random(3)
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    transporter = User.objects.create_user("bench-transporter", password="x", is_transporter=True)
+    statuses = ["Available", "Negotiating", "Booked", "Loaded", "Delivered"]
+    for start in range(0, args.packages, 20_000):
+        with transaction.atomic():
+            Package.objects.bulk_create([
+                Package(
+                    user=owner, booked_by=transporter if i % 3 else None, title=f"Load {i}",
+                    description="bench", pickup_location="Pune", drop_location="Mumbai",
+                    weight=round(rng.uniform(50, 20_000), 1), price_expectation=round(rng.uniform(500, 90_000), 2),
+                    status=rng.choice(statuses),
+                )
+                for i in range(start, min(start + 20_000, args.packages))
+            ], batch_size=2000)
+
+    view = Packageviewset.as_view({"get": "export"})
+
+    def export(output, limit=None):
+        """Stream one export to nowhere; returns (rows, bytes)"""
+        request = APIRequestFactory().get("/api/packages/export/", {"output": output})
+        force_authenticate(request, owner)
+        response = view(request)
+        size = lines = 0
+        for part in response.streaming_content:
+            size += len(part)
+            lines += part.count(b"\n")
+            if limit and lines >= limit:
+                break
+        response.close()
+        return lines - (output == "csv"), size
+
+    def export_asgi(output):
+        """The same export with an ASGI request, whose content is an async iterator"""
+        request = AsyncRequestFactory().get("/api/packages/export/", {"output": output})
+        force_authenticate(request, owner)
+        response = view(request)
+
+        async def consume():
+            size = lines = 0
+            async for part in response.streaming_content:
+                size += len(part)
+                lines += part.count(b"\n")
+            return lines - (output == "csv"), size
+
+        return async_to_sync(consume)()
+
+    rows = []
+    for output in ("ndjson", "csv"):
+        start = time.perf_counter()
+        count, size = export(output)
+        elapsed = time.perf_counter() - start
+        rows.append((f"export {output}", (
+            f"{count / elapsed:10,.0f} rows/s   {count} rows, {size / 2**20:.0f} MiB in {elapsed:.1f} s"
+        )))
+        start = time.perf_counter()
+        count, size = export_asgi(output)
+        elapsed = time.perf_counter() - start
+        rows.append((f"export {output} under ASGI", (
+            f"{count / elapsed:10,.0f} rows/s   {count} rows, {size / 2**20:.0f} MiB in {elapsed:.1f} s"
+        )))
+
+    def serialize():
+        qs = Package.objects.filter(user=owner).select_related("user", "booked_by").order_by("-create_at")
+        return JSONRenderer().render(PackageSerializer(qs[:args.serializer_rows], many=True).data)
+
+    start = time.perf_counter()
+    serialize()
+    elapsed = time.perf_counter() - start
+    rows.append(("PackageSerializer + JSONRenderer", (
+        f"{args.serializer_rows / elapsed:10,.0f} rows/s   {args.serializer_rows} rows in {elapsed:.1f} s"
+    )))
+
+    def peak(fn):
+        tracemalloc.start()
+        fn()
+        _, top = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return top / 2**20
+
+    tenth = args.packages // 10
+    rows.append(("peak memory, ndjson", (
+        f"{peak(lambda: export('ndjson', tenth)):8.1f} MiB at {tenth} rows   "
+        f"{peak(lambda: export('ndjson')):8.1f} MiB at {args.packages} rows"
+    )))
+    rows.append(("peak memory, ndjson under ASGI", (
+        f"{peak(lambda: export_asgi('ndjson')):8.1f} MiB at {args.packages} rows"
+    )))
+    rows.append(("peak memory, serializer", f"{peak(serialize):8.1f} MiB at {args.serializer_rows} rows"))
+
+    report(f"Package export over {args.packages} packages", rows)
+
+
+if __name__ == "__main__":
+    main()
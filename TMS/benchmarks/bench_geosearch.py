@@ -0,0 +1,77 @@
+"""
+Marketplace proximity search: geohash-indexed query vs a naive full scan.
+
+    python -m benchmarks.bench_geosearch [--packages 100000] [--radius 50]
+"""
+import argparse
+import random
+
+from benchmarks._bootstrap import report, setup, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=100_000)
+    parser.add_argument("--radius", type=float, default=50.0)
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+    from TMSapp.geo import distance_expression, geohash_encode, haversine_km, within_radius
+    from TMSapp.models import Package, User
+
+    rng = random.Random(42)
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    rows = []
+    for i in range(args.packages):
+        # Roughly the bounding box of India
+        plat, plon = rng.uniform(8, 32), rng.uniform(70, 90)
+        dlat, dlon = rng.uniform(8, 32), rng.uniform(70, 90)
+        rows.append(Package(
+            user=owner, title=f"Load {i}", description="bench",
+            pickup_location="bench", drop_location="bench",
+            weight=rng.uniform(100, 30000), price_expectation=1000,
+            status="Available" if rng.random() < 0.9 else "Delivered",
+            pickup_latitude=plat, pickup_longitude=plon, pickup_geohash=geohash_encode(plat, plon),
+            drop_latitude=dlat, drop_longitude=dlon, drop_geohash=geohash_encode(dlat, dlon),
+        ))
+    Package.objects.bulk_create(rows, batch_size=5000)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+    truck = (18.520430, 73.856744)  # Pune
+    capacity = 10_000
+    base = Package.objects.filter(status="Available", weight__lte=capacity)
+
+    def indexed():
+        return sorted(within_radius(base, *truck, args.radius).values_list("id", flat=True))
+
+    def sql_scan():
+        qs = base.annotate(pickup_distance_km=distance_expression(*truck))
+        return sorted(qs.filter(pickup_distance_km__lte=args.radius).values_list("id", flat=True))
+
+    def python_scan():
+        return sorted(
+            pk for pk, lat, lon in base.values_list("id", "pickup_latitude", "pickup_longitude")
+            if haversine_km(truck[0], truck[1], lat, lon) <= args.radius
+        )
+
+    t_index, ids_index = timed(indexed)
+    t_sql, ids_sql = timed(sql_scan, repeat=3)
+    t_py, ids_py = timed(python_scan, repeat=3)
+    assert ids_index == ids_sql == ids_py, "search strategies disagree"
+
+    report(
+        f"{args.packages} packages, radius {args.radius} km, weight <= {capacity} kg "
+        f"-> {len(ids_index)} matches",
+        [
+            ("geohash index", f"{t_index * 1000:8.2f} ms"),
+            ("SQL full scan", f"{t_sql * 1000:8.2f} ms"),
+            ("Python full scan", f"{t_py * 1000:8.2f} ms"),
+            ("speed-up vs SQL scan", f"{t_sql / t_index:8.1f}x"),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
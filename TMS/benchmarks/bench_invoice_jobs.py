@@ -0,0 +1,118 @@
+"""
+Request latency of POST /api/invoices/generate/ as the mail server slows
+down: the old inline render-and-send path against the queued path, plus how
+fast a pool of runjobs workers drains the queue.
+
+Mail goes through an in-memory backend that sleeps for the given latency
+before "sending".
+
+    python -m benchmarks.bench_invoice_jobs [--requests 20] [--latencies 0,0.1,0.5,1] [--workers 8]
+"""
+import argparse
+import multiprocessing
+import statistics
+import time
+
+from django.core.mail.backends.locmem import EmailBackend
+
+from benchmarks._bootstrap import report, setup
+
+
+class SlowEmailBackend(EmailBackend):
+    # Loaded by dotted path, i.e. as a different module object than __main__,
+    # so the latency travels through settings rather than a class attribute
+    def send_messages(self, messages):
+        from django.conf import settings
+        time.sleep(settings.BENCH_MAIL_LATENCY)
+        return super().send_messages(messages)
+
+
+def drain(burst):
+    from TMSapp.jobs import work
+    work(burst=burst)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latencies", default="0,0.1,0.5,1", help="mail latencies in seconds")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    setup()
+    from django import db
+    from django.conf import settings
+    from rest_framework.test import APIClient
+    from TMSapp.models import Invoice, InvoiceJob, Package, User
+    from TMSapp.utils import generate_invoice_pdf, send_invoice_email
+
+    settings.EMAIL_BACKEND = "benchmarks.bench_invoice_jobs.SlowEmailBackend"
+    settings.INVOICE_JOBS = {**getattr(settings, "INVOICE_JOBS", {}), "poll_interval": 0.05}
+
+    owner = User.objects.create_user("bench-owner", email="o@example.com", password="x", is_owner=True)
+    driver = User.objects.create_user("bench-driver", email="d@example.com", password="x", is_transporter=True)
+    client = APIClient()
+    client.force_authenticate(owner)
+
+    def new_packages():
+        return Package.objects.bulk_create([
+            Package(
+                user=owner, booked_by=driver, title=f"Load {i}", description="bench",
+                pickup_location="Pune", drop_location="Mumbai", weight=1000,
+                price_expectation=1000, status="Delivered",
+            )
+            for i in range(args.requests)
+        ])
+
+    def inline(package):
+        # What generate() did before the queue: render and send in the request
+        invoice = Invoice.objects.create(package=package, transporter=driver, amount=900)
+        send_invoice_email(invoice, generate_invoice_pdf(invoice), owner.email)
+
+    def queued(package):
+        response = client.post(
+            "/api/invoices/generate/", {"package_id": package.id, "amount": 900}, format="json",
+        )
+        assert response.status_code == 202, response.content
+
+    def latencies(fn):
+        samples = []
+        for package in new_packages():
+            start = time.perf_counter()
+            fn(package)
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples) * 1000, max(samples) * 1000
+
+    rows = []
+    for latency in [float(x) for x in args.latencies.split(",")]:
+        settings.BENCH_MAIL_LATENCY = latency
+        inline_p50, inline_max = latencies(inline)
+        queued_p50, queued_max = latencies(queued)
+
+        # Forked workers inherit the backend latency and settings above
+        db.connections.close_all()
+        start = time.perf_counter()
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=drain, args=(True,)) for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        drain(True)    # anything a worker skipped while another held the write lock
+        drained = time.perf_counter() - start
+        done = InvoiceJob.objects.filter(status=InvoiceJob.DONE).count()
+        assert done == InvoiceJob.objects.count(), "not every job finished"
+        InvoiceJob.objects.all().delete()
+
+        rows.append((
+            f"mail {latency * 1000:.0f} ms",
+            f"inline p50 {inline_p50:7.1f} ms (max {inline_max:7.1f})   "
+            f"queued p50 {queued_p50:5.1f} ms (max {queued_max:5.1f})   "
+            f"{args.workers} workers drain {done / drained:6.1f} jobs/s",
+        ))
+
+    report(f"{args.requests} invoice requests per mail latency", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Cost of GET /api/invoices/<id>/download_pdf/ against the content-addressed
+cache: a miss (render and write, what every download used to cost), a hit
+streamed from disk, and an If-None-Match revalidation.
+
+    python -m benchmarks.bench_invoice_pdf [--requests 200]
+"""
+import argparse
+import tempfile
+
+from benchmarks._bootstrap import report, setup, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from rest_framework.test import APIClient
+    from TMSapp import pdf_cache
+    from TMSapp.models import Invoice, Package, User
+    from TMSapp.utils import generate_invoice_pdf
+
+    settings.INVOICE_PDF_CACHE_DIR = tempfile.mkdtemp(prefix="tms-bench-pdf-")
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    driver = User.objects.create_user("bench-driver", password="x", is_transporter=True)
+    package = Package.objects.create(
+        user=owner, booked_by=driver, title="Load", description="bench",
+        pickup_location="Pune", drop_location="Mumbai", weight=1000,
+        price_expectation=1000, status="Delivered",
+    )
+    invoice = Invoice.objects.create(package=package, transporter=driver, amount=900)
+    url = f"/api/invoices/{invoice.id}/download_pdf/"
+    client = APIClient()
+    client.force_authenticate(owner)
+
+    def download(**headers):
+        response = client.get(url, headers=headers)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    def render_each_time():
+        loaded = Invoice.objects.select_related("package__user", "transporter").get(id=invoice.id)
+        return generate_invoice_pdf(loaded).getvalue()
+
+    def per_request(fn):
+        best, _ = timed(lambda: [fn() for _ in range(args.requests)], repeat=3)
+        return f"{best / args.requests * 1000:6.2f} ms/request"
+
+    def cold():
+        pdf_cache.invalidate(invoice.id)
+        return download()
+
+    etag = download()["ETag"]
+    rows = [
+        ("render alone, outside a request", per_request(render_each_time)),
+        ("cache miss (render + write)", per_request(cold)),
+        ("cache hit (FileResponse)", per_request(download)),
+        ("If-None-Match -> 304", per_request(lambda: download(if_none_match=etag))),
+    ]
+    report(f"{args.requests} downloads of one invoice", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Renders per second and peak memory of the invoice PDF renderer with the
+precompiled static layer against the previous draw-everything function
+(kept below as legacy_invoice_pdf), plus a 100-row table that spans pages.
+
+    python -m benchmarks.bench_invoice_render [--renders 500]
+"""
+import argparse
+import io
+import tracemalloc
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from benchmarks._bootstrap import report, setup, timed
+
+
+def legacy_invoice_pdf(invoice):
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    # ---------- Header ----------
+    p.setFont("Helvetica-Bold", 24)
+    p.drawString(50, height - 50, invoice.package.user.company_name or invoice.package.user.username)
+
+    p.setFont("Helvetica", 12)
+    p.drawString(50, height - 80, f"Owner: {invoice.package.user.username}")
+    p.drawString(50, height - 100, f"Email: {invoice.package.user.email}")
+    p.drawString(50, height - 120, f"Phone: {invoice.package.user.phone_no or 'N/A'}")
+
+    # ---------- Invoice Title ----------
+    p.setFont("Helvetica-Bold", 22)
+    p.drawString(400, height - 50, "INVOICE")
+
+    # ---------- Invoice Info ----------
+    p.setFont("Helvetica", 12)
+    p.drawString(400, height - 80, f"Invoice #: {invoice.invoice_number}")
+    p.drawString(400, height - 100, f"Issue Date: {invoice.issue_at.strftime('%Y-%m-%d')}")
+    p.drawString(400, height - 120, f"Status: {'Paid' if invoice.paid else 'Unpaid'}")
+
+    # ---------- Receiver Info ----------
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(50, height - 170, "Bill To:")
+    p.setFont("Helvetica", 12)
+    p.drawString(50, height - 190, f"Name: {invoice.transporter.username}")
+    p.drawString(50, height - 210, f"Email: {invoice.transporter.email}")
+    p.drawString(50, height - 230, f"Phone: {invoice.transporter.phone_no or 'N/A'}")
+
+    # ---------- Package Details Table ----------
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(50, height - 270, "Package Details:")
+
+    # Table headers
+    y = height - 290
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(50, y, "Title")
+    p.drawString(200, y, "Pickup")
+    p.drawString(350, y, "Drop")
+    p.drawString(450, y, "Weight")
+    p.drawString(520, y, "Price")
+
+    # Table content
+    y -= 20
+    p.setFont("Helvetica", 12)
+    p.drawString(50, y, invoice.package.title or "Untitled")
+    p.drawString(200, y, invoice.package.pickup_location or "N/A")
+    p.drawString(350, y, invoice.package.drop_location or "N/A")
+    p.drawString(450, y, f"{invoice.package.weight} kg" if invoice.package.weight else "N/A")
+    p.drawString(520, y, f"₹{invoice.amount}")
+
+    # ---------- Footer ----------
+    p.setFont("Helvetica-Oblique", 10)
+    p.setFillColor(colors.grey)
+    p.drawString(50, 50, "Thank you for using TMSapp. We appreciate your business!")
+
+    p.showPage()
+    p.save()
+    buffer.seek(0)
+    return buffer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--renders", type=int, default=500)
+    args = parser.parse_args()
+
+    setup()
+    from TMSapp.invoice_render import render_invoice
+    from TMSapp.models import Invoice, Package, User
+
+    owner = User.objects.create_user("bench-owner", email="o@example.com", password="x", is_owner=True)
+    driver = User.objects.create_user("bench-driver", email="d@example.com", password="x", is_transporter=True)
+    package = Package.objects.create(
+        user=owner, booked_by=driver, title="Load", description="bench",
+        pickup_location="Pune", drop_location="Mumbai", weight=1000,
+        price_expectation=1000, status="Delivered",
+    )
+    Invoice.objects.create(package=package, transporter=driver, amount=900)
+    invoice = Invoice.objects.select_related("package__user", "transporter").get()
+    long_table = [("Load", "Pune", "Mumbai", "1000 kg", "₹900.00")] * 100
+
+    def measure(fn):
+        seconds, pdf = timed(lambda: [fn() for _ in range(args.renders)], repeat=3)
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        size = len(pdf[-1].getvalue())
+        return f"{args.renders / seconds:7.0f} renders/s, peak {peak / 1024:6.0f} KiB, {size / 1024:5.1f} KiB PDF"
+
+    render_invoice(invoice)   # compile the static layer outside the timings
+    rows = [
+        ("legacy_invoice_pdf", measure(lambda: legacy_invoice_pdf(invoice))),
+        ("render_invoice", measure(lambda: render_invoice(invoice))),
+        ("render_invoice, 100 rows", measure(lambda: render_invoice(invoice, rows=long_table))),
+    ]
+    report(f"{args.renders} renders of one invoice", rows)
+
+
+if __name__ == "__main__":
+    main()
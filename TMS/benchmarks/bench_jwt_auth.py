@@ -0,0 +1,70 @@
+"""
+Requests per second on GET /api/packages/ with a real bearer token,
+authenticated by simplejwt's JWTAuthentication (one user SELECT per
+request) and by CachedJWTAuthentication.
+
+    python -m benchmarks.bench_jwt_auth [--requests 2000] [--packages 1,20]
+"""
+import argparse
+import time
+
+from benchmarks._bootstrap import report, setup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--packages", default="1,20", help="sizes of the owner's package list")
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from TMSapp.authentication import CachedJWTAuthentication, user_cache
+    from TMSapp.models import Package, User
+    from TMSapp.serializers import MyTokenObtainPairSerializer
+    from TMSapp.views import Packageviewset
+
+    # Keep one connection across requests, as a pooled deployment would;
+    # otherwise reconnecting after every request dominates the timing
+    connection.settings_dict["CONN_MAX_AGE"] = None
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    rows = []
+    for size in [int(n) for n in args.packages.split(",")]:
+        owner = User.objects.create_user(f"bench-owner-{size}", password="x", is_owner=True)
+        Package.objects.bulk_create([
+            Package(
+                user=owner, title=f"Load {i}", description="bench", pickup_location="Pune",
+                drop_location="Mumbai", weight=1000, price_expectation=1000,
+            )
+            for i in range(size)
+        ])
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {MyTokenObtainPairSerializer.get_token(owner).access_token}")
+
+        for name, auth in (("JWTAuthentication", JWTAuthentication), ("CachedJWTAuthentication", CachedJWTAuthentication)):
+            Packageviewset.authentication_classes = [auth]
+            user_cache().clear()
+            assert client.get("/api/packages/").status_code == 200
+            queries.clear()
+            with connection.execute_wrapper(count):
+                start = time.perf_counter()
+                for _ in range(args.requests):
+                    client.get("/api/packages/")
+                elapsed = time.perf_counter() - start
+            rows.append((f"{size:3d} packages, {name}", (
+                f"{args.requests / elapsed:7.0f} req/s   {elapsed / args.requests * 1e6:6.0f} us/request   "
+                f"{len(queries) / args.requests:.0f} queries/request"
+            )))
+
+    report(f"GET /api/packages/, {args.requests} requests each", rows)
+
+
+if __name__ == "__main__":
+    main()
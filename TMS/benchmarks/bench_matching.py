@@ -0,0 +1,97 @@
+"""
+Load matching: time to rank the open packages for a whole fleet with the
+pruned ranking in matching.py, against scoring every vehicle x package pair
+densely, plus the cost of building the open-package book and of an
+incremental refresh after a batch of package changes.
+
+    python -m benchmarks.bench_matching [--vehicles 1000] [--packages 100000] [--k 5]
+"""
+import argparse
+import random
+
+from benchmarks._bootstrap import report, setup, timed
+
+
+def dense(capacities, weight, base, fit_weight, k):
+    """Every vehicle against every package, in blocks that fit in memory"""
+    import numpy as np
+    out = []
+    for start in range(0, len(capacities), 32):
+        caps = capacities[start:start + 32, None]
+        scores = np.where(weight <= caps, base + fit_weight * weight / caps, -np.inf)
+        out.append(np.argpartition(-scores, k - 1, axis=1)[:, :k])
+    return np.concatenate(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--packages", type=int, default=100_000)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    import numpy as np
+    from django.core.cache import cache
+    from TMSapp import matching
+    from TMSapp.models import Package, User
+
+    rng = random.Random(11)
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    for start in range(0, args.packages, 10_000):
+        rows = []
+        for i in range(start, min(start + 10_000, args.packages)):
+            weight = rng.uniform(50, 20_000)
+            rows.append(Package(
+                user=owner, title=f"Load {i}", description="bench", pickup_location="-", drop_location="-",
+                weight=weight, price_expectation=round(weight * rng.uniform(1, 12), 2),
+                pickup_latitude=rng.uniform(8, 30), pickup_longitude=rng.uniform(70, 88),
+                drop_latitude=rng.uniform(8, 30), drop_longitude=rng.uniform(70, 88),
+            ))
+        Package.objects.bulk_create(rows)
+
+    build_time, book = timed(matching.build, repeat=1)
+    ids = list(Package.objects.values_list("id", flat=True)[:100])
+
+    def refresh():
+        Package.objects.filter(id__in=ids[:50]).update(status="Booked")
+        matching._journal(ids)
+        assert matching.sync(book)
+        Package.objects.filter(id__in=ids[:50]).update(status="Available")
+        matching._journal(ids)
+        assert matching.sync(book)
+
+    sync_time, _ = timed(refresh)
+    sync_time /= 2
+    cache.clear()
+
+    # A typical fleet: a dozen truck classes; and the worst case, every truck different
+    classes = [1, 2.5, 4, 6, 7.5, 9, 10, 12, 16, 19, 25, 31]
+    fleets = {
+        "12 truck classes": [(i, classes[i % len(classes)] * 1000) for i in range(args.vehicles)],
+        "all capacities distinct": [(i, rng.uniform(1, 31) * 1000) for i in range(args.vehicles)],
+    }
+    origin, destination = (18.52, 73.86), (19.08, 72.88)
+
+    rows = [
+        ("book build (full)", f"{build_time * 1000:8.1f} ms   {len(book)} open packages"),
+        ("incremental sync, 100 ids", f"{sync_time * 1000:8.1f} ms"),
+    ]
+    _, weight, coords, price = book.columns()
+    for name, fleet in fleets.items():
+        pruned, _ = timed(lambda: matching.rank(fleet, origin=origin, destination=destination, k=args.k, book=book))
+        rows.append((f"rank, {name}", f"{pruned * 1000:8.1f} ms"))
+
+    # The dense baseline gets the same package-only scores for free
+    cfg = matching.config()
+    per_kg = price / weight
+    base = cfg["weights"]["price"] * per_kg / (per_kg + cfg["price_reference"])
+    capacities = np.array([capacity for _, capacity in fleets["all capacities distinct"]])
+    full, _ = timed(lambda: dense(capacities, weight, base, cfg["weights"]["fit"], args.k), repeat=1)
+    rows.append(("dense scoring, all distinct", f"{full * 1000:8.1f} ms"))
+
+    report(f"{args.vehicles} vehicles x {args.packages} open packages, top {args.k}", rows)
+
+
+if __name__ == "__main__":
+    main()
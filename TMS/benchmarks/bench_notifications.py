@@ -0,0 +1,99 @@
+"""
+Polling against push: server time a client costs by polling /api/offers/,
+/api/packages/current_deliveries/ and /api/packages/loaded/ every few
+seconds, against the cost of recording and publishing the events that
+replace it, and how many frames the notification window saves for a
+burst of counter-offers.
+
+    python -m benchmarks.bench_notifications [--packages 200] [--poll 5] [--burst 20]
+"""
+import argparse
+import json
+import time
+
+from benchmarks._bootstrap import report, setup, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=200)
+    parser.add_argument("--poll", type=float, default=5.0, help="client poll interval in seconds")
+    parser.add_argument("--burst", type=int, default=20, help="counter-offers on one offer in a burst")
+    args = parser.parse_args()
+
+    setup()
+    from asgiref.sync import async_to_sync, sync_to_async
+    from asgiref.testing import ApplicationCommunicator
+    from channels.routing import URLRouter
+    from rest_framework.test import APIClient
+    from TMSapp.models import Notification, Package, User
+    from TMSapp.routing import websocket_urlpatterns
+
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    carrier = User.objects.create_user("bench-carrier", password="x", is_transporter=True)
+    Package.objects.bulk_create([
+        Package(
+            user=owner, booked_by=carrier, title=f"Load {i}", description="bench", pickup_location="Pune",
+            drop_location="Mumbai", weight=1000, price_expectation=1000, status=("Booked", "Loaded")[i % 2],
+        )
+        for i in range(args.packages)
+    ])
+    open_package = Package.objects.create(
+        user=owner, title="Open", description="bench", pickup_location="Pune",
+        drop_location="Mumbai", weight=1000, price_expectation=1000,
+    )
+    client = APIClient()
+    client.force_authenticate(carrier)
+
+    def poll_cycle():
+        for url in ("/api/offers/", "/api/packages/current_deliveries/", "/api/packages/loaded/"):
+            assert client.get(url).status_code == 200
+
+    poll, _ = timed(poll_cycle)
+
+    offer_id = client.post("/api/offers/", {"package_id": open_package.id, "offer_price": 900}, format="json").data["id"]
+    owner_client = APIClient()
+    owner_client.force_authenticate(owner)
+    prices = iter(range(10**6, 0, -1))
+
+    def counter():
+        response = owner_client.post(f"/api/offers/{offer_id}/counter/", {"offer_price": next(prices)}, format="json")
+        assert response.status_code == 200
+
+    push, _ = timed(lambda: [counter() for _ in range(50)])
+    push /= 50
+
+    async def burst():
+        scope = {
+            "type": "websocket", "path": "/ws/notifications/", "query_string": b"",
+            "headers": [], "subprotocols": [], "user": carrier,
+        }
+        socket = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+        await socket.send_input({"type": "websocket.connect"})
+        await socket.receive_output(2)
+        await socket.receive_output(2)    # initial cursor frame
+        for _ in range(args.burst):
+            await sync_to_async(counter)()
+        frames, events = 0, 0
+        while not await socket.receive_nothing(0.5):
+            message = await socket.receive_output(1)
+            frames += 1
+            events += len(json.loads(message["text"])["events"])
+        await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+        return frames, events
+
+    start = time.perf_counter()
+    frames, events = async_to_sync(burst)()
+    burst_time = time.perf_counter() - start
+
+    assert Notification.objects.filter(user=carrier).exists()
+    cores = args.poll / poll
+    report(f"{args.packages} booked/loaded packages, one client polling every {args.poll:g}s", [
+        ("poll cycle (3 endpoints)", f"{poll * 1000:7.2f} ms   -> one core serves ~{cores:.0f} polling clients"),
+        ("counter-offer incl. notify", f"{push * 1000:7.2f} ms   (paid once per change, not per client per interval)"),
+        (f"burst of {args.burst} counters", f"{frames} frame(s), {events} event(s) delivered in {burst_time:.2f}s"),
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+"N offers, best price" for a page of packages: aggregating the offers
+table on every request against reading the denormalized summary columns,
+plus what keeping those columns up to date adds to an offer write.
+
+    python -m benchmarks.bench_offer_summary [--packages 5000] [--offers 20] [--page 50]
+"""
+import argparse
+import random
+from decimal import Decimal
+
+from benchmarks._bootstrap import report, setup, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=5000)
+    parser.add_argument("--offers", type=int, default=20, help="offers per package")
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+    from django.db import transaction
+    from django.db.models import Count, Min, Q
+    from TMSapp import dashboard, negotiation
+    from TMSapp.models import Offer, OfferRevision, Package, User
+
+    rng = random.Random(7)
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    carriers = [
+        User.objects.create_user(f"bench-carrier-{i}", password="x", is_transporter=True) for i in range(20)
+    ]
+    packages = Package.objects.bulk_create([
+        Package(
+            user=owner, title=f"Load {i}", description="bench", pickup_location="Pune",
+            drop_location="Mumbai", weight=1000, price_expectation=1000, status="Negotiating",
+        )
+        for i in range(args.packages)
+    ])
+    Offer.objects.bulk_create([
+        Offer(
+            package=package, sender=rng.choice(carriers), receiver=owner,
+            offer_price=Decimal(rng.randint(600, 1200)), status=rng.choice(("pending", "pending", "rejected")),
+        )
+        for package in packages
+        for _ in range(args.offers)
+    ], batch_size=5000)
+    negotiation.refresh_summary()
+
+    def aggregated():
+        qs = Package.objects.filter(user=owner).order_by("-id").annotate(
+            n=Count("offers"),
+            best=Min("offers__offer_price", filter=Q(offers__status__in=negotiation.LIVE)),
+        )
+        return [(p.id, p.n, p.best) for p in qs[:args.page]]
+
+    def denormalized():
+        qs = Package.objects.filter(user=owner).order_by("-id")
+        return [(p.id, p.offer_count, p.best_offer_price) for p in qs[:args.page]]
+
+    slow, expected = timed(aggregated)
+    fast, got = timed(denormalized)
+    assert got == expected, "summary columns disagree with the offers table"
+
+    dash_join, _ = timed(lambda: Package.objects.filter(user=owner).aggregate(
+        total=Count("id", distinct=True), offers=Count("offers", distinct=True),
+    ))
+    dash_columns, _ = timed(lambda: dashboard.compute_snapshot(owner))
+
+    sample = list(Offer.objects.filter(status="pending").values_list("id", "sender_id")[:200])
+    users = User.objects.in_bulk([sender for _, sender in sample])
+
+    def counters(log):
+        # One transaction per counter-offer, as booking.counter_offer does
+        for offer_id, sender in sample:
+            with transaction.atomic():
+                Offer.objects.filter(id=offer_id).update(offer_price=Decimal(rng.randint(600, 1200)))
+                if log:
+                    negotiation.log([offer_id], OfferRevision.COUNTERED, "pending", users[sender])
+                    negotiation.offers_changed(offer_ids=[offer_id])
+
+    bare, _ = timed(lambda: counters(False), repeat=3)
+    logged, _ = timed(lambda: counters(True), repeat=3)
+
+    report(f"{args.packages} packages x {args.offers} offers", [
+        (f"page of {args.page}, aggregate offers", f"{slow * 1000:8.2f} ms"),
+        (f"page of {args.page}, summary columns", f"{fast * 1000:8.2f} ms   ({slow / fast:.0f}x)"),
+        ("dashboard, offers joined", f"{dash_join * 1000:8.2f} ms"),
+        ("dashboard, summed offer_count", f"{dash_columns * 1000:8.2f} ms"),
+        ("counter-offer UPDATE only", f"{bare / len(sample) * 1e6:8.1f} us"),
+        ("+ revision and summary", f"{logged / len(sample) * 1e6:8.1f} us"),
+    ])
+
+
+if __name__ == "__main__":
+    main()
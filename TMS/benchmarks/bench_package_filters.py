@@ -0,0 +1,116 @@
+"""
+Package list filters: latency of the /packages/ list filters (FilterMixin)
+and of the current_deliveries / loaded lookups, with the indexes of
+migration 0027 against the indexes that existed before it (status/created
+and the plain foreign-key indexes), both with fresh ANALYZE statistics.
+
+    python -m benchmarks.bench_package_filters [--packages 500000]
+"""
+import argparse
+import csv
+import random
+import statistics
+import time
+
+from benchmarks._bootstrap import BASE_DIR, report, setup
+
+NEW_INDEXES = [
+    "package_user_status_idx", "package_booked_status_idx", "package_status_weight_idx",
+    "package_status_price_idx", "package_created_idx",
+]
+
+
+def median_ms(fn, repeat=7):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=500_000)
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection, transaction
+    from django.db.models import Q
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from TMSapp.models import Package, User
+    from TMSapp.views import Packageviewset
+
+    with open(BASE_DIR / "TMSapp" / "data" / "gazetteer.csv") as f:
+        cities = [row["name"].title() for row in csv.DictReader(f)]
+    rng = random.Random(5)
+    owners = User.objects.bulk_create([User(username=f"owner{i}", is_owner=True) for i in range(2000)])
+    transporters = User.objects.bulk_create([User(username=f"transporter{i}", is_transporter=True) for i in range(500)])
+    statuses = ["Available"] * 3 + ["Negotiating", "Booked", "Loaded"] + ["Delivered"] * 4
+    for start in range(0, args.packages, 20_000):
+        rows = []
+        for _ in range(start, min(start + 20_000, args.packages)):
+            status = rng.choice(statuses)
+            weight = rng.uniform(50, 20_000)
+            rows.append(Package(
+                user=rng.choice(owners), title="Load", description="-",
+                booked_by=rng.choice(transporters) if status in ("Booked", "Loaded", "Delivered") else None,
+                pickup_location=rng.choice(cities), drop_location=rng.choice(cities), status=status,
+                weight=round(weight, 1), price_expectation=round(weight * rng.uniform(1, 12), 2),
+            ))
+        with transaction.atomic():
+            Package.objects.bulk_create(rows, batch_size=2000)
+    with connection.cursor() as cursor:
+        # Spread listings over two years
+        cursor.execute("UPDATE \"TMSapp_package\" SET create_at = date('2025-01-01', '+' || (id % 730) || ' days')")
+    from TMSapp import search
+    search.rebuild()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE "TMSapp_package"')
+
+    owner, transporter = owners[7], transporters[3]
+    cases = [
+        ("owner, ?status=Booked", owner, {"status": "Booked"}),
+        ("owner, ?max_weight=1000&ordering=-price", owner, {"max_weight": 1000, "ordering": "-price"}),
+        ("transporter, ?min_weight=19000", transporter, {"min_weight": 19000}),
+        ("transporter, ?max_price=500", transporter, {"max_price": 500}),
+        ("transporter, ?created_after=last week", transporter, {"created_after": "2026-12-24"}),
+        ("transporter, ?route=pune mumbai", transporter, {"route": "pune mumbai"}),
+    ]
+
+    def listing(user, params):
+        request = Request(APIRequestFactory().get("/api/packages/", params))
+        request.user = user
+        view = Packageviewset(request=request, action="list", format_kwarg=None, kwargs={})
+        qs = view.filter_queryset(view.get_queryset())
+        return lambda: list(qs.values_list("id", flat=True))
+
+    lookups = [
+        ("current_deliveries", lambda: list(Package.objects.filter(
+            booked_by=transporter, status="Booked").order_by("-create_at").values_list("id", flat=True))),
+        ("loaded", lambda: list(Package.objects.filter(
+            Q(user=owner, status="Loaded") | Q(booked_by=transporter, status="Loaded")
+        ).order_by("-create_at").values_list("id", flat=True))),
+    ]
+
+    def measure():
+        timings = {name: median_ms(listing(user, params)) for name, user, params in cases}
+        timings.update({name: median_ms(fn) for name, fn in lookups})
+        return timings
+
+    after = measure()
+    with connection.cursor() as cursor:
+        for name in NEW_INDEXES:
+            cursor.execute(f"DROP INDEX {name}")
+        cursor.execute('CREATE INDEX bench_user_idx ON "TMSapp_package" (user_id)')
+        cursor.execute('CREATE INDEX bench_booked_by_idx ON "TMSapp_package" (booked_by_id)')
+        cursor.execute('ANALYZE "TMSapp_package"')
+    before = measure()
+
+    rows = [(name, f"{after[name]:8.2f} ms   (before 0027: {before[name]:8.2f} ms)") for name in after]
+    report(f"Package list filters over {args.packages} packages (median)", rows)
+
+
+if __name__ == "__main__":
+    main()
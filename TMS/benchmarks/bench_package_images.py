@@ -0,0 +1,98 @@
+"""
+Package photos: bytes a list page makes the client download with the raw
+upload against the 160 px WebP thumbnail, the time the photo pipeline
+spends per upload (off the request thread), and image URLs built per row
+with build_absolute_uri() against the precomputed variant map.
+
+    python -m benchmarks.bench_package_images [--rows 50] [--width 4000] [--height 3000]
+"""
+import argparse
+import io
+import random
+import tempfile
+
+from benchmarks._bootstrap import report, setup, timed
+
+
+def photo(width, height):
+    """A camera-sized JPEG with enough detail that it does not compress to nothing"""
+    from PIL import Image
+    rng = random.Random(3)
+    small = Image.frombytes("RGB", (width // 8, height // 8), bytes(rng.getrandbits(8) for _ in range(width * height * 3 // 64)))
+    out = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    small.resize((width, height)).save(out, "JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.core.files.base import ContentFile
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from TMSapp import thumbnails
+    from TMSapp.models import Package, User
+    from TMSapp.serializers import PublicPackageSerializer
+
+    settings.MEDIA_ROOT = tempfile.mkdtemp(prefix="tms-bench-media-")
+    cfg = thumbnails.config()
+    raw = photo(args.width, args.height)
+    render_time, (_, _, outputs) = timed(
+        lambda: thumbnails.render(raw, cfg["sizes"], cfg["max_side"], cfg["quality"]), repeat=3,
+    )
+
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    packages = Package.objects.bulk_create([
+        Package(
+            user=owner, title=f"Load {i}", description="bench", pickup_location="Pune",
+            drop_location="Mumbai", weight=1000, price_expectation=1000,
+        )
+        for i in range(args.rows)
+    ])
+    first = packages[0]
+    first.images.save("photo.jpg", ContentFile(raw), save=False)
+    Package.objects.filter(id=first.id).update(images=first.images.name)
+    variants = thumbnails.process(first.id)
+    # Every row shows the same processed photo
+    Package.objects.update(images=variants["source"], image_variants=variants)
+
+    request = Request(APIRequestFactory().get("/api/marketplace/"))
+    rows = list(Package.objects.order_by("id"))
+
+    def per_row():
+        # What the serializers did before: the ImageField and to_representation
+        # each asked storage for the URL and built an absolute one
+        return [
+            (request.build_absolute_uri(row.images.url), request.build_absolute_uri(row.images.url))
+            for row in rows
+        ]
+
+    def precomputed():
+        context = {"request": request}
+        return [thumbnails.represent(row, context) for row in rows]
+
+    old, _ = timed(per_row)
+    new, _ = timed(precomputed)
+    serialize, _ = timed(lambda: PublicPackageSerializer(rows, many=True, context={"request": request}).data)
+
+    report(f"{args.width}x{args.height} photo, list of {args.rows} rows", [
+        ("raw upload per row", f"{len(raw) / 1024:8.1f} KiB   -> {len(raw) * args.rows / 2**20:6.1f} MiB per page"),
+        ("160 px WebP per row", f"{len(outputs['160']) / 1024:8.1f} KiB   -> {len(outputs['160']) * args.rows / 2**20:6.2f} MiB per page"),
+        ("normalized full WebP", f"{len(outputs['full']) / 1024:8.1f} KiB"),
+        ("pipeline per upload", f"{render_time * 1000:8.1f} ms (worker thread, not the request)"),
+        ("image URLs, per-row build", f"{old * 1000:8.2f} ms"),
+        ("image URLs + srcset, map", f"{new * 1000:8.2f} ms"),
+        ("whole list serialization", f"{serialize * 1000:8.2f} ms"),
+    ])
+
+
+if __name__ == "__main__":
+    main()
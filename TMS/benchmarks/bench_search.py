@@ -0,0 +1,99 @@
+"""
+Package search: latency of search.search() through the inverted index
+(FTS5 on SQLite, tsvector + GIN with BENCH_DATABASE_URL on PostgreSQL)
+against an icontains scan for the same words, on a synthetic marketplace.
+
+    python -m benchmarks.bench_search [--packages 1000000]
+"""
+import argparse
+import csv
+import random
+import statistics
+import time
+
+from benchmarks._bootstrap import BASE_DIR, report, setup
+
+MATERIALS = ["steel", "cotton", "rice", "cement", "timber", "glass", "copper", "sugar", "paper", "plastic",
+             "granite", "wheat", "tea", "coffee", "rubber", "chemicals", "furniture", "electronics", "textiles", "tiles"]
+FORMS = ["coils", "bales", "bags", "sheets", "pipes", "drums", "crates", "rolls", "pallets", "cartons"]
+WORDS = ["fragile", "urgent", "covered", "stacked", "export", "insured", "dry", "heavy", "bulk", "loose",
+         "packed", "sealed", "moisture", "priority", "return", "refrigerated", "hazardous", "oversize", "tarpaulin", "ramp"]
+
+QUERIES = [
+    ("common word", "steel", {}),
+    ("two words", "copper pipes", {}),
+    ("prefix", "refrig", {}),
+    ("place + material", "pune cement", {}),
+    ("rare word", "granite tarpaulin hazardous", {}),
+    ("word + weight filter", "cotton", {"weight__lte": 500}),
+]
+
+
+def median_ms(fn, repeat=7):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=1_000_000)
+    parser.add_argument("--window", type=int, default=None, help="override PACKAGE_SEARCH['rank_window']")
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.db import connection, transaction
+    from django.db.models import Q
+    from TMSapp import search
+    from TMSapp.models import Package, User
+
+    with open(BASE_DIR / "TMSapp" / "data" / "gazetteer.csv") as f:
+        cities = [row["name"].title() for row in csv.DictReader(f)]
+    rng = random.Random(9)
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    statuses = ["Available"] * 6 + ["Negotiating", "Booked", "Loaded", "Delivered"]
+    for start in range(0, args.packages, 20_000):
+        with transaction.atomic():
+            Package.objects.bulk_create([
+                Package(
+                    user=owner, title=f"{rng.choice(MATERIALS).title()} {rng.choice(FORMS)}",
+                    description=" ".join(rng.choices(WORDS + MATERIALS, k=rng.randint(4, 12))),
+                    pickup_location=rng.choice(cities), drop_location=rng.choice(cities),
+                    weight=round(rng.uniform(50, 20_000), 1), price_expectation=1000, status=rng.choice(statuses),
+                )
+                for _ in range(start, min(start + 20_000, args.packages))
+            ], batch_size=2000)
+
+    start = time.perf_counter()
+    with transaction.atomic():
+        indexed = search.rebuild()
+    build = time.perf_counter() - start
+
+    if args.window:
+        settings.PACKAGE_SEARCH = {"rank_window": args.window}
+    marketplace = Package.objects.filter(status="Available")
+    rows = [("index build", f"{build:8.1f} s    {indexed} packages ({connection.vendor})")]
+    for name, query, filters in QUERIES:
+        visible = marketplace.filter(**filters)
+        hits = search.search(visible, query, limit=20)
+        indexed_ms = median_ms(lambda: search.search(visible, query, limit=20))
+
+        words = Q()
+        for word in search.terms(query):
+            words &= Q(title__icontains=word) | Q(description__icontains=word) | Q(
+                pickup_location__icontains=word) | Q(drop_location__icontains=word)
+        scan = visible.filter(words).order_by("-id").values_list("id", flat=True)[:20]
+        scan_ms = median_ms(lambda: list(scan.all()), repeat=3)
+        rows.append((f"{name} '{query}'", (
+            f"{indexed_ms:8.2f} ms index ({len(hits)} hits shown)   {scan_ms:8.1f} ms icontains scan"
+        )))
+
+    report(f"Marketplace search over {args.packages} packages, top 20", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Replay synthetic GPS traces through the tracking ingest pipeline.
+
+Compares the batched pipeline (bulk history insert + one latest-position
+upsert per batch), the same pipeline behind POST /api/tracking/ingest/, and
+the naive per-fix path (one INSERT plus one update_or_create per point).
+
+    python -m benchmarks.bench_tracking_ingest [--packages 200] [--seconds 300] [--batch 500]
+"""
+import argparse
+import datetime
+import random
+import time
+
+from benchmarks._bootstrap import report, setup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=200)
+    parser.add_argument("--seconds", type=int, default=300, help="trip time replayed, one fix/s per truck")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--naive-points", type=int, default=5000)
+    args = parser.parse_args()
+
+    setup()
+    from django.db import transaction
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from TMSapp.models import Package, Tracking, TrackingPoint, User
+    from TMSapp.tracking import parse_points, store_points, broadcast
+
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    driver = User.objects.create_user("bench-driver", password="x", is_transporter=True)
+    packages = Package.objects.bulk_create([
+        Package(
+            user=owner, booked_by=driver, title=f"Load {i}", description="bench",
+            pickup_location="bench", drop_location="bench", weight=1000,
+            price_expectation=1000, status="Loaded",
+        )
+        for i in range(args.packages)
+    ])
+
+    rng = random.Random(7)
+    start = timezone.now() - datetime.timedelta(seconds=args.seconds)
+    position = {p.id: [rng.uniform(10, 30), rng.uniform(72, 88)] for p in packages}
+    fixes = []
+    for second in range(args.seconds):
+        stamp = (start + datetime.timedelta(seconds=second)).isoformat()
+        for package_id, pos in position.items():
+            pos[0] += rng.uniform(-1e-4, 3e-4)
+            pos[1] += rng.uniform(-1e-4, 3e-4)
+            fixes.append({"package": package_id, "latitude": pos[0], "longitude": pos[1], "recorded_at": stamp})
+    batches = [fixes[i:i + args.batch] for i in range(0, len(fixes), args.batch)]
+
+    def reset():
+        TrackingPoint.objects.all().delete()
+        Tracking.objects.all().delete()
+
+    def pipeline():
+        for batch in batches:
+            broadcast(store_points(parse_points(batch)))
+
+    client = APIClient()
+    client.force_authenticate(driver)
+
+    def http():
+        for batch in batches:
+            response = client.post("/api/tracking/ingest/", {"points": batch}, format="json")
+            assert response.status_code == 201, response.content
+
+    def naive():
+        for fix in fixes[:args.naive_points]:
+            with transaction.atomic():
+                point = parse_points([fix])[0]
+                point.save()
+                Tracking.objects.update_or_create(
+                    package_id=point.package_id,
+                    defaults={"latitude": round(point.latitude, 6), "longitude": round(point.longitude, 6),
+                              "recorded_at": point.recorded_at},
+                )
+
+    rows = []
+    for name, fn, count in [
+        ("batched pipeline", pipeline, len(fixes)),
+        ("HTTP ingest endpoint", http, len(fixes)),
+        ("naive per-point save", naive, min(len(fixes), args.naive_points)),
+    ]:
+        reset()
+        began = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - began
+        assert TrackingPoint.objects.count() == count
+        rows.append((name, f"{count / elapsed:10.0f} points/s  ({elapsed:.2f} s for {count})"))
+
+    report(f"{args.packages} trucks x {args.seconds} s of fixes, batches of {args.batch}", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Storage, memory and wire size of a 48-hour trip: raw TrackingPoint rows
+versus compacted TrackSegment rows and the downsampled path endpoint.
+
+    python -m benchmarks.bench_trajectory [--hours 48] [--interval 2]
+"""
+import argparse
+import datetime
+import json
+import math
+import random
+import tracemalloc
+
+from benchmarks._bootstrap import report, setup, timed
+
+
+def synthetic_trip(hours, interval, rng):
+    """Highway driving with gentle curves, junction turns, stops and ~3 m GPS noise"""
+    lat, lon = 19.0760, 72.8777
+    heading = rng.uniform(0, 2 * math.pi)
+    start = datetime.datetime(2026, 10, 1, 6, tzinfo=datetime.timezone.utc)
+    fixes = []
+    stopped = 0
+    for step in range(int(hours * 3600 / interval)):
+        if stopped:
+            stopped -= 1
+            speed = 0.0
+        else:
+            if rng.random() < 0.0005:
+                stopped = rng.randint(300, 3000)      # breaks and overnight halts
+            if rng.random() < 0.002:
+                heading += rng.choice([-1, 1]) * math.pi / 2
+            heading += rng.gauss(0, 0.003)
+            speed = 16.0                               # ~58 km/h
+        lat += speed * interval * math.cos(heading) / 111_320
+        lon += speed * interval * math.sin(heading) / (111_320 * math.cos(math.radians(lat)))
+        fixes.append((
+            lat + rng.gauss(0, 3 / 111_320),
+            lon + rng.gauss(0, 3 / 111_320),
+            start + datetime.timedelta(seconds=step * interval),
+        ))
+    return fixes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=48)
+    parser.add_argument("--interval", type=float, default=2, help="seconds between fixes")
+    args = parser.parse_args()
+
+    setup()
+    from rest_framework.test import APIClient
+    from TMSapp.models import Package, Tracking, TrackingPoint, TrackSegment, User
+    from TMSapp.trajectory import compact_package, load_track
+
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    driver = User.objects.create_user("bench-driver", password="x", is_transporter=True)
+    package = Package.objects.create(
+        user=owner, booked_by=driver, title="Long haul", description="bench",
+        pickup_location="Mumbai", drop_location="Delhi", weight=1000,
+        price_expectation=1000, status="Loaded",
+    )
+    fixes = synthetic_trip(args.hours, args.interval, random.Random(11))
+    TrackingPoint.objects.bulk_create(
+        [
+            TrackingPoint(package=package, latitude=la, longitude=lo, recorded_at=t, day=t.date())
+            for la, lo, t in fixes
+        ],
+        batch_size=2000,
+    )
+    tracking = Tracking.objects.create(package=package, latitude=0, longitude=0, recorded_at=fixes[-1][2])
+
+    # Raw: every row as model instances, and as the JSON a naive endpoint would ship
+    def load_raw():
+        return list(TrackingPoint.objects.filter(package=package).order_by("recorded_at"))
+
+    tracemalloc.start()
+    raw_rows = load_raw()
+    raw_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    raw_json = len(json.dumps(
+        [{"latitude": p.latitude, "longitude": p.longitude, "recorded_at": p.recorded_at.isoformat()}
+         for p in raw_rows]
+    ))
+    raw_bytes = len(fixes) * (8 + 8 + 8 + 4 + 8)   # payload columns, before row/index overhead
+    raw_load, _ = timed(load_raw, repeat=3)
+    del raw_rows
+
+    compact_time, (read, kept) = timed(
+        lambda: compact_package(package.id, fixes[-1][2] + datetime.timedelta(seconds=1)), repeat=1
+    )
+    segment_bytes = sum(len(bytes(d)) for d in TrackSegment.objects.values_list("data", flat=True))
+
+    tracemalloc.start()
+    track = load_track(package.id)
+    track_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    decode_time, _ = timed(lambda: load_track(package.id), repeat=3)
+
+    client = APIClient()
+    client.force_authenticate(owner)
+
+    def fetch(query):
+        response = client.get(f"/api/tracking/{tracking.id}/path/{query}")
+        assert response.status_code == 200, response.content
+        return response
+
+    rows = [
+        ("raw fixes", f"{read:,}"),
+        ("kept after compaction", f"{kept:,} ({kept / read:.1%})"),
+        ("raw column bytes", f"{raw_bytes / 1024:,.0f} KiB"),
+        ("segment bytes", f"{segment_bytes / 1024:,.1f} KiB ({raw_bytes / segment_bytes:.0f}x smaller)"),
+        ("raw rows in memory", f"{raw_memory / 1024 / 1024:,.1f} MiB, loaded in {raw_load * 1000:.0f} ms"),
+        ("decoded track in memory", f"{track_memory / 1024 / 1024:,.1f} MiB, decoded in {decode_time * 1000:.0f} ms"),
+        ("compaction", f"{compact_time * 1000:.0f} ms"),
+        ("raw JSON on the wire", f"{raw_json / 1024:,.0f} KiB"),
+    ]
+    for query in ["?max_points=1000", "?max_points=1000&encoding=polyline", "?zoom=8", "?zoom=14&max_points=5000"]:
+        latency, response = timed(lambda: fetch(query), repeat=3)
+        body = len(response.content)
+        rows.append((
+            f"path {query}",
+            f"{response.data['count']:>5} points, {body / 1024:6.1f} KiB "
+            f"({raw_json / body:.0f}x smaller), {latency * 1000:.0f} ms",
+        ))
+    assert len(track) == kept
+
+    report(f"{args.hours:g} h trip, one fix every {args.interval:g} s", rows)
+
+
+if __name__ == "__main__":
+    main()
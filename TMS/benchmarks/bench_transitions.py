@@ -0,0 +1,97 @@
+"""
+Cost of a status transition written three ways: the old fetch-then-save()
+of the whole row, fetch-then-save(update_fields=...), and the single
+conditional UPDATE that booking.py now issues.
+
+Reports time per transition and the SQL sent. With BENCH_DATABASE_URL
+pointing at PostgreSQL it also reports WAL bytes written per transition
+(pg_current_wal_lsn() before and after); on SQLite that column is blank.
+The packages and users it creates live in the scratch database that
+_bootstrap sets up, which is dropped when the run ends.
+
+    python -m benchmarks.bench_transitions [--packages 2000]
+"""
+import argparse
+import time
+
+from benchmarks._bootstrap import report, setup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from TMSapp.booking import move_package
+    from TMSapp.models import Package, User
+
+    owner = User.objects.create_user("bench-owner", password="x", is_owner=True)
+    driver = User.objects.create_user("bench-driver", password="x", is_transporter=True)
+    postgres = connection.vendor == "postgresql"
+
+    def wal_lsn():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_current_wal_lsn()")
+            return cursor.fetchone()[0]
+
+    def wal_since(lsn):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", [lsn])
+            return int(cursor.fetchone()[0])
+
+    def booked():
+        return [
+            p.id for p in Package.objects.bulk_create([
+                Package(
+                    user=owner, booked_by=driver, title=f"Load {i}", description="bench " * 40,
+                    pickup_location="Pune", drop_location="Mumbai", weight=1000,
+                    price_expectation=1000, status="Booked",
+                )
+                for i in range(args.packages)
+            ])
+        ]
+
+    def full_save(package_id):
+        package = Package.objects.get(id=package_id)
+        package.status = "Loaded"
+        package.save()
+
+    def update_fields(package_id):
+        package = Package.objects.get(id=package_id)
+        package.status = "Loaded"
+        package.save(update_fields=["status"])
+
+    def conditional(package_id):
+        assert move_package(package_id, "Loaded", where={"booked_by_id": driver.id})
+
+    rows = []
+    for name, fn in (("get + save()", full_save), ("get + save(update_fields)", update_fields),
+                     ("conditional UPDATE", conditional)):
+        ids = booked()
+        # SQL of one transition; the timed loop runs without the query log
+        with CaptureQueriesContext(connection) as ctx:
+            fn(ids[0])
+        queries = ctx.captured_queries
+        update = next(q["sql"] for q in queries if q["sql"].startswith("UPDATE"))
+        columns = update.split(" SET ", 1)[1].split(" WHERE ", 1)[0].count("=")
+
+        lsn = wal_lsn() if postgres else None
+        start = time.perf_counter()
+        for package_id in ids[1:]:
+            fn(package_id)
+        elapsed = time.perf_counter() - start
+        wal = f"{wal_since(lsn) / (len(ids) - 1):7.0f} WAL bytes" if postgres else ""
+        rows.append((name, (
+            f"{elapsed / (len(ids) - 1) * 1e6:7.1f} us   {len(queries)} queries   "
+            f"{sum(len(q['sql']) for q in queries):5d} SQL bytes   {columns:2d} columns written   {wal}"
+        )))
+        assert Package.objects.filter(id__in=ids, status="Loaded").count() == len(ids)
+
+    report(f"Booked -> Loaded for {args.packages} packages ({connection.vendor})", rows)
+
+
+if __name__ == "__main__":
+    main()
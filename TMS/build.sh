@@ -5,4 +5,16 @@ pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
 
-python manage.py migrate
\ No newline at end of file
+python manage.py migrate
+
+# Shared cache table (CACHES in TMS/settings.py); a no-op once it exists
+python manage.py createcachetable
+
+# Processes to run next to the web service, which build.sh does not start:
+# - invoice jobs (TMSapp/jobs.py); queued invoices are not rendered or
+#   emailed without it. On Render, a Background Worker with this start command:
+#       python manage.py runjobs --workers 2
+# - daily housekeeping, e.g. as Render Cron Jobs:
+#       python manage.py compact_tracks
+#       python manage.py prune_tracking --keep-days 90
+#       python manage.py prune_notifications
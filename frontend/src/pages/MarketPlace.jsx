@@ -8,24 +8,33 @@ export default function MarketPlace() {
   const [packages, setPackages] = useState([]);
   const [search, setSearch] = useState("");
   const [sortBy, setSortBy] = useState("latest");
-  const [currentPage, setCurrentPage] = useState(1);
-  const itemsPerPage = 6;
+  const [nextPage, setNextPage] = useState(null);
+  const [loading, setLoading] = useState(false);
+  const pageSize = 12;
   const navigate = useNavigate();
 
   useEffect(() => {
     fetchPackages();
   }, []);
 
-  const fetchPackages = async () => {
+  // The listing is paged by cursor, newest first: load the first page, then
+  // follow `next` only when the user asks for more
+  const fetchPackages = async (url = null) => {
+    setLoading(true);
     try {
-      const res = await API.get("/marketplace/");
-      setPackages(res.data);
+      const res = url
+        ? await API.get(url)
+        : await API.get("/marketplace/", { params: { page_size: pageSize } });
+      setPackages((loaded) => (url ? [...loaded, ...res.data.results] : res.data.results));
+      setNextPage(res.data.next);
     } catch (err) {
       console.error("Error fetching marketplace:", err);
+    } finally {
+      setLoading(false);
     }
   };
 
-  // Filter packages by search query (title, pickup, drop, exact price)
+  // Filter loaded packages by search query (title, pickup, drop, exact price)
   const filtered = packages.filter((pkg) => {
     const query = search.toLowerCase().trim();
     const priceMatch =
@@ -47,20 +56,9 @@ export default function MarketPlace() {
     return 0;
   });
 
-  // Pagination calculations
-  const indexOfLast = currentPage * itemsPerPage;
-  const indexOfFirst = indexOfLast - itemsPerPage;
-  const currentPackages = sorted.slice(indexOfFirst, indexOfLast);
-  const totalPages = Math.ceil(sorted.length / itemsPerPage);
-
   // Navigate to package detail page
   const handleCardClick = (id) => navigate(`/packages/${id}`);
 
-  // Change page with bounds check
-  const goToPage = (page) => {
-    if (page > 0 && page <= totalPages) setCurrentPage(page);
-  };
-
   return (
     <>
       <Nav />
@@ -76,10 +74,7 @@ export default function MarketPlace() {
               type="text"
               placeholder="Search by title, pickup, drop, or price..."
               value={search}
-              onChange={(e) => {
-                setSearch(e.target.value);
-                setCurrentPage(1); // reset page on search
-              }}
+              onChange={(e) => setSearch(e.target.value)}
               className="border border-gray-300 rounded-lg px-4 py-3 flex-1 shadow-sm focus:outline-none focus:ring-2 focus:ring-indigo-500 focus:border-indigo-500 transition"
               aria-label="Search packages"
               autoComplete="off"
@@ -99,8 +94,8 @@ export default function MarketPlace() {
 
         {/* Package Grid */}
         <section className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-8 flex-grow">
-          {currentPackages.length > 0 ? (
-            currentPackages.map((pkg) => (
+          {sorted.length > 0 ? (
+            sorted.map((pkg) => (
               <article
                 key={pkg.id}
                 onClick={() => handleCardClick(pkg.id)}
@@ -166,49 +161,17 @@ export default function MarketPlace() {
           )}
         </section>
 
-        {/* Pagination Controls */}
-        {totalPages > 1 && (
-          <nav
-            className="flex justify-center items-center mt-10 gap-2 select-none"
-            aria-label="Pagination"
-          >
+        {/* Load More */}
+        {nextPage && (
+          <div className="flex justify-center mt-10 select-none">
             <button
-              onClick={() => goToPage(currentPage - 1)}
-              disabled={currentPage === 1}
-              className="px-4 py-2 rounded-lg border bg-gray-50 hover:bg-gray-100 disabled:opacity-50 disabled:cursor-not-allowed transition"
-              aria-label="Previous page"
+              onClick={() => fetchPackages(nextPage)}
+              disabled={loading}
+              className="px-6 py-2 rounded-lg border bg-gray-50 hover:bg-gray-100 disabled:opacity-50 disabled:cursor-not-allowed transition"
             >
-              Prev
+              {loading ? "Loading..." : "Load more"}
             </button>
-
-            {[...Array(totalPages)].map((_, idx) => {
-              const page = idx + 1;
-              const isCurrent = currentPage === page;
-              return (
-                <button
-                  key={page}
-                  onClick={() => goToPage(page)}
-                  aria-current={isCurrent ? "page" : undefined}
-                  className={`px-4 py-2 rounded-lg border transition ${
-                    isCurrent
-                      ? "bg-indigo-600 text-white border-indigo-600"
-                      : "bg-gray-50 hover:bg-gray-100"
-                  }`}
-                >
-                  {page}
-                </button>
-              );
-            })}
-
-            <button
-              onClick={() => goToPage(currentPage + 1)}
-              disabled={currentPage === totalPages}
-              className="px-4 py-2 rounded-lg border bg-gray-50 hover:bg-gray-100 disabled:opacity-50 disabled:cursor-not-allowed transition"
-              aria-label="Next page"
-            >
-              Next
-            </button>
-          </nav>
+          </div>
         )}
       </main>
       <Footer />